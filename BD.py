@@ -1,53 +1,236 @@
-import psycopg2
+import asyncio
 import json
+import orjson
+import base64
+import csv
+import io
+import functools
 import jwt
 import os
 import bcrypt
-import re
+import threading
+import time
+import uuid
+import logging
+import contextvars
+from bisect import bisect_right
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime, timedelta , date, timezone
+import anyio
+import anyio.to_thread
+from pool import PoolConexiones, PoolAgotado
+from cache import CacheTTL
+from horarios import obtenerHorario, horarioEnCache
+from metricas import medirBD, CursorMedido, espera_conexion, tiempo_bcrypt, tiempo_jwt, lecturas_bd, transiciones_reservas, estadisticas_recalculadas
+from consultas import registrar, ConstructorConsulta
 
 
-SECRET_KEY = "super-secret-key"  # Usa una variable de entorno para mayor seguridad
+logger = logging.getLogger("integraservicios.bd")
+
+# Verdadero mientras se atiende a un cliente que acaba de escribir: sus lecturas
+# van al primario para que vea sus propios cambios aunque la réplica esté atrasada
+leer_del_primario = contextvars.ContextVar("leer_del_primario", default=False)
+
+
+SECRET_KEY = os.getenv("JWT_SECRET_KEY", "super-secret-key")  # Usa una variable de entorno para mayor seguridad
 ALGORITHM = "HS256"
 TOKEN_EXPIRATION_MINUTES = 60  # Expira en 1 hora
 
+
+def _leerClavesJWT():
+    """
+    Lee las claves de firma de JWT_CLAVES con el formato 'kid1:clave1,kid2:clave2'.
+    Para rotar se agrega la clave nueva, se cambia JWT_KID_ACTUAL y se retira la
+    anterior cuando hayan expirado los tokens firmados con ella.
+    """
+    claves = {"principal": SECRET_KEY}
+    for par in os.getenv("JWT_CLAVES", "").split(","):
+        if ":" in par:
+            kid, clave = par.split(":", 1)
+            claves[kid.strip()] = clave.strip()
+    return claves
+
+
+CLAVES_JWT = _leerClavesJWT()
+KID_ACTUAL = os.getenv("JWT_KID_ACTUAL", "principal")
+
+
 class TokenHandler:
+    # Tokens ya verificados: token -> (id_usuario, jti), vigentes hasta su expiración
+    cache_verificados = CacheTTL(maximo=int(os.getenv("JWT_CACHE_MAX", "10000")), ttl=TOKEN_EXPIRATION_MINUTES * 60)
+    # Tokens revocados: jti -> expiración (timestamp); se olvidan al expirar
+    revocados = {}
+    _lock = threading.Lock()
+
+    # Métricas de verificación
+    verificaciones = 0
+    rechazos = 0
+
     @staticmethod
     def generar_token(id_usuario):
         """
-        Genera un token JWT con el ID del usuario.
+        Genera un token JWT con el ID del usuario, firmado con la clave actual.
         """
         expira = datetime.now(timezone.utc) + timedelta(minutes=TOKEN_EXPIRATION_MINUTES)
-        payload = {"id_usuario": id_usuario, "exp": expira}
-        token = jwt.encode(payload, SECRET_KEY, algorithm=ALGORITHM)
+        payload = {"id_usuario": id_usuario, "exp": expira, "jti": uuid.uuid4().hex}
+        token = jwt.encode(payload, CLAVES_JWT[KID_ACTUAL], algorithm=ALGORITHM, headers={"kid": KID_ACTUAL})
         return token
 
+    @staticmethod
+    def _decodificar(token, verificar_exp=True):
+        """
+        Decodifica el token con la clave indicada por su `kid`.
+        Los tokens sin `kid` se emitieron antes de la rotación y usan SECRET_KEY.
+        """
+        kid = jwt.get_unverified_header(token).get("kid")
+        clave = CLAVES_JWT.get(kid) if kid else SECRET_KEY
+        if clave is None:
+            raise jwt.InvalidTokenError("Clave de firma desconocida.")
+        return jwt.decode(token, clave, algorithms=[ALGORITHM], options={"verify_exp": verificar_exp})
 
     @staticmethod
     def verificar_token(token):
         """
         Verifica si un token JWT es válido y devuelve el ID del usuario si es correcto.
+        Las verificaciones exitosas se guardan en caché hasta que el token expira.
         """
+        inicio = time.perf_counter()
+        id_usuario = None
         try:
-            payload = jwt.decode(token, SECRET_KEY, algorithms=[ALGORITHM])
+            verificado = TokenHandler.cache_verificados.obtener(token)
+            if verificado is None:
+                payload = TokenHandler._decodificar(token)
+                verificado = (payload.get("id_usuario"), payload.get("jti"))
+                restante = payload.get("exp", 0) - time.time()
+                if restante > 0:
+                    TokenHandler.cache_verificados.guardar(token, verificado, ttl=restante)
+            if verificado[1] not in TokenHandler.revocados:
+                id_usuario = verificado[0]  # Extraemos el ID del usuario del token
+        except jwt.InvalidTokenError:  # Incluye jwt.ExpiredSignatureError
+            pass
+        finally:
+            tiempo_jwt.observar(time.perf_counter() - inicio, "rechazado" if id_usuario is None else "valido")
+            with TokenHandler._lock:
+                TokenHandler.verificaciones += 1
+                TokenHandler.rechazos += id_usuario is None
+        return id_usuario
 
-            # Verificar si el token ha expirado manualmente
-            exp = payload.get("exp")
-            if exp and datetime.now(timezone.utc).timestamp() > exp:
-                print("Error: Token expirado")  # 🔍 Para depuración
-                return None
-            
-            return payload.get("id_usuario")  # Extraemos el ID del usuario del token
+    @staticmethod
+    def revocar_token(token):
+        """
+        Agrega el token a la lista de revocados hasta su expiración.
+        Retorna False si el token no es válido.
+        """
+        try:
+            payload = TokenHandler._decodificar(token, verificar_exp=False)
+        except jwt.InvalidTokenError:
+            return False
+        ahora = time.time()
+        with TokenHandler._lock:
+            # Los tokens expirados ya no pasan la verificación: no hace falta recordarlos
+            for jti, exp in list(TokenHandler.revocados.items()):
+                if exp <= ahora:
+                    del TokenHandler.revocados[jti]
+            if payload.get("jti") and payload.get("exp", 0) > ahora:
+                TokenHandler.revocados[payload.get("jti")] = payload["exp"]
+        TokenHandler.cache_verificados.invalidar(token)
+        return True
 
-        except jwt.ExpiredSignatureError:
-            print("Error: Token expirado (jwt.ExpiredSignatureError)")
-            return None
-        except jwt.InvalidTokenError as e:
-            print("Error: Token inválido", e)
-            return None
+    @staticmethod
+    def metricas():
+        """
+        Retorna los contadores de verificación de tokens.
+        """
+        with TokenHandler._lock:
+            return {
+                "verificaciones": TokenHandler.verificaciones,
+                "rechazos": TokenHandler.rechazos,
+                "revocados": len(TokenHandler.revocados),
+                "cache": TokenHandler.cache_verificados.metricas(),
+            }
+
+
+BCRYPT_ROUNDS = int(os.getenv("BCRYPT_ROUNDS", "12"))  # Costo de bcrypt; al cambiarlo los hashes se actualizan al iniciar sesión
+# Costo para importaciones masivas; si es menor, el hash se actualiza al costo normal en el primer login
+BCRYPT_ROUNDS_IMPORTACION = int(os.getenv("BCRYPT_ROUNDS_IMPORTACION", str(BCRYPT_ROUNDS)))
+
+
+class ServicioSaturado(Exception):
+    """
+    Se lanza cuando la cola de trabajo de contraseñas está llena.
+    """
+
+
+class BaseDeDatosNoDisponible(Exception):
+    """
+    Se lanza cuando no se pudo obtener una conexión para validar un login.
+    """
 
 
 class PasswordHandler:
+    # Hilos dedicados a bcrypt (libera el GIL) y trabajos que pueden esperar en cola
+    hilos = int(os.getenv("BCRYPT_HILOS", str(os.cpu_count() or 2)))
+    cola_maxima = int(os.getenv("BCRYPT_COLA_MAXIMA", "32"))
+    _ejecutor = None
+    _cupos = None
+    _lock = threading.Lock()
+
+    @staticmethod
+    def _preparar(funcion, *args):
+        """
+        Reserva un cupo y retorna la llamada a ejecutar en el pool de bcrypt,
+        que libera el cupo al terminar. Si ya hay `hilos + cola_maxima` trabajos
+        pendientes lanza ServicioSaturado en lugar de encolar más.
+        """
+        if PasswordHandler._ejecutor is None:
+            with PasswordHandler._lock:
+                if PasswordHandler._ejecutor is None:
+                    PasswordHandler._cupos = threading.BoundedSemaphore(PasswordHandler.hilos + PasswordHandler.cola_maxima)
+                    PasswordHandler._ejecutor = ThreadPoolExecutor(
+                        max_workers=PasswordHandler.hilos, thread_name_prefix="bcrypt"
+                    )
+
+        cupos = PasswordHandler._cupos
+        if not cupos.acquire(blocking=False):
+            raise ServicioSaturado("El servicio de autenticación está saturado, intenta de nuevo.")
+
+        def medido():
+            inicio = time.perf_counter()
+            try:
+                return funcion(*args)
+            finally:
+                tiempo_bcrypt.observar(time.perf_counter() - inicio, funcion.__name__)
+                cupos.release()
+
+        return medido
+
+    @staticmethod
+    def _ejecutar(funcion, *args):
+        """
+        Ejecuta `funcion` en el pool de bcrypt y espera el resultado bloqueando el hilo.
+        """
+        medido = PasswordHandler._preparar(funcion, *args)
+        try:
+            futuro = PasswordHandler._ejecutor.submit(medido)
+        except Exception:
+            PasswordHandler._cupos.release()
+            raise
+        return futuro.result()
+
+    @staticmethod
+    async def _ejecutarAsync(funcion, *args):
+        """
+        Igual que `_ejecutar`, pero se espera desde el event loop sin ocupar
+        ningún hilo mientras bcrypt trabaja.
+        """
+        medido = PasswordHandler._preparar(funcion, *args)
+        try:
+            futuro = asyncio.get_running_loop().run_in_executor(PasswordHandler._ejecutor, medido)
+        except Exception:
+            PasswordHandler._cupos.release()
+            raise
+        return await futuro
+
     @staticmethod
     def hash_password(password: str) -> str:
         """
@@ -61,9 +244,9 @@ class PasswordHandler:
         """
         # Convertimos la contraseña a bytes y generamos el hash
         password_bytes = password.encode('utf-8')
-        # Generamos un salt y hacemos el hash
-        salt = bcrypt.gensalt()
-        password_hash = bcrypt.hashpw(password_bytes, salt)
+        # Generamos un salt con el costo configurado y hacemos el hash
+        salt = bcrypt.gensalt(rounds=BCRYPT_ROUNDS)
+        password_hash = PasswordHandler._ejecutar(bcrypt.hashpw, password_bytes, salt)
         # Retornamos el hash como string
         return password_hash.decode('utf-8')
     
@@ -72,188 +255,717 @@ class PasswordHandler:
         """
         Compara una contraseña ingresada con su versión encriptada.
         """
-        return bcrypt.checkpw(contrasena_ingresada.encode('utf-8'), contrasena_encriptada.encode('utf-8'))    
+        try:
+            return PasswordHandler._ejecutar(
+                bcrypt.checkpw, contrasena_ingresada.encode('utf-8'), contrasena_encriptada.encode('utf-8')
+            )
+        except ValueError:
+            return False  # El valor guardado no es un hash de bcrypt válido
+
+    @staticmethod
+    async def hash_password_async(password: str) -> str:
+        """
+        Versión de `hash_password` para el event loop.
+        """
+        salt = bcrypt.gensalt(rounds=BCRYPT_ROUNDS)
+        password_hash = await PasswordHandler._ejecutarAsync(bcrypt.hashpw, password.encode('utf-8'), salt)
+        return password_hash.decode('utf-8')
+
+    @staticmethod
+    async def verificar_contrasena_async(contrasena_ingresada, contrasena_encriptada):
+        """
+        Versión de `verificar_contrasena` para el event loop.
+        """
+        try:
+            return await PasswordHandler._ejecutarAsync(
+                bcrypt.checkpw, contrasena_ingresada.encode('utf-8'), contrasena_encriptada.encode('utf-8')
+            )
+        except ValueError:
+            return False
+
+    @staticmethod
+    def necesita_rehash(contrasena_encriptada):
+        """
+        Indica si el hash fue generado con un costo distinto al configurado.
+        Formato del hash: '$2b$<costo>$<salt+hash>'
+        """
+        try:
+            return int(contrasena_encriptada.split('$')[2]) != BCRYPT_ROUNDS
+        except (IndexError, ValueError):
+            return False
+
+    @staticmethod
+    def hash_passwords_lote(passwords, rounds=None):
+        """
+        Genera los hashes de muchas contraseñas en paralelo usando todos los núcleos.
+        bcrypt libera el GIL, así que los hilos corren en paralelo. Usa su propio
+        ejecutor para no ocupar el pool de login.
+        """
+        rounds = rounds or BCRYPT_ROUNDS_IMPORTACION
+
+        def generar(password):
+            inicio = time.perf_counter()
+            password_hash = bcrypt.hashpw(password.encode('utf-8'), bcrypt.gensalt(rounds=rounds)).decode('utf-8')
+            tiempo_bcrypt.observar(time.perf_counter() - inicio, "hashpw_lote")
+            return password_hash
+
+        with ThreadPoolExecutor(max_workers=os.cpu_count() or 2, thread_name_prefix="bcrypt-lote") as ejecutor:
+            return list(ejecutor.map(generar, passwords))
 
 class ConexionBD:
 
-    user = "integraservicios_lqna_user"
-    password = "T4hF17e0ujtlWuLhpiBEHFTRa10K5OxU"
-    host = "dpg-cug0gl5ds78s73fq5j6g-a.oregon-postgres.render.com"
-    port = 5432  # Puerto predeterminado para PostgreSQL
-    dbname = "integraservicios_lqna"
- 
+    # Base de datos primaria; los valores por defecto son los del despliegue
+    user = os.getenv("BD_USER", "integraservicios_lqna_user")
+    password = os.getenv("BD_PASSWORD", "T4hF17e0ujtlWuLhpiBEHFTRa10K5OxU")
+    host = os.getenv("BD_HOST", "dpg-cug0gl5ds78s73fq5j6g-a.oregon-postgres.render.com")
+    port = int(os.getenv("BD_PUERTO", "5432"))  # Puerto predeterminado para PostgreSQL
+    dbname = os.getenv("BD_NOMBRE", "integraservicios_lqna")
+
+    # Tamaño del pool de conexiones
+    pool_minimo = int(os.getenv("BD_POOL_MIN", "1"))
+    pool_maximo = int(os.getenv("BD_POOL_MAX", "10"))
+    pool_espera = float(os.getenv("BD_POOL_ESPERA", "10"))  # Segundos esperando una conexión libre
+    pool_vida_maxima = float(os.getenv("BD_POOL_VIDA_MAXIMA", "1800"))  # Se recicla tras 30 minutos
+    pool = None
+    _pool_lock = threading.Lock()
+
+    # Réplica de lectura opcional. Sin BD_REPLICA_HOST todo se lee del primario.
+    replica_host = os.getenv("BD_REPLICA_HOST")
+    replica_port = int(os.getenv("BD_REPLICA_PUERTO", port))
+    replica_user = os.getenv("BD_REPLICA_USER", user)
+    replica_password = os.getenv("BD_REPLICA_PASSWORD", password)
+    replica_dbname = os.getenv("BD_REPLICA_NOMBRE", dbname)
+    replica_retraso_maximo = float(os.getenv("BD_REPLICA_RETRASO_MAXIMO", "5"))  # Segundos de atraso tolerados
+    replica_verificar_cada = float(os.getenv("BD_REPLICA_VERIFICAR_CADA", "1"))  # Segundos entre mediciones del atraso
+    replica_timeout_conexion = int(os.getenv("BD_REPLICA_TIMEOUT_CONEXION", "2"))  # Segundos para conectar
+    replica_reintento = float(os.getenv("BD_REPLICA_REINTENTO", "30"))  # Segundos sin intentarlo tras un fallo
+    pool_replica = None
+    _replica_caida_hasta = float("-inf")
+    _retraso_replica = float("inf")
+    _retraso_medido_en = float("-inf")
+
+    # Caché del catálogo de recursos, clave: filtros de la consulta
+    cache_recursos = CacheTTL(
+        maximo=int(os.getenv("CACHE_RECURSOS_MAX", "256")),
+        ttl=float(os.getenv("CACHE_RECURSOS_TTL", "60"))
+    )
+
+    @staticmethod
+    def obtenerPool():
+        """
+        Crea el pool de conexiones la primera vez que se necesita.
+        """
+        if ConexionBD.pool is None:
+            with ConexionBD._pool_lock:
+                if ConexionBD.pool is None:
+                    pool = PoolConexiones(
+                        {
+                            "user": ConexionBD.user,
+                            "password": ConexionBD.password,
+                            "host": ConexionBD.host,
+                            "port": ConexionBD.port,
+                            "dbname": ConexionBD.dbname,
+                            "cursor_factory": CursorMedido,
+                        },
+                        minimo=ConexionBD.pool_minimo,
+                        maximo=ConexionBD.pool_maximo,
+                        espera_maxima=ConexionBD.pool_espera,
+                        vida_maxima=ConexionBD.pool_vida_maxima,
+                        observar_espera=espera_conexion.observar,
+                    )
+                    pool.llenar()
+                    ConexionBD.pool = pool
+        return ConexionBD.pool
 
     @staticmethod
     def conectar():
         """
-        Establece una conexión a la base de datos PostgreSQL.
+        Obtiene una conexión del pool de conexiones a PostgreSQL.
+        Debe devolverse con `ConexionBD.liberar`.
         """
         try:
-            conexion = psycopg2.connect(
-                user=ConexionBD.user,
-                password=ConexionBD.password,
-                host=ConexionBD.host,
-                port=ConexionBD.port,
-                dbname=ConexionBD.dbname
-            )
-            return conexion
+            return ConexionBD.obtenerPool().obtener()
         except Exception as e:
-            print("Error de conexión:", e)
+            logger.error("Error de conexión: %s", e)
             return None
 
     @staticmethod
-    def validarLogin(correo, contrasena):
+    def liberar(conexion):
         """
-        Valida el login de un usuario comparando la contraseña encriptada.
+        Devuelve una conexión al pool del que salió (primario o réplica).
         """
-        conexion = ConexionBD.conectar()
-        if not conexion:
-            return False
+        if conexion is not None and conexion.origen is not None:
+            conexion.origen.devolver(conexion)
 
+    @staticmethod
+    def obtenerPoolReplica():
+        """
+        Crea el pool de la réplica la primera vez que se necesita.
+        """
+        if ConexionBD.pool_replica is None:
+            with ConexionBD._pool_lock:
+                if ConexionBD.pool_replica is None:
+                    pool = PoolConexiones(
+                        {
+                            "user": ConexionBD.replica_user,
+                            "password": ConexionBD.replica_password,
+                            "host": ConexionBD.replica_host,
+                            "port": ConexionBD.replica_port,
+                            "dbname": ConexionBD.replica_dbname,
+                            "connect_timeout": ConexionBD.replica_timeout_conexion,
+                            "cursor_factory": CursorMedido,
+                        },
+                        minimo=ConexionBD.pool_minimo,
+                        maximo=ConexionBD.pool_maximo,
+                        espera_maxima=ConexionBD.pool_espera,
+                        vida_maxima=ConexionBD.pool_vida_maxima,
+                    )
+                    pool.llenar()
+                    ConexionBD.pool_replica = pool
+        return ConexionBD.pool_replica
+
+    @staticmethod
+    def conectarLectura(consistente_desde=None):
+        """
+        Obtiene una conexión para consultas de solo lectura. Debe devolverse con
+        `ConexionBD.liberar`.
+
+        Usa la réplica si está configurada y su atraso no supera
+        `replica_retraso_maximo`; si no, o si el cliente acaba de escribir
+        (`leer_del_primario`), usa el primario. `consistente_desde` es un instante
+        de time.monotonic (p. ej. la última invalidación de una caché): la réplica
+        solo se usa si su atraso es menor que el tiempo transcurrido desde entonces.
+        """
+        if ConexionBD.replica_host is None:
+            return ConexionBD.conectar()
+        if leer_del_primario.get():
+            lecturas_bd.incrementar("primario", "escritura_reciente")
+            return ConexionBD.conectar()
+
+        # Tras un fallo no se vuelve a intentar hasta pasados `replica_reintento`
+        # segundos, para no esperar el timeout de conexión en cada lectura
+        if time.monotonic() < ConexionBD._replica_caida_hasta:
+            lecturas_bd.incrementar("primario", "replica_caida")
+            return ConexionBD.conectar()
         try:
-            cursor = conexion.cursor()
-            query = "SELECT id_usuario, contrasena FROM usuario WHERE email = %s"
-            cursor.execute(query, (correo,))
-            result = cursor.fetchone()  # Obtiene una fila con (id_usuario, contrasena)
+            conexion = ConexionBD.obtenerPoolReplica().obtener()
+        except PoolAgotado:
+            lecturas_bd.incrementar("primario", "replica_ocupada")
+            return ConexionBD.conectar()
+        except Exception as e:
+            logger.warning("Réplica no disponible, se lee del primario por %ss: %s", ConexionBD.replica_reintento, e)
+            ConexionBD._replica_caida_hasta = time.monotonic() + ConexionBD.replica_reintento
+            lecturas_bd.incrementar("primario", "replica_caida")
+            return ConexionBD.conectar()
+
+        limite = ConexionBD.replica_retraso_maximo
+        if consistente_desde is not None:
+            limite = min(limite, time.monotonic() - consistente_desde)
+        try:
+            retraso = ConexionBD._retrasoReplica(conexion, consistente_desde)
+        except Exception as e:
+            logger.warning("No se pudo medir el atraso de la réplica: %s", e)
+            retraso = float("inf")
+        if retraso > limite:
+            ConexionBD.liberar(conexion)
+            lecturas_bd.incrementar("primario", "replica_atrasada")
+            return ConexionBD.conectar()
+        lecturas_bd.incrementar("replica", "")
+        return conexion
 
-            if result:
-                id_usuario, contrasena_encriptada = result  # Extrae los valores correctamente
-                
-                # Verificar la contraseña
-                if PasswordHandler.verificar_contrasena(contrasena, contrasena_encriptada):
-                    ConexionBD.idUsuarioValido = id_usuario
-                    return id_usuario
+    @staticmethod
+    def _retrasoReplica(conexion, consistente_desde=None):
+        """
+        Segundos de atraso de la réplica, medidos como mucho cada
+        `replica_verificar_cada` segundos (o de nuevo si hubo una invalidación
+        posterior a la última medición). Cero si aplicó todo lo recibido.
+        """
+        ahora = time.monotonic()
+        medido_en = ConexionBD._retraso_medido_en
+        if ahora - medido_en < ConexionBD.replica_verificar_cada and (
+                consistente_desde is None or consistente_desde < medido_en):
+            return ConexionBD._retraso_replica
+        cursor = conexion.cursor()
+        cursor.execute("""
+        SELECT CASE
+            WHEN NOT pg_is_in_recovery() THEN 0
+            WHEN pg_last_wal_receive_lsn() = pg_last_wal_replay_lsn() THEN 0
+            ELSE COALESCE(EXTRACT(EPOCH FROM now() - pg_last_xact_replay_timestamp())::float8, 'Infinity'::float8)
+        END
+        """)
+        retraso = float(cursor.fetchone()[0])
+        conexion.rollback()
+        ConexionBD._retraso_replica = retraso
+        ConexionBD._retraso_medido_en = ahora
+        return retraso
 
-            return False  # Si no hay resultado o la contraseña es incorrecta
+    @staticmethod
+    def metricasReplica():
+        """
+        Retorna el estado del pool de la réplica y el último atraso medido.
+        """
+        if ConexionBD.pool_replica is None:
+            return {}
+        metricas = ConexionBD.pool_replica.metricas()
+        metricas["retraso_segundos"] = ConexionBD._retraso_replica
+        return metricas
+
+    # Caché de la grilla de disponibilidad, clave: (tipo de recurso, fecha)
+    cache_disponibilidad = CacheTTL(
+        maximo=int(os.getenv("CACHE_DISPONIBILIDAD_MAX", "2048")),
+        ttl=float(os.getenv("CACHE_DISPONIBILIDAD_TTL", "30"))
+    )
+    DURACION_FRANJA = 60  # Minutos de cada franja reservable
+    # Un recurso prestado ahora sigue admitiendo reservas en otras franjas
+    ESTADOS_RESERVABLES = ('Disponible', 'Prestado')
 
-        except Exception as e:
-            print("Error en validarLogin:", e)
+    @staticmethod
+    def invalidarCacheRecursos():
+        """
+        Descarta el catálogo de recursos en caché. Debe llamarse tras cualquier
+        escritura sobre recurso o tipo_recurso.
+        """
+        ConexionBD.cache_recursos.invalidar()
+        ConexionBD.cache_disponibilidad.invalidar()
+
+    @staticmethod
+    def invalidarDisponibilidad(*fechas):
+        """
+        Descarta la grilla de disponibilidad en caché de las fechas indicadas.
+        """
+        fechas = set(fechas)
+        if fechas:
+            ConexionBD.cache_disponibilidad.invalidarSi(lambda clave: clave[1] in fechas)
+
+    @staticmethod
+    def metricasPool():
+        """
+        Retorna las métricas del pool (conexiones en uso, en espera y latencia de préstamo).
+        """
+        if ConexionBD.pool is None:
+            return {}
+        return ConexionBD.pool.metricas()
+
+    @staticmethod
+    def codificarCursor(valores):
+        """
+        Convierte la llave de la última fila de una página en un cursor opaco.
+        """
+        texto = json.dumps(valores, default=str, separators=(",", ":"))
+        return base64.urlsafe_b64encode(texto.encode("utf-8")).decode("ascii").rstrip("=")
+
+    @staticmethod
+    def decodificarCursor(cursor, campos):
+        """
+        Recupera la llave guardada en un cursor. Lanza ValueError si no es válido.
+        """
+        try:
+            relleno = "=" * (-len(cursor) % 4)
+            valores = json.loads(base64.urlsafe_b64decode(cursor + relleno))
+        except Exception:
+            raise ValueError("Cursor inválido.")
+        if not isinstance(valores, list) or len(valores) != campos:
+            raise ValueError("Cursor inválido.")
+        return valores
+
+    @staticmethod
+    @medirBD
+    def validarLogin(correo, contrasena):
+        """
+        Valida el login de un usuario comparando la contraseña encriptada.
+        """
+        result = ConexionBD._consultarCredenciales(ConexionBD.QUERY_CREDENCIALES_USUARIO, correo)
+        if not result:
+            return False  # El correo no está registrado
+        id_usuario, contrasena_encriptada = result  # Extrae los valores correctamente
+
+        # Verificar la contraseña (fuera de la conexión, bcrypt corre en su propio pool)
+        if not PasswordHandler.verificar_contrasena(contrasena, contrasena_encriptada):
             return False
-        finally:
-            conexion.close()
+        if PasswordHandler.necesita_rehash(contrasena_encriptada):
+            ConexionBD._actualizarHash(ConexionBD.QUERY_HASH_USUARIO, contrasena, id_usuario)
+        ConexionBD.idUsuarioValido = id_usuario
+        return id_usuario
             
     @staticmethod
+    @medirBD
     def validarLoginEmpleado(correo, contrasena):
         """
-        Valida el login de un usuario comparando la contraseña encriptada.
+        Valida el login de un empleado comparando la contraseña encriptada.
+        """
+        result = ConexionBD._consultarCredenciales(ConexionBD.QUERY_CREDENCIALES_EMPLEADO, correo)
+        if not result:
+            return False
+        id_empleado, contrasena_encriptada = result
+
+        if not PasswordHandler.verificar_contrasena(contrasena, contrasena_encriptada):
+            return False
+        if PasswordHandler.necesita_rehash(contrasena_encriptada):
+            ConexionBD._actualizarHash(ConexionBD.QUERY_HASH_EMPLEADO, contrasena, id_empleado)
+        ConexionBD.idUsuarioValido = id_empleado
+        token = TokenHandler.generar_token(id_empleado)
+        return token
+
+    @staticmethod
+    def _consultarCredenciales(consulta, correo):
+        """
+        Obtiene (id, contraseña encriptada) para un correo, o None si no existe.
+        Los errores de la base de datos se lanzan: no son un intento fallido.
         """
         conexion = ConexionBD.conectar()
         if not conexion:
-            return False
+            raise BaseDeDatosNoDisponible("Error al conectar con la base de datos.")
         try:
             cursor = conexion.cursor()
-            query = "SELECT id_empleado, contrasena FROM empleado WHERE email = %s"
-            cursor.execute(query, (correo,))
-            result = cursor.fetchone()  # Obtiene una fila con (id_usuario, contrasena)
-            if result:
-                id_empleado, contrasena_encriptada = result  # Extrae los valores correctamente
-                
-                # Verificar la contraseña
-                if PasswordHandler.verificar_contrasena(contrasena, contrasena_encriptada):
-                    ConexionBD.idUsuarioValido = id_empleado
-                    token = TokenHandler.generar_token(id_empleado)
-                    return token 
-            return False  # Si no hay resultado o la contraseña es incorrecta
+            consulta.ejecutar(cursor, (correo,))
+            return cursor.fetchone()  # Obtiene una fila con (id, contrasena)
         except Exception as e:
-            print("Error en validarLogin:", e)
-            return False
+            logger.error("Error en validarLogin: %s", e)
+            raise
         finally:
-            conexion.close()
+            ConexionBD.liberar(conexion)
+
     @staticmethod
+    def _actualizarHash(consulta, contrasena, id_registro):
+        """
+        Vuelve a encriptar la contraseña con el costo actual tras un login exitoso.
+        Un fallo aquí no debe impedir el inicio de sesión.
+        """
+        try:
+            contrasena_hash = PasswordHandler.hash_password(contrasena)
+        except ServicioSaturado:
+            return
+        ConexionBD._guardarHash(consulta, contrasena_hash, id_registro)
+
+    @staticmethod
+    def _guardarHash(consulta, contrasena_hash, id_registro):
+        """
+        Guarda un hash ya calculado. Los errores solo se registran en el log.
+        """
+        conexion = ConexionBD.conectar()
+        if not conexion:
+            return
+        try:
+            cursor = conexion.cursor()
+            consulta.ejecutar(cursor, (contrasena_hash, id_registro))
+            conexion.commit()
+        except Exception as e:
+            logger.warning("Error al actualizar el hash de la contraseña: %s", e)
+        finally:
+            ConexionBD.liberar(conexion)
+
+    # Consultas del inicio de sesión, preparadas en el servidor por cada conexión del pool
+    QUERY_CREDENCIALES_USUARIO = registrar(
+        "credenciales_usuario", "SELECT id_usuario, contrasena FROM usuario WHERE email = %s"
+    )
+    QUERY_CREDENCIALES_EMPLEADO = registrar(
+        "credenciales_empleado", "SELECT id_empleado, contrasena FROM empleado WHERE email = %s"
+    )
+    QUERY_HASH_USUARIO = registrar(
+        "hash_usuario", "UPDATE usuario SET contrasena = %s WHERE id_usuario = %s"
+    )
+    QUERY_HASH_EMPLEADO = registrar(
+        "hash_empleado", "UPDATE empleado SET contrasena = %s WHERE id_empleado = %s"
+    )
+
+    @staticmethod
+    @medirBD
     def registrarEmpleado(nombre, cargo, email, contrasena):
         """
         Registra un nuevo empleado en la base de datos.
         """
+        mensaje = ConexionBD._verificarCorreo(ConexionBD.QUERY_EMAIL_EMPLEADO, email)
+        if mensaje:
+            return mensaje
+        # Se encripta sin tener una conexión tomada del pool
+        contrasena_hash = PasswordHandler.hash_password(contrasena)
+        return ConexionBD._insertarEmpleado(nombre, cargo, email, contrasena_hash)
+
+    @staticmethod
+    @medirBD
+    def registrarUsuario(nombre, email, telefono, contrasena):
+        """
+        Registra un nuevo usuario en la base de datos.
+        """
+        mensaje = ConexionBD._verificarCorreo(ConexionBD.QUERY_EMAIL_USUARIO, email)
+        if mensaje:
+            return mensaje
+        contrasena_hash = PasswordHandler.hash_password(contrasena)
+        return ConexionBD._insertarUsuario(nombre, email, telefono, contrasena_hash)
+
+    QUERY_EMAIL_EMPLEADO = "SELECT ID_Empleado FROM Empleado WHERE Email = %s"
+    QUERY_EMAIL_USUARIO = "SELECT ID_Usuario FROM Usuario WHERE Email = %s"
+
+    @staticmethod
+    def _verificarCorreo(consulta, email):
+        """
+        Retorna None si el correo está libre, o el mensaje a devolver si ya está
+        registrado o no se pudo comprobar.
+        """
         conexion = ConexionBD.conectar()
         if not conexion:
             return "Error al conectar con la base de datos."
-
         try:
             cursor = conexion.cursor()
-
-            # Verificar si el correo ya está registrado
-            cursor.execute("SELECT ID_Empleado FROM Empleado WHERE Email = %s", (email,))
+            cursor.execute(consulta, (email,))
             if cursor.fetchone():
                 return "El correo ya está registrado."
+            return None
+        except Exception as e:
+            return f"Error al registrar el usuario: {str(e)}"
+        finally:
+            ConexionBD.liberar(conexion)
 
-            contrasena_hash = PasswordHandler.hash_password(contrasena)
-            # Insertar el nuevo usuario
+    @staticmethod
+    def _insertarEmpleado(nombre, cargo, email, contrasena_hash):
+        conexion = ConexionBD.conectar()
+        if not conexion:
+            return "Error al conectar con la base de datos."
+        try:
+            cursor = conexion.cursor()
             query = """
             INSERT INTO Empleado (Nombre, Cargo, Email, Contrasena)
             VALUES (%s, %s, %s, %s)
             """
             cursor.execute(query, (nombre, cargo, email, contrasena_hash))
             conexion.commit()
-
             return "Empleado registrado exitosamente."
-
         except Exception as e:
             return f"Error al registrar el usuario: {str(e)}"
         finally:
-            conexion.close()
+            ConexionBD.liberar(conexion)
+
     @staticmethod
-    def registrarUsuario(nombre, email, telefono, contrasena):
-        """
-        Registra un nuevo usuario en la base de datos.
-        """
+    def _insertarUsuario(nombre, email, telefono, contrasena_hash):
         conexion = ConexionBD.conectar()
         if not conexion:
             return "Error al conectar con la base de datos."
-
         try:
             cursor = conexion.cursor()
-
-            # Verificar si el correo ya está registrado
-            cursor.execute("SELECT ID_Usuario FROM Usuario WHERE Email = %s", (email,))
-            if cursor.fetchone():
-                return "El correo ya está registrado."
-
-            contrasena_hash = PasswordHandler.hash_password(contrasena)
-            # Insertar el nuevo usuario
             query = """
             INSERT INTO Usuario (Nombre, Email, Telefono, Contrasena)
             VALUES (%s, %s, %s, %s)
             """
             cursor.execute(query, (nombre, email, telefono, contrasena_hash))
             conexion.commit()
-
             return "Usuario registrado exitosamente."
-
         except Exception as e:
             return f"Error al registrar el usuario: {str(e)}"
         finally:
-            conexion.close()
-            
+            ConexionBD.liberar(conexion)
+
     @staticmethod
-    def consultarUsuarios(id_usuario=None):
+    @medirBD
+    def importarUsuarios(filas):
+        """
+        Importa usuarios de forma masiva.
+
+        `filas` es una lista de diccionarios con nombre, email, telefono y contrasena.
+        Los correos repetidos se detectan con una sola consulta, las contraseñas
+        se encriptan en paralelo y las filas se cargan con COPY a una tabla
+        temporal desde la que se insertan en Usuario.
+        Retorna {"importados": int, "errores": [{"fila", "email", "error"}]}.
         """
-        Consulta todos los usuarios o uno en específico por ID.
+        validas, errores = ConexionBD._validarImportacion(filas)
+        nuevas = ConexionBD._filtrarRegistrados(validas, errores)
+        if isinstance(nuevas, str):  # Si es un mensaje de error
+            return nuevas
+        if not nuevas:
+            return ConexionBD._resultadoImportacion(0, errores)
+        # Se encripta sin tener una conexión tomada del pool
+        hashes = PasswordHandler.hash_passwords_lote([f[4] for f in nuevas])
+        return ConexionBD._cargarImportacion(nuevas, hashes, errores)
+
+    @staticmethod
+    def _textoImportacion(valor):
         """
+        Normaliza un campo de la importación. Los números (p. ej. un teléfono en
+        NDJSON) se aceptan como texto; otros tipos lanzan ValueError.
+        """
+        if valor is None:
+            return ""
+        if isinstance(valor, str):
+            return valor.strip()
+        if isinstance(valor, (int, float)) and not isinstance(valor, bool):
+            return str(valor)
+        raise ValueError("Algún campo tiene un tipo no válido.")
+
+    @staticmethod
+    def _validarImportacion(filas):
+        """
+        Retorna (validas, errores); cada fila válida es (fila, nombre, email, telefono, contrasena).
+        """
+        errores = []
+        validas = []
+        vistos = set()
+        for numero, fila in enumerate(filas, start=1):
+            email = fila.get("email")
+            try:
+                nombre = ConexionBD._textoImportacion(fila.get("nombre"))
+                email = ConexionBD._textoImportacion(email)
+                telefono = ConexionBD._textoImportacion(fila.get("telefono")) or None
+                contrasena = fila.get("contrasena") or ""
+                if not isinstance(contrasena, str):
+                    raise ValueError("La contrasena debe ser texto.")
+            except ValueError as e:
+                errores.append({"fila": numero, "email": str(email or ""), "error": str(e)})
+                continue
+            if not nombre or not email or not contrasena:
+                error = "Faltan nombre, email o contrasena."
+            elif len(nombre) > 100 or len(email) > 100 or (telefono and len(telefono) > 15):
+                error = "Algún campo supera la longitud permitida."
+            elif email in vistos:
+                error = "El correo está repetido en el archivo."
+            else:
+                error = None
+            if error:
+                errores.append({"fila": numero, "email": email, "error": error})
+                continue
+            vistos.add(email)
+            validas.append((numero, nombre, email, telefono, contrasena))
+        return validas, errores
+
+    @staticmethod
+    def _filtrarRegistrados(validas, errores):
+        """
+        Retorna las filas cuyo correo no está registrado, en una sola consulta,
+        y agrega a `errores` las demás. Retorna un mensaje si hubo un error.
+        """
+        if not validas:
+            return []
         conexion = ConexionBD.conectar()
+        if not conexion:
+            return "Error al conectar con la base de datos."
+        try:
+            cursor = conexion.cursor()
+            cursor.execute("SELECT Email FROM Usuario WHERE Email = ANY(%s)", ([v[2] for v in validas],))
+            registrados = {r[0] for r in cursor.fetchall()}
+        except Exception as e:
+            return f"Error al importar usuarios: {str(e)}"
+        finally:
+            ConexionBD.liberar(conexion)
+
+        nuevas = []
+        for fila in validas:
+            if fila[2] in registrados:
+                errores.append({"fila": fila[0], "email": fila[2], "error": "El correo ya está registrado."})
+            else:
+                nuevas.append(fila)
+        return nuevas
+
+    @staticmethod
+    def _cargarImportacion(nuevas, hashes, errores):
+        """
+        Inserta las filas nuevas con sus hashes ya calculados.
+        """
+        buffer = io.StringIO()
+        escritor = csv.writer(buffer)
+        for (numero, nombre, email, telefono, _), contrasena_hash in zip(nuevas, hashes):
+            escritor.writerow([numero, nombre, email, telefono if telefono is not None else "", contrasena_hash])
+        buffer.seek(0)
+
+        conexion = ConexionBD.conectar()
+        if not conexion:
+            return "Error al conectar con la base de datos."
+        try:
+            cursor = conexion.cursor()
+            cursor.execute("""
+            CREATE TEMP TABLE usuario_importacion (
+                Fila INT, Nombre VARCHAR(100), Email VARCHAR(100), Telefono VARCHAR(15), Contrasena VARCHAR(255)
+            ) ON COMMIT DROP
+            """)
+            cursor.copy_expert("COPY usuario_importacion FROM STDIN WITH (FORMAT csv)", buffer)
+            # ON CONFLICT cubre correos registrados por otra petición durante la importación
+            cursor.execute("""
+            INSERT INTO Usuario (Nombre, Email, Telefono, Contrasena)
+            SELECT Nombre, Email, NULLIF(Telefono, ''), Contrasena FROM usuario_importacion ORDER BY Fila
+            ON CONFLICT (Email) DO NOTHING
+            RETURNING Email
+            """)
+            insertados = {r[0] for r in cursor.fetchall()}
+            conexion.commit()
+        except Exception as e:
+            return f"Error al importar usuarios: {str(e)}"
+        finally:
+            ConexionBD.liberar(conexion)
+
+        for fila in nuevas:
+            if fila[2] not in insertados:
+                errores.append({"fila": fila[0], "email": fila[2], "error": "El correo ya está registrado."})
+        return ConexionBD._resultadoImportacion(len(insertados), errores)
+
+    @staticmethod
+    def _resultadoImportacion(importados, errores):
+        return {"importados": importados, "errores": sorted(errores, key=lambda e: e["fila"])}
+
+    @staticmethod
+    @medirBD
+    def consultarUsuarios(id_usuario=None, limite=100, cursor_pagina=None, con_total=False):
+        """
+        Consulta un usuario por ID o una página de usuarios ordenada por ID.
+
+        Sin ID retorna {"datos": [...], "siguiente_cursor": str | None, "total": int | None};
+        `siguiente_cursor` se pasa en la siguiente llamada para obtener la página
+        que sigue y `total` solo se calcula si `con_total` es verdadero.
+        """
+        conexion = ConexionBD.conectarLectura()
         if not conexion:
             return "Error al conectar con la base de datos."
 
         try:
             cursor = conexion.cursor()
             if id_usuario:
-                query = "SELECT ID_Usuario, Nombre, Email, Telefono FROM Usuario WHERE ID_Usuario = %s"
-                cursor.execute(query, (id_usuario,))
+                ConexionBD.QUERY_USUARIO.ejecutar(cursor, (id_usuario,))
                 usuario = cursor.fetchone()
                 if usuario:
-                    return {"id_usuario": usuario[0], "nombre": usuario[1], "email": usuario[2], "telefono": usuario[3]}
+                    return dict(zip(ConexionBD.COLUMNAS_USUARIOS, usuario))
                 return "Usuario no encontrado."
             else:
-                query = "SELECT ID_Usuario, Nombre, Email, Telefono FROM Usuario"
-                cursor.execute(query)
+                ultimo_id = None
+                if cursor_pagina:
+                    ultimo_id, = ConexionBD.decodificarCursor(cursor_pagina, 1)
+                # Se pide una fila de más para saber si hay otra página
+                consulta, params = ConexionBD.PAGINA_USUARIOS.preparar({"despues_de": ultimo_id}, extra=(limite + 1,))
+                consulta.ejecutar(cursor, params)
                 usuarios = cursor.fetchall()
-                return [{"id_usuario": u[0], "nombre": u[1], "email": u[2], "telefono": u[3]} for u in usuarios]
 
+                siguiente = None
+                if len(usuarios) > limite:
+                    usuarios = usuarios[:limite]
+                    siguiente = ConexionBD.codificarCursor([usuarios[-1][0]])
+
+                total = None
+                if con_total:
+                    cursor.execute("SELECT COUNT(*) FROM Usuario")
+                    total = cursor.fetchone()[0]
+
+                return {
+                    "datos": [dict(zip(ConexionBD.COLUMNAS_USUARIOS, u)) for u in usuarios],
+                    "siguiente_cursor": siguiente,
+                    "total": total,
+                }
+
+        except ValueError as e:
+            return str(e)
         except Exception as e:
             return f"Error al consultar usuarios: {str(e)}"
         finally:
-            conexion.close()
+            ConexionBD.liberar(conexion)
+
+    COLUMNAS_USUARIOS = ("id_usuario", "nombre", "email", "telefono")
+    QUERY_USUARIO = registrar(
+        "usuario_por_id", "SELECT ID_Usuario, Nombre, Email, Telefono FROM Usuario WHERE ID_Usuario = %s"
+    )
+    PAGINA_USUARIOS = ConstructorConsulta(
+        "pagina_usuarios",
+        "SELECT ID_Usuario, Nombre, Email, Telefono FROM Usuario",
+        {"despues_de": "ID_Usuario > %s"},
+        orden_defecto="ID_Usuario",
+        sufijo="LIMIT %s",
+    )
 
     @staticmethod
+    @medirBD
     def actualizarUsuario(id_usuario, nombre=None, email=None, telefono=None, contrasena=None):
         """
         Actualiza la información de un usuario en la base de datos.
@@ -293,9 +1005,10 @@ class ConexionBD:
         except Exception as e:
             return f"Error al actualizar el usuario: {str(e)}"
         finally:
-            conexion.close()
+            ConexionBD.liberar(conexion)
 
     @staticmethod
+    @medirBD
     def eliminarUsuario(id_usuario):
         """
         Elimina un usuario de la base de datos.
@@ -313,85 +1026,227 @@ class ConexionBD:
         except Exception as e:
             return f"Error al eliminar el usuario: {str(e)}"
         finally:
-            conexion.close()
+            ConexionBD.liberar(conexion)
 
 
 
 
 
     @staticmethod
+    @medirBD
     def crearReserva(id_usuario, id_recurso, fecha_reserva, hora_reserva):
+        """
+        Crea una reserva con una sola sentencia atómica.
+
+        La existencia del usuario, el estado del recurso y el choque con otra
+        reserva se validan en el mismo INSERT; el índice único parcial
+        reserva_recurso_horario_unico impide reservas dobles aunque lleguen
+        peticiones concurrentes. El horario se valida antes con el horario en
+        caché y el INSERT solo procede si el horario guardado sigue siendo ese.
+        """
         conexion = ConexionBD.conectar()
         if not conexion:
             return "Error al conectar con la base de datos."
 
         try:
+            # Una sola sentencia es atómica por sí misma: sin BEGIN/COMMIT extra
+            conexion.autocommit = True
             cursor = conexion.cursor()
 
-            # Validar si el usuario existe
-            cursor.execute("SELECT ID_Usuario FROM Usuario WHERE ID_Usuario = %s", (id_usuario,))
-            usuario_existe = cursor.fetchone()
-            if not usuario_existe:
-                return "El usuario no está registrado."
-
-            # Obtener el recurso específico y su horario de disponibilidad
-            query_recurso = """
-            SELECT Id_Recurso, Horario_Disponibilidad, Estado FROM Recurso
-            WHERE Id_Recurso = %s
-            """
-            cursor.execute(query_recurso, (id_recurso,))
-            recurso = cursor.fetchone()
-
-            if not recurso:
-                return "El recurso no existe."
-
-            id_recurso_db, horario_disponibilidad, estado_recurso = recurso
-
-            # Validar si el recurso está disponible
-            if estado_recurso != 'Disponible':
-                return "El recurso no está disponible."
-
-            # Validar si el horario de la reserva está dentro del horario de disponibilidad
-            if not ConexionBD.validarHorarioDisponible(horario_disponibilidad, hora_reserva):
-                return "El recurso no está disponible en el horario solicitado."
-
-            # Verificar si el recurso ya está reservado en la fecha y hora
-            query_disponibilidad = """
-            SELECT ID_Reserva FROM Reserva WHERE ID_Recurso = %s AND Fecha_Reserva = %s AND Hora_Reserva = %s
-            """
-            cursor.execute(query_disponibilidad, (id_recurso, fecha_reserva, hora_reserva))
-            conflicto = cursor.fetchone()
-
-            if conflicto:
+            horario = horarioEnCache(id_recurso)
+            if horario is None:
+                # Primera reserva del recurso en este proceso: se obtiene su horario
+                ConexionBD.QUERY_HORARIO_RECURSO.ejecutar(cursor, (id_recurso,))
+                recurso = cursor.fetchone()
+                if not recurso:
+                    return "El recurso no existe."
+                horario = obtenerHorario(id_recurso, recurso[0])
+
+            for _ in range(2):
+                # Validar si el horario de la reserva está dentro del horario de disponibilidad
+                if not horario.abierto(fecha_reserva, hora_reserva):
+                    return "El recurso no está disponible en el horario solicitado."
+
+                ConexionBD.QUERY_CREAR_RESERVA.ejecutar(cursor, {
+                    "id_usuario": id_usuario,
+                    "id_recurso": id_recurso,
+                    "fecha_reserva": fecha_reserva,
+                    "hora_reserva": hora_reserva,
+                    "horario": horario.texto,
+                })
+                id_reserva, usuario_existe, recurso_existe, estado_recurso, horario_actual = cursor.fetchone()
+
+                if id_reserva:
+                    ConexionBD.invalidarDisponibilidad(fecha_reserva)
+                    return f"Reserva creada exitosamente con el recurso ID {id_recurso}"
+                if not usuario_existe:
+                    return "El usuario no está registrado."
+                if not recurso_existe:
+                    return "El recurso no existe."
+                if estado_recurso not in ConexionBD.ESTADOS_RESERVABLES:
+                    return "El recurso no está disponible."
+                if horario_actual != horario.texto:
+                    # El horario cambió desde que se guardó en caché: se valida de nuevo
+                    horario = obtenerHorario(id_recurso, horario_actual)
+                    continue
                 return "El recurso ya está reservado en este horario."
 
-            # Insertar la reserva
-            query_reserva = """
-            INSERT INTO Reserva (ID_Usuario, ID_Recurso, Fecha_Reserva, Hora_Reserva, Estado)
-            VALUES (%s, %s, %s, %s, 'Vigente')
-            """
-            cursor.execute(query_reserva, (id_usuario, id_recurso, fecha_reserva, hora_reserva))
-            conexion.commit()
-            return f"Reserva creada exitosamente con el recurso ID {id_recurso}"
+            return "El recurso no está disponible en el horario solicitado."
 
         except Exception as e:
             return f"Error al crear la reserva: {str(e)}"
         finally:
-            conexion.close()
+            ConexionBD.liberar(conexion)
+
+    QUERY_HORARIO_RECURSO = registrar(
+        "horario_recurso", "SELECT Horario_Disponibilidad FROM Recurso WHERE Id_Recurso = %s"
+    )
+
+    # Valida usuario, recurso y choque de horario e inserta en un solo viaje a la base de datos.
+    # El ON CONFLICT usa el índice único parcial sobre reservas no canceladas. Las de días
+    # posteriores se crean como Futura y el barrido las pasa a Vigente cuando llega su día.
+    QUERY_CREAR_RESERVA = registrar("crear_reserva", """
+    WITH usuario_valido AS (
+        SELECT ID_Usuario FROM Usuario WHERE ID_Usuario = %(id_usuario)s
+    ),
+    recurso_valido AS (
+        SELECT Id_Recurso, Horario_Disponibilidad, Estado FROM Recurso WHERE Id_Recurso = %(id_recurso)s
+    ),
+    nueva AS (
+        INSERT INTO Reserva (ID_Usuario, ID_Recurso, Fecha_Reserva, Hora_Reserva, Estado)
+        SELECT u.ID_Usuario, r.Id_Recurso, %(fecha_reserva)s::date, %(hora_reserva)s::time,
+               CASE WHEN %(fecha_reserva)s::date > CURRENT_DATE THEN 'Futura' ELSE 'Vigente' END
+        FROM usuario_valido u, recurso_valido r
+        WHERE r.Estado IN ('Disponible', 'Prestado')
+          AND r.Horario_Disponibilidad IS NOT DISTINCT FROM %(horario)s
+        ON CONFLICT (ID_Recurso, Fecha_Reserva, Hora_Reserva) WHERE Estado <> 'Cancelada' DO NOTHING
+        RETURNING ID_Reserva
+    )
+    SELECT (SELECT ID_Reserva FROM nueva),
+           EXISTS (SELECT 1 FROM usuario_valido),
+           r.Id_Recurso IS NOT NULL,
+           r.Estado,
+           r.Horario_Disponibilidad
+    FROM (SELECT 1) AS fila
+    LEFT JOIN recurso_valido r ON TRUE
+    """)
 
     @staticmethod
-    def validarHorarioDisponible(horario_disponibilidad, hora_reserva):
+    @medirBD
+    def crearReservasLote(id_usuario, id_recurso, fechas, hora_reserva):
         """
-        Verifica si la hora de la reserva está dentro del horario de disponibilidad.
-        Formato esperado del horario: 'Lunes a Viernes 07:00-19:00'
+        Crea reservas del mismo recurso y hora en varias fechas con un solo INSERT.
+
+        Retorna una lista con el resultado de cada fecha:
+        {"fecha_reserva", "resultado": creada | conflicto | fuera_de_horario |
+        fecha_pasada | duplicada, "id_reserva"}, o un mensaje de error si el
+        usuario o el recurso no son válidos.
         """
-        import re
-        match = re.search(r'(\d{2}:\d{2})-(\d{2}:\d{2})', horario_disponibilidad)
-        if match:
-            hora_inicio, hora_fin = match.groups()
-            return hora_inicio <= hora_reserva.strftime("%H:%M") <= hora_fin
-        return False
+        conexion = ConexionBD.conectar()
+        if not conexion:
+            return "Error al conectar con la base de datos."
+
+        try:
+            conexion.autocommit = True
+            cursor = conexion.cursor()
+
+            horario = horarioEnCache(id_recurso)
+            if horario is None:
+                ConexionBD.QUERY_HORARIO_RECURSO.ejecutar(cursor, (id_recurso,))
+                recurso = cursor.fetchone()
+                if not recurso:
+                    return "El recurso no existe."
+                horario = obtenerHorario(id_recurso, recurso[0])
+
+            hoy = date.today()
+            for _ in range(2):
+                resultados = {}
+                validas = []
+                for fecha in fechas:
+                    if fecha in resultados:
+                        continue
+                    if fecha < hoy:
+                        resultados[fecha] = "fecha_pasada"
+                    elif not horario.abierto(fecha, hora_reserva):
+                        resultados[fecha] = "fuera_de_horario"
+                    else:
+                        resultados[fecha] = "conflicto"  # Hasta que el INSERT confirme lo contrario
+                        validas.append(fecha)
+
+                creadas = {}
+                if validas:
+                    ConexionBD.QUERY_CREAR_RESERVAS_LOTE.ejecutar(cursor, {
+                        "id_usuario": id_usuario,
+                        "id_recurso": id_recurso,
+                        "fechas": validas,
+                        "hora_reserva": hora_reserva,
+                        "horario": horario.texto,
+                    })
+                    fechas_creadas, ids_creados, usuario_existe, recurso_existe, estado_recurso, horario_actual = cursor.fetchone()
+
+                    if not usuario_existe:
+                        return "El usuario no está registrado."
+                    if not recurso_existe:
+                        return "El recurso no existe."
+                    if estado_recurso not in ConexionBD.ESTADOS_RESERVABLES:
+                        return "El recurso no está disponible."
+                    if horario_actual != horario.texto:
+                        # El horario cambió desde que se guardó en caché: se valida de nuevo
+                        horario = obtenerHorario(id_recurso, horario_actual)
+                        continue
+                    creadas = dict(zip(fechas_creadas or [], ids_creados or []))
+                    ConexionBD.invalidarDisponibilidad(*creadas)
+
+                vistas = set()
+                detalle = []
+                for fecha in fechas:
+                    if fecha in vistas:
+                        detalle.append({"fecha_reserva": fecha, "resultado": "duplicada", "id_reserva": None})
+                        continue
+                    vistas.add(fecha)
+                    if fecha in creadas:
+                        detalle.append({"fecha_reserva": fecha, "resultado": "creada", "id_reserva": creadas[fecha]})
+                    else:
+                        detalle.append({"fecha_reserva": fecha, "resultado": resultados[fecha], "id_reserva": None})
+                return detalle
+
+            return "El horario del recurso cambió durante la reserva, intenta de nuevo."
+
+        except Exception as e:
+            return f"Error al crear las reservas: {str(e)}"
+        finally:
+            ConexionBD.liberar(conexion)
+
+    # Igual que QUERY_CREAR_RESERVA pero para un arreglo de fechas; las que chocan se omiten
+    QUERY_CREAR_RESERVAS_LOTE = registrar("crear_reservas_lote", """
+    WITH usuario_valido AS (
+        SELECT ID_Usuario FROM Usuario WHERE ID_Usuario = %(id_usuario)s
+    ),
+    recurso_valido AS (
+        SELECT Id_Recurso, Horario_Disponibilidad, Estado FROM Recurso WHERE Id_Recurso = %(id_recurso)s
+    ),
+    nuevas AS (
+        INSERT INTO Reserva (ID_Usuario, ID_Recurso, Fecha_Reserva, Hora_Reserva, Estado)
+        SELECT u.ID_Usuario, r.Id_Recurso, f.fecha, %(hora_reserva)s::time,
+               CASE WHEN f.fecha > CURRENT_DATE THEN 'Futura' ELSE 'Vigente' END
+        FROM unnest(%(fechas)s::date[]) AS f(fecha), usuario_valido u, recurso_valido r
+        WHERE r.Estado IN ('Disponible', 'Prestado')
+          AND r.Horario_Disponibilidad IS NOT DISTINCT FROM %(horario)s
+        ON CONFLICT (ID_Recurso, Fecha_Reserva, Hora_Reserva) WHERE Estado <> 'Cancelada' DO NOTHING
+        RETURNING Fecha_Reserva, ID_Reserva
+    )
+    SELECT (SELECT array_agg(Fecha_Reserva) FROM nuevas),
+           (SELECT array_agg(ID_Reserva) FROM nuevas),
+           EXISTS (SELECT 1 FROM usuario_valido),
+           r.Id_Recurso IS NOT NULL,
+           r.Estado,
+           r.Horario_Disponibilidad
+    FROM (SELECT 1) AS fila
+    LEFT JOIN recurso_valido r ON TRUE
+    """)
+
     @staticmethod
+    @medirBD
     def detallesReserva(idReserva=None):
         """
         Consultar una o todas las reservas.
@@ -404,20 +1259,24 @@ class ConexionBD:
             query = "SELECT id_usuario, id_recurso, fecha_reserva, hora_reserva, estado FROM reserva"
             params = []
             if idReserva:
-                query += " WHERE idreserva = %s"
+                query += " WHERE id_reserva = %s"
                 params.append(idReserva)
             cursor.execute(query, params)
             result = cursor.fetchall()
             return result
         except Exception as e:
-            print("Error al consultar las reservas:", e)
+            logger.error("Error al consultar las reservas: %s", e)
         finally:
-            conexion.close()
+            ConexionBD.liberar(conexion)
+
+    RESERVA_PRESTADA = "La reserva tiene un préstamo abierto; registra primero la devolución."
 
     @staticmethod
+    @medirBD
     def actualizarReserva(idReserva, estado=None, detalles=None):
         """
-        Actualizar el estado o los detalles de una reserva.
+        Actualizar el estado o los detalles de una reserva. No cambia el estado
+        de una reserva Prestada: retorna RESERVA_PRESTADA.
         """
         conexion = ConexionBD.conectar()
         if not conexion:
@@ -427,6 +1286,8 @@ class ConexionBD:
             query = "UPDATE reserva SET "
             params = []
             updates = []
+            # Una reserva prestada solo cambia de estado con la devolución
+            condicion = " AND estado <> 'Prestada'" if estado else ""
 
             if estado:
                 updates.append("estado = %s")
@@ -438,18 +1299,29 @@ class ConexionBD:
             if not updates:
                 return "Nada que actualizar"
 
-            query += ", ".join(updates) + " WHERE idreserva = %s"
+            query += ", ".join(updates) + " WHERE id_reserva = %s" + condicion + " RETURNING fecha_reserva"
             params.append(idReserva)
 
             cursor.execute(query, params)
+            actualizada = cursor.fetchone()
             conexion.commit()
+            if not actualizada:
+                if condicion:
+                    cursor.execute("SELECT estado FROM reserva WHERE id_reserva = %s", (idReserva,))
+                    actual = cursor.fetchone()
+                    conexion.commit()
+                    if actual and actual[0] == 'Prestada':
+                        return ConexionBD.RESERVA_PRESTADA
+                return None
+            ConexionBD.invalidarDisponibilidad(actualizada[0])
             return "Reserva actualizada correctamente"
         except Exception as e:
-            print("Error al actualizar la reserva:", e)
+            logger.error("Error al actualizar la reserva: %s", e)
         finally:
-            conexion.close()
+            ConexionBD.liberar(conexion)
 
     @staticmethod
+    @medirBD
     def eliminarReserva(idReserva):
         """
         Eliminar una reserva de la base de datos.
@@ -459,364 +1331,977 @@ class ConexionBD:
             return None
         try:
             cursor = conexion.cursor()
-            query = "DELETE FROM reserva WHERE idreserva = %s"
+            query = "DELETE FROM reserva WHERE id_reserva = %s RETURNING fecha_reserva"
             cursor.execute(query, (idReserva,))
+            eliminada = cursor.fetchone()
             conexion.commit()
+            if eliminada:
+                ConexionBD.invalidarDisponibilidad(eliminada[0])
             return "Reserva eliminada exitosamente"
         except Exception as e:
-            print("Error al eliminar la reserva:", e)
+            logger.error("Error al eliminar la reserva: %s", e)
         finally:
-            conexion.close()    
+            ConexionBD.liberar(conexion)    
             
+    LLAVE_BARRIDO = 7302  # pg_try_advisory_xact_lock: un solo proceso barre las reservas por vez
+    RESERVA_TOLERANCIA_MINUTOS = int(os.getenv("RESERVA_TOLERANCIA_MINUTOS", str(DURACION_FRANJA)))
+
     @staticmethod
-    def consultarRecursos(tipo_recurso=None, estado=None, nombre_recurso=None, orden=None, horario_disponibilidad=None):
+    @medirBD
+    def transicionarReservas(ahora, limite=500):
+        """
+        Actualiza en bloque el estado de las reservas según la fecha y hora `ahora`:
+
+        - Vigente o Futura sin préstamo, pasada la tolerancia desde su inicio -> Pasado.
+        - Futura cuyo día ya llegó -> Vigente.
+
+        Cada transición cambia como mucho `limite` reservas. Solo actúa el proceso
+        que obtiene el advisory lock; los demás retornan None sin hacer nada.
+        Retorna {"pasadas", "vigentes", "pendientes"}, donde
+        `pendientes` indica que algún lote se llenó y conviene repetir pronto.
+        """
         conexion = ConexionBD.conectar()
         if not conexion:
-            return []
+            return "Error al conectar con la base de datos."
         try:
             cursor = conexion.cursor()
+            cursor.execute("SELECT pg_try_advisory_xact_lock(%s)", (ConexionBD.LLAVE_BARRIDO,))
+            if not cursor.fetchone()[0]:
+                return None
 
-            # Consulta base con JOIN para relacionar recurso y tipo_recurso
-            query = """
-            SELECT recurso.id_Recurso, recurso.nombre, tipo_recurso.nombre AS Tipo, recurso.horario_disponibilidad, recurso.estado
-            FROM recurso
-            JOIN tipo_recurso ON recurso.id_tipo_recurso = tipo_recurso.id_tipo_recurso
-            WHERE 1=1
-            """
-            filtros = []
-            parametros = []
+            vencimiento = ahora - timedelta(minutes=ConexionBD.RESERVA_TOLERANCIA_MINUTOS)
+            parametros = {
+                "hoy": ahora.date(),
+                "fecha_vencimiento": vencimiento.date(),
+                "hora_vencimiento": vencimiento.time(),
+                "limite": limite,
+            }
+            resultado = {}
+            for clave, estado, query in ConexionBD.TRANSICIONES_RESERVAS:
+                cursor.execute(query, parametros)
+                resultado[clave] = cursor.rowcount
+                if cursor.rowcount:
+                    transiciones_reservas.incrementar(estado, cantidad=cursor.rowcount)
+            conexion.commit()
+            resultado["pendientes"] = any(resultado[clave] >= limite for clave, _, _ in ConexionBD.TRANSICIONES_RESERVAS)
+            return resultado
+        except Exception as e:
+            return f"Error al actualizar los estados de las reservas: {str(e)}"
+        finally:
+            ConexionBD.liberar(conexion)
+
+    # (clave del resultado, estado nuevo, sentencia). Cada lote se toma con SKIP LOCKED
+    # para no esperar a las reservas que otra transacción está modificando.
+    TRANSICIONES_RESERVAS = (
+        ("pasadas", "Pasado", """
+        UPDATE Reserva r SET Estado = 'Pasado'
+        FROM (
+            SELECT r2.ID_Reserva FROM Reserva r2
+            WHERE r2.Estado IN ('Vigente', 'Futura')
+              AND (r2.Fecha_Reserva, r2.Hora_Reserva) < (%(fecha_vencimiento)s::date, %(hora_vencimiento)s::time)
+              AND NOT EXISTS (SELECT 1 FROM Prestamo p WHERE p.ID_Reserva = r2.ID_Reserva)
+            ORDER BY r2.Fecha_Reserva, r2.Hora_Reserva
+            LIMIT %(limite)s
+            FOR UPDATE SKIP LOCKED
+        ) lote
+        WHERE r.ID_Reserva = lote.ID_Reserva
+        """),
+        ("vigentes", "Vigente", """
+        UPDATE Reserva r SET Estado = 'Vigente'
+        FROM (
+            SELECT r2.ID_Reserva FROM Reserva r2
+            WHERE r2.Estado = 'Futura' AND r2.Fecha_Reserva <= %(hoy)s::date
+            ORDER BY r2.Fecha_Reserva, r2.Hora_Reserva
+            LIMIT %(limite)s
+            FOR UPDATE SKIP LOCKED
+        ) lote
+        WHERE r.ID_Reserva = lote.ID_Reserva
+        """),
+    )
 
-            # Filtros dinámicos según los criterios proporcionados
-            if tipo_recurso:
-                filtros.append("tipo_recurso.nombre = %s")
-                parametros.append(tipo_recurso)
+    @staticmethod
+    @medirBD
+    def refrescarEstadisticas(limite=1000):
+        """
+        Recalcula en Estadistica_Recurso_Dia hasta `limite` de los (recurso, día)
+        que los triggers marcaron en Estadistica_Pendiente. Los marcados se toman
+        con SKIP LOCKED, así varios procesos pueden refrescar a la vez sin pisarse,
+        y se saltan las marcas que una transacción en curso acaba de actualizar
+        (migración 0007): se recalculan cuando confirme.
+        Retorna la cantidad de días recalculados.
+        """
+        conexion = ConexionBD.conectar()
+        if not conexion:
+            return "Error al conectar con la base de datos."
+        try:
+            cursor = conexion.cursor()
+            ConexionBD.QUERY_REFRESCAR_ESTADISTICAS.ejecutar(cursor, (limite,))
+            recalculados = cursor.rowcount
+            conexion.commit()
+            if recalculados:
+                estadisticas_recalculadas.incrementar(cantidad=recalculados)
+            return recalculados
+        except Exception as e:
+            return f"Error al refrescar las estadísticas de uso: {str(e)}"
+        finally:
+            ConexionBD.liberar(conexion)
+
+    # Solo lee las reservas de los días marcados (índice reserva_recurso_fecha), sin
+    # importar el tamaño del historial. Los minutos de préstamo son los de los préstamos devueltos.
+    QUERY_REFRESCAR_ESTADISTICAS = registrar("refrescar_estadisticas", """
+    WITH marcados AS (
+        DELETE FROM Estadistica_Pendiente ep
+        USING (
+            SELECT ID_Recurso, Fecha, Cambios FROM Estadistica_Pendiente
+            LIMIT %s
+            FOR UPDATE SKIP LOCKED
+        ) lote
+        WHERE ep.ID_Recurso = lote.ID_Recurso AND ep.Fecha = lote.Fecha AND ep.Cambios = lote.Cambios
+        RETURNING ep.ID_Recurso, ep.Fecha
+    )
+    INSERT INTO Estadistica_Recurso_Dia (
+        ID_Recurso, Fecha, Reservas, Canceladas, No_Asistidas, Finalizadas,
+        Prestamos, Devoluciones, Minutos_Prestamo
+    )
+    SELECT m.ID_Recurso, m.Fecha,
+           COUNT(DISTINCT r.ID_Reserva),
+           COUNT(DISTINCT r.ID_Reserva) FILTER (WHERE r.Estado = 'Cancelada'),
+           COUNT(DISTINCT r.ID_Reserva) FILTER (WHERE r.Estado = 'Pasado'),
+           COUNT(DISTINCT r.ID_Reserva) FILTER (WHERE r.Estado = 'Finalizada'),
+           COUNT(DISTINCT p.ID_Prestamo),
+           COUNT(d.ID_Devolucion),
+           COALESCE(SUM(GREATEST(0, EXTRACT(EPOCH FROM
+               (d.Fecha_Devolucion + d.Hora_Devolucion) - (p.Fecha_Prestamo + p.Hora_Prestamo)
+           ) / 60)), 0)::bigint
+    FROM marcados m
+    LEFT JOIN Reserva r ON r.ID_Recurso = m.ID_Recurso AND r.Fecha_Reserva = m.Fecha
+    LEFT JOIN Prestamo p ON p.ID_Reserva = r.ID_Reserva
+    LEFT JOIN Devolucion d ON d.ID_Prestamo = p.ID_Prestamo
+    GROUP BY m.ID_Recurso, m.Fecha
+    ON CONFLICT (ID_Recurso, Fecha) DO UPDATE SET
+        Reservas = EXCLUDED.Reservas,
+        Canceladas = EXCLUDED.Canceladas,
+        No_Asistidas = EXCLUDED.No_Asistidas,
+        Finalizadas = EXCLUDED.Finalizadas,
+        Prestamos = EXCLUDED.Prestamos,
+        Devoluciones = EXCLUDED.Devoluciones,
+        Minutos_Prestamo = EXCLUDED.Minutos_Prestamo
+    """)
 
-            if estado:
-                filtros.append("recurso.estado = %s")
-                parametros.append(estado)
+    @staticmethod
+    @medirBD
+    def reporteUso(fecha_inicio, fecha_fin, agrupacion="dia", id_recurso=None, tipo_recurso=None):
+        """
+        Retorna las cifras de uso por recurso y por día o semana entre `fecha_inicio`
+        y `fecha_fin`: reservas, canceladas, no asistidas, préstamos, duración
+        promedio de los préstamos y tasa de no asistencia. Lee solo las estadísticas
+        agregadas, que van unos segundos detrás de las reservas.
+        """
+        constructor = ConexionBD.REPORTES_USO.get(agrupacion)
+        if constructor is None:
+            return f"Agrupación no válida: {agrupacion}. Opciones: {', '.join(ConexionBD.REPORTES_USO)}"
 
-            if nombre_recurso:
-                filtros.append("recurso.nombre ILIKE %s")
-                parametros.append(f"%{nombre_recurso}%")
+        conexion = ConexionBD.conectarLectura()
+        if not conexion:
+            return "Error al conectar con la base de datos."
+        try:
+            consulta, parametros = constructor.preparar({
+                "rango": (fecha_inicio, fecha_fin),
+                "id_recurso": id_recurso,
+                "tipo_recurso": tipo_recurso,
+            })
+            cursor = conexion.cursor()
+            consulta.ejecutar(cursor, parametros)
+            return [dict(zip(ConexionBD.COLUMNAS_REPORTE_USO, fila)) for fila in cursor.fetchall()]
+        except Exception as e:
+            return f"Error al consultar el reporte de uso: {str(e)}"
+        finally:
+            ConexionBD.liberar(conexion)
+
+    COLUMNAS_REPORTE_USO = (
+        "periodo", "id_recurso", "nombre_recurso", "tipo_recurso", "reservas", "canceladas",
+        "no_asistidas", "finalizadas", "prestamos", "devoluciones",
+        "minutos_prestamo_promedio", "tasa_no_asistencia",
+    )
 
-            if horario_disponibilidad:
-                filtros.append("recurso.horario_disponibilidad ILIKE %s")
-                parametros.append(f"%{horario_disponibilidad}%")
+    @staticmethod
+    def _reporteUso(nombre, periodo):
+        return ConstructorConsulta(
+            nombre,
+            f"""
+            SELECT {periodo} AS periodo, e.ID_Recurso, rec.Nombre, tr.Nombre,
+                   SUM(e.Reservas), SUM(e.Canceladas), SUM(e.No_Asistidas), SUM(e.Finalizadas),
+                   SUM(e.Prestamos), SUM(e.Devoluciones),
+                   (SUM(e.Minutos_Prestamo) / NULLIF(SUM(e.Devoluciones), 0))::float8,
+                   (SUM(e.No_Asistidas)::float8 / NULLIF(SUM(e.Reservas) - SUM(e.Canceladas), 0))
+            FROM Estadistica_Recurso_Dia e
+            JOIN Recurso rec ON rec.ID_Recurso = e.ID_Recurso
+            JOIN Tipo_Recurso tr ON tr.ID_Tipo_Recurso = rec.ID_Tipo_Recurso
+            """,
+            {
+                "rango": "e.Fecha BETWEEN %s AND %s",
+                "id_recurso": "e.ID_Recurso = %s",
+                "tipo_recurso": "tr.Nombre = %s",
+            },
+            agrupacion=f"{periodo}, e.ID_Recurso, rec.Nombre, tr.Nombre",
+            orden_defecto="periodo, e.ID_Recurso",
+        )
+
+    REPORTES_USO = {
+        "dia": _reporteUso("reporte_uso_dia", "e.Fecha"),
+        "semana": _reporteUso("reporte_uso_semana", "date_trunc('week', e.Fecha)::date"),
+    }
 
-            # Aplicar los filtros dinámicamente
-            if filtros:
-                query += " AND " + " AND ".join(filtros)
+    @staticmethod
+    @medirBD
+    def consultarRecursos(tipo_recurso=None, estado=None, nombre_recurso=None, orden=None, horario_disponibilidad=None):
+        clave = ("consultarRecursos", tipo_recurso, estado, nombre_recurso, horario_disponibilidad, orden)
+        recursos = ConexionBD.cache_recursos.obtener(clave)
+        if recursos is not None:
+            return recursos
+        version = ConexionBD.cache_recursos.version
 
-            # Ordenamiento dinámico
-            if orden:
-                query += f" ORDER BY {orden}"
+        conexion = ConexionBD.conectarLectura(ConexionBD.cache_recursos.invalidada_en)
+        if not conexion:
+            return []
+        try:
+            cursor = conexion.cursor()
 
-            cursor.execute(query, parametros)
+            # Filtros y orden de listas blancas: cada combinación es una sentencia preparada
+            consulta, parametros = ConexionBD.CONSULTA_RECURSOS.preparar({
+                "tipo_recurso": tipo_recurso or None,
+                "estado": estado or None,
+                "nombre_recurso": f"%{nombre_recurso}%" if nombre_recurso else None,
+                "horario_disponibilidad": f"%{horario_disponibilidad}%" if horario_disponibilidad else None,
+            }, orden)
+            consulta.ejecutar(cursor, parametros)
             resultados = cursor.fetchall()
 
             # Convertir el resultado a una lista de diccionarios
             recursos = [{"id_recurso": r[0], "nombre": r[1], "tipo_recurso": r[2], "horario_disponibilidad": r[3], "estado": r[4]} for r in resultados]
+            ConexionBD.cache_recursos.guardar(clave, recursos, version)
             return recursos
+        except ValueError as e:
+            return str(e)
         except Exception as e:
             return f"Error al consultar recursos: {str(e)}"
         finally:
-            conexion.close()
+            ConexionBD.liberar(conexion)
+
+    # Consulta base con JOIN para relacionar recurso y tipo_recurso
+    CONSULTA_RECURSOS = ConstructorConsulta(
+        "recursos",
+        """
+        SELECT recurso.id_Recurso, recurso.nombre, tipo_recurso.nombre AS Tipo, recurso.horario_disponibilidad, recurso.estado
+        FROM recurso
+        JOIN tipo_recurso ON recurso.id_tipo_recurso = tipo_recurso.id_tipo_recurso
+        """,
+        {
+            "tipo_recurso": "tipo_recurso.nombre = %s",
+            "estado": "recurso.estado = %s",
+            "nombre_recurso": "recurso.nombre ILIKE %s",
+            "horario_disponibilidad": "recurso.horario_disponibilidad ILIKE %s",
+        },
+        ordenes={
+            "id_recurso": "recurso.id_recurso",
+            "nombre": "recurso.nombre",
+            "tipo": "tipo_recurso.nombre",
+            "tipo_recurso": "tipo_recurso.nombre",
+            "horario_disponibilidad": "recurso.horario_disponibilidad",
+            "estado": "recurso.estado",
+        },
+    )
             
     @staticmethod
-    def consultarReservas(nombre_usuario= None,estado= None,tipo_filtro = None,fecha_inicio = None,fecha_fin = None):
+    @medirBD
+    def consultarReservas(nombre_usuario= None,estado= None,tipo_filtro = None,fecha_inicio = None,fecha_fin = None,
+                          limite=100, cursor_pagina=None, con_total=False):
         """
-        Consulta las reservas de un usuario con diferentes filtros.
-        
+        Consulta las reservas de un usuario con diferentes filtros, por páginas.
+
+        Retorna {"datos": [...], "siguiente_cursor": str | None, "total": int | None}.
+        Las páginas siguen el orden fecha DESC, hora DESC, id DESC, así que son
+        estables aunque se inserten reservas mientras se recorren.
         """
-        conexion = ConexionBD.conectar()
+        conexion = ConexionBD.conectarLectura()
         if not conexion:
             return "Error al conectar con la base de datos."
         
         try:
             cursor = conexion.cursor()
             
-            # Construimos la consulta base
-            query = """
-            SELECT r.id_reserva, r.fecha_reserva, r.hora_reserva, r.estado,
-                u.nombre as nombre_usuario,
-                rec.nombre as nombre_recurso
-            FROM reserva r
-            JOIN usuario u ON r.id_usuario = u.id_usuario
-            JOIN recurso rec ON r.id_recurso = rec.id_recurso
-            WHERE 1=1
-            """
-            params = []
-            
-            # Añadimos filtros según el tipo solicitado
-           
-            if tipo_filtro == 'Vigentes':
-                query += " AND r.estado = %s"
-                params.append('Vigente')
-            elif tipo_filtro == 'Pasadas':
-                query += " AND r.estado = %s"
-                params.append('Pasado')
-            elif tipo_filtro == 'Futuras':
-                query += " AND r.estado = %s"
-                params.append('Futura')
-            
-            # Añadimos filtro por rango de fechas si se especifica
-            
-          
-            if nombre_usuario:
-                query += " AND u.nombre ILIKE %s"
-                params.append(f'%{nombre_usuario}%')
-            if fecha_inicio:
-                query += " AND r.fecha_reserva >= %s"
-                params.append(fecha_inicio)
-            if fecha_fin:
-                query += " AND r.fecha_reserva <= %s"
-                params.append(fecha_fin)
-            
-            # Ordenamos por fecha y hora
-            query += " ORDER BY r.fecha_reserva DESC, r.hora_reserva DESC"
-            
-            cursor.execute(query, params)
+            # Filtro por tipo: estado de la reserva
+            estados = {'Vigentes': 'Vigente', 'Pasadas': 'Pasado', 'Futuras': 'Futura'}
+            filtros = {
+                "estado": estados.get(tipo_filtro),
+                "nombre_usuario": f'%{nombre_usuario}%' if nombre_usuario else None,
+                "fecha_inicio": fecha_inicio,
+                "fecha_fin": fecha_fin,
+            }
+
+            total = None
+            if con_total:
+                consulta, params = ConexionBD.CONTEO_RESERVAS.preparar(filtros)
+                consulta.ejecutar(cursor, params)
+                total = cursor.fetchone()[0]
+
+            # Continuamos después de la última reserva de la página anterior
+            if cursor_pagina:
+                filtros["despues_de"] = tuple(ConexionBD.decodificarCursor(cursor_pagina, 3))
+
+            # Ordenamos por fecha y hora (el id desempata reservas simultáneas)
+            consulta, params = ConexionBD.PAGINA_RESERVAS.preparar(filtros, extra=(limite + 1,))
+            consulta.ejecutar(cursor, params)
             reservas = cursor.fetchall()
+
+            siguiente = None
+            if len(reservas) > limite:
+                reservas = reservas[:limite]
+                ultima = reservas[-1]
+                siguiente = ConexionBD.codificarCursor([ultima[1].isoformat(), ultima[2].isoformat(), ultima[0]])
             
-            # Convertimos los resultados a un formato más amigable
-            resultado = []
-            for reserva in reservas:
-                resultado.append({
-                    "id_reserva": reserva[0],
-                    "fecha_reserva": reserva[1].strftime('%Y-%m-%d'),
-                    "hora_reserva": reserva[2],
-                    "estado": reserva[3],
-                    "nombre_usuario": reserva[4],
-                    "nombre_recurso": reserva[5]
-                })
+            # Las fechas y horas se dejan como date/time: el endpoint las serializa con orjson
+            resultado = [dict(zip(ConexionBD.COLUMNAS_RESERVAS, reserva)) for reserva in reservas]
             
-            return resultado
+            return {"datos": resultado, "siguiente_cursor": siguiente, "total": total}
             
+        except ValueError as e:
+            return str(e)
         except Exception as e:
             return f"Error al consultar las reservas: {str(e)}"
         finally:
-            conexion.close()
+            ConexionBD.liberar(conexion)
+
+    COLUMNAS_RESERVAS = ("id_reserva", "fecha_reserva", "hora_reserva", "estado", "nombre_usuario", "nombre_recurso")
+    FILTROS_RESERVAS = {
+        "estado": "r.estado = %s",
+        "nombre_usuario": "u.nombre ILIKE %s",
+        "fecha_inicio": "r.fecha_reserva >= %s",
+        "fecha_fin": "r.fecha_reserva <= %s",
+        "despues_de": "(r.fecha_reserva, r.hora_reserva, r.id_reserva) < (%s::date, %s::time, %s)",
+    }
+    PAGINA_RESERVAS = ConstructorConsulta(
+        "pagina_reservas",
+        """
+        SELECT r.id_reserva, r.fecha_reserva, r.hora_reserva, r.estado,
+            u.nombre as nombre_usuario,
+            rec.nombre as nombre_recurso
+        FROM reserva r
+        JOIN usuario u ON r.id_usuario = u.id_usuario
+        JOIN recurso rec ON r.id_recurso = rec.id_recurso
+        """,
+        FILTROS_RESERVAS,
+        orden_defecto="r.fecha_reserva DESC, r.hora_reserva DESC, r.id_reserva DESC",
+        sufijo="LIMIT %s",
+    )
+    CONTEO_RESERVAS = ConstructorConsulta(
+        "conteo_reservas",
+        """
+        SELECT COUNT(*)
+        FROM reserva r
+        JOIN usuario u ON r.id_usuario = u.id_usuario
+        """,
+        FILTROS_RESERVAS,
+    )
 
     @staticmethod
+    @medirBD
     def consultarReservasVigentes(id_usuario):
         """
-        Retorna las reservas vigentes de un usuario, incluyendo el nombre del recurso.
+        Retorna las reservas vigentes y futuras de un usuario, incluyendo el nombre del recurso.
         """
-        conexion = ConexionBD.conectar()
+        conexion = ConexionBD.conectarLectura()
         if not conexion:
             return "Error al conectar con la base de datos."
         
         try:
             cursor = conexion.cursor()
-            query = """
-            SELECT 
-                r.ID_Reserva, 
-                r.Fecha_Reserva, 
-                r.Hora_Reserva, 
-                r.Estado, 
-                r.ID_Recurso, 
-                rec.Nombre AS Nombre_Recurso
-            FROM Reserva r
-            JOIN Recurso rec ON r.ID_Recurso = rec.ID_Recurso
-            WHERE r.ID_Usuario = %s AND r.Estado = 'Vigente'
-            """
-            cursor.execute(query, (id_usuario,))
+            ConexionBD.QUERY_RESERVAS_VIGENTES.ejecutar(cursor, (id_usuario,))
             reservas = cursor.fetchall()
             
             if not reservas:
                 return "No hay reservas vigentes para este usuario."
             
-            # Formatear los resultados
-            resultado = [
-                {
-                    "id_reserva": r[0],
-                    "fecha_reserva": str(r[1]),
-                    "hora_reserva": str(r[2]),
-                    "estado": r[3],
-                    "id_recurso": r[4],
-                    "nombre_recurso": r[5]  # Incluimos el nombre del recurso
-                }
-                for r in reservas
-            ]
-            return resultado
+            # Incluimos el nombre del recurso; fechas y horas se serializan en el endpoint
+            return [dict(zip(ConexionBD.COLUMNAS_RESERVAS_VIGENTES, r)) for r in reservas]
         
         except Exception as e:
             return f"Error al consultar reservas vigentes: {str(e)}"
         
         finally:
-            conexion.close()
+            ConexionBD.liberar(conexion)
+
+    COLUMNAS_RESERVAS_VIGENTES = ("id_reserva", "fecha_reserva", "hora_reserva", "estado", "id_recurso", "nombre_recurso")
+    QUERY_RESERVAS_VIGENTES = registrar("reservas_vigentes", """
+    SELECT 
+        r.ID_Reserva, 
+        r.Fecha_Reserva, 
+        r.Hora_Reserva, 
+        r.Estado, 
+        r.ID_Recurso, 
+        rec.Nombre AS Nombre_Recurso
+    FROM Reserva r
+    JOIN Recurso rec ON r.ID_Recurso = rec.ID_Recurso
+    WHERE r.ID_Usuario = %s AND r.Estado IN ('Vigente', 'Futura')
+    """)
 
     @staticmethod
+    @medirBD
     def registrarPrestamo(id_reserva, id_empleado, fecha_prestamo, hora_prestamo):
         """
-        Registra un préstamo verificando que el empleado exista y que la reserva esté vigente.
+        Registra un préstamo en una sola sentencia: valida el empleado, pasa la
+        reserva de Vigente (o Futura) a Prestada, inserta el préstamo y marca el
+        recurso como Prestado. Dos préstamos simultáneos de la misma reserva no
+        pueden registrarse ambos porque solo uno la encuentra sin prestar.
         """
         conexion = ConexionBD.conectar()
         if not conexion:
             return "Error al conectar con la base de datos."
 
         try:
+            conexion.autocommit = True
             cursor = conexion.cursor()
-
-            # Validar que la reserva esté vigente
-            cursor.execute("SELECT Estado FROM Reserva WHERE ID_Reserva = %s", (id_reserva,))
-            reserva = cursor.fetchone()
-            if not reserva:
+            ConexionBD.QUERY_REGISTRAR_PRESTAMO.ejecutar(cursor, {
+                "id_reserva": id_reserva,
+                "id_empleado": id_empleado,
+                "fecha_prestamo": fecha_prestamo,
+                "hora_prestamo": hora_prestamo,
+            })
+            id_prestamo, estado_reserva, empleado_existe, recurso_cambiado = cursor.fetchone()
+
+            if id_prestamo:
+                if recurso_cambiado:
+                    ConexionBD.invalidarCacheRecursos()
+                return "Préstamo registrado exitosamente."
+            if estado_reserva is None:
                 return "La reserva no existe."
-            if reserva[0] != "Vigente":
-                return "La reserva no está vigente."
-
-            # Validar que el empleado exista
-            cursor.execute("SELECT ID_Empleado FROM Empleado WHERE ID_Empleado = %s", (id_empleado,))
-            empleado = cursor.fetchone()
-            if not empleado:
+            if not empleado_existe:
                 return "El empleado no está registrado."
-
-            # Registrar el préstamo
-            query_prestamo = """
-            INSERT INTO Prestamo (ID_Reserva, ID_Empleado, Fecha_Prestamo, Hora_Prestamo)
-            VALUES (%s, %s, %s, %s)
-            """
-            cursor.execute(query_prestamo, (id_reserva, id_empleado, fecha_prestamo, hora_prestamo))
-            conexion.commit()
-
-            return "Préstamo registrado exitosamente."
+            return "La reserva no está vigente."
 
         except Exception as e:
             return f"Error al registrar el préstamo: {str(e)}"
         finally:
-            conexion.close()
+            ConexionBD.liberar(conexion)
+
+    # El UPDATE condicionado al estado Vigente o Futura es el que reserva la reserva para un solo préstamo
+    QUERY_REGISTRAR_PRESTAMO = registrar("registrar_prestamo", """
+    WITH empleado AS (
+        SELECT ID_Empleado FROM Empleado WHERE ID_Empleado = %(id_empleado)s
+    ),
+    reserva AS (
+        UPDATE Reserva r SET Estado = 'Prestada'
+        FROM empleado e
+        WHERE r.ID_Reserva = %(id_reserva)s AND r.Estado IN ('Vigente', 'Futura')
+        RETURNING r.ID_Reserva, r.ID_Recurso, e.ID_Empleado
+    ),
+    nuevo AS (
+        INSERT INTO Prestamo (ID_Reserva, ID_Empleado, Fecha_Prestamo, Hora_Prestamo)
+        SELECT r.ID_Reserva, r.ID_Empleado, %(fecha_prestamo)s::date, %(hora_prestamo)s::time
+        FROM reserva r
+        RETURNING ID_Prestamo
+    ),
+    recurso AS (
+        UPDATE Recurso rec SET Estado = 'Prestado'
+        FROM reserva r
+        WHERE rec.ID_Recurso = r.ID_Recurso AND rec.Estado = 'Disponible'
+        RETURNING rec.ID_Recurso
+    )
+    SELECT (SELECT ID_Prestamo FROM nuevo),
+           (SELECT Estado FROM Reserva WHERE ID_Reserva = %(id_reserva)s),
+           EXISTS (SELECT 1 FROM empleado),
+           EXISTS (SELECT 1 FROM recurso)
+    """)
 
     @staticmethod
+    @medirBD
     def consultarPrestamosVigentes(id_usuario):
         """
         Retorna los préstamos vigentes de un usuario.
         """
-        conexion = ConexionBD.conectar()
+        conexion = ConexionBD.conectarLectura()
         if not conexion:
             return "Error al conectar con la base de datos."
 
         try:
             cursor = conexion.cursor()
-            query = """
-            SELECT p.ID_Prestamo, p.Fecha_Prestamo, p.Hora_Prestamo, p.ID_Empleado, r.ID_Reserva, r.ID_Recurso
-            FROM Prestamo p
-            JOIN Reserva r ON p.ID_Reserva = r.ID_Reserva
-            WHERE r.ID_Usuario = %s
-            """
-            cursor.execute(query, (id_usuario,))
+            ConexionBD.QUERY_PRESTAMOS_VIGENTES.ejecutar(cursor, (id_usuario,))
             prestamos = cursor.fetchall()
 
             if not prestamos:
                 return "No hay préstamos vigentes para este usuario."
 
-            return [{"id_prestamo": p[0], "fecha_prestamo": str(p[1]), "hora_prestamo": str(p[2]), "id_empleado": p[3], "id_reserva": p[4], "id_recurso": p[5]} for p in prestamos]
+            return [dict(zip(ConexionBD.COLUMNAS_PRESTAMOS_VIGENTES, p)) for p in prestamos]
         except Exception as e:
             return f"Error al consultar préstamos vigentes: {str(e)}"
         finally:
-            conexion.close()
+            ConexionBD.liberar(conexion)
+
+    COLUMNAS_PRESTAMOS_VIGENTES = ("id_prestamo", "fecha_prestamo", "hora_prestamo", "id_empleado", "id_reserva", "id_recurso")
+    QUERY_PRESTAMOS_VIGENTES = registrar("prestamos_vigentes", """
+    SELECT p.ID_Prestamo, p.Fecha_Prestamo, p.Hora_Prestamo, p.ID_Empleado, r.ID_Reserva, r.ID_Recurso
+    FROM Prestamo p
+    JOIN Reserva r ON p.ID_Reserva = r.ID_Reserva
+    WHERE r.ID_Usuario = %s
+    """)
 
     @staticmethod
+    @medirBD
     def registrarDevolucion(id_prestamo, fecha_devolucion, hora_devolucion, id_empleado):
         """
-        Registra una devolución validando que el préstamo exista y que el empleado esté registrado.
+        Registra la devolución de un préstamo. Ver `registrarDevoluciones`.
+        """
+        resultado = ConexionBD.registrarDevoluciones([(id_prestamo, fecha_devolucion, hora_devolucion)], id_empleado)
+        if isinstance(resultado, str):
+            return resultado
+        detalle = resultado[0]
+        if detalle["resultado"] == "devuelto":
+            return "Devolución registrada exitosamente."
+        return ConexionBD.MENSAJES_DEVOLUCION[detalle["resultado"]]
+
+    MENSAJES_DEVOLUCION = {
+        "no_existe": "El préstamo no existe.",
+        "ya_devuelto": "El préstamo ya fue devuelto.",
+        "no_prestado": "La reserva del préstamo no está en préstamo.",
+    }
+
+    @staticmethod
+    @medirBD
+    def registrarDevoluciones(devoluciones, id_empleado):
+        """
+        Registra en una sola sentencia la devolución de varios préstamos
+        [(id_prestamo, fecha, hora)]: inserta cada devolución, pasa su reserva de
+        Prestada a Finalizada y deja Disponible el recurso que no tenga otros
+        préstamos abiertos.
+
+        Retorna una lista con el resultado de cada préstamo:
+        {"id_prestamo", "resultado": devuelto | no_existe | ya_devuelto |
+        no_prestado | duplicado, "id_devolucion"}, o un mensaje de error.
         """
         conexion = ConexionBD.conectar()
         if not conexion:
             return "Error al conectar con la base de datos."
 
         try:
+            unicas = {}
+            for id_prestamo, fecha, hora in devoluciones:
+                unicas.setdefault(id_prestamo, (fecha, hora))
+
+            conexion.autocommit = True
             cursor = conexion.cursor()
+            ConexionBD.QUERY_REGISTRAR_DEVOLUCIONES.ejecutar(cursor, {
+                "id_empleado": id_empleado,
+                "prestamos": list(unicas),
+                "fechas": [fecha for fecha, _ in unicas.values()],
+                "horas": [hora for _, hora in unicas.values()],
+            })
+            filas = cursor.fetchall()
+            if filas and not filas[0][4]:
+                return "El empleado no está registrado."
 
-            # Validar que el préstamo existe
-            cursor.execute("SELECT ID_Prestamo FROM Prestamo WHERE ID_Prestamo = %s", (id_prestamo,))
-            prestamo = cursor.fetchone()
-            if not prestamo:
-                return "El préstamo no existe."
+            resultados = {}
+            recursos_cambiados = False
+            for id_prestamo, id_devolucion, prestamo_existe, estado_reserva, _, recurso_cambiado in filas:
+                recursos_cambiados = recursos_cambiados or recurso_cambiado
+                if id_devolucion:
+                    resultados[id_prestamo] = ("devuelto", id_devolucion)
+                elif not prestamo_existe:
+                    resultados[id_prestamo] = ("no_existe", None)
+                elif estado_reserva == "Finalizada":
+                    resultados[id_prestamo] = ("ya_devuelto", None)
+                else:
+                    resultados[id_prestamo] = ("no_prestado", None)
+            if recursos_cambiados:
+                ConexionBD.invalidarCacheRecursos()
+
+            detalle = []
+            vistos = set()
+            for id_prestamo, _, _ in devoluciones:
+                if id_prestamo in vistos:
+                    detalle.append({"id_prestamo": id_prestamo, "resultado": "duplicado", "id_devolucion": None})
+                    continue
+                vistos.add(id_prestamo)
+                resultado, id_devolucion = resultados[id_prestamo]
+                detalle.append({"id_prestamo": id_prestamo, "resultado": resultado, "id_devolucion": id_devolucion})
+            return detalle
 
-            # Validar que el empleado esté registrado
-            cursor.execute("SELECT ID_Empleado FROM Empleado WHERE ID_Empleado = %s", (id_empleado,))
-            empleado = cursor.fetchone()
-            if not empleado:
-                return "El empleado no está registrado."
+        except Exception as e:
+            return f"Error al registrar la devolución: {str(e)}"
+        finally:
+            ConexionBD.liberar(conexion)
+
+    # Una fila por préstamo pedido. El estado de la reserva que se informa es el
+    # anterior a la sentencia, así se distingue un préstamo ya devuelto de uno no prestado.
+    QUERY_REGISTRAR_DEVOLUCIONES = registrar("registrar_devoluciones", """
+    WITH entrada AS (
+        SELECT * FROM unnest(%(prestamos)s::int[], %(fechas)s::date[], %(horas)s::time[])
+            AS e(id_prestamo, fecha, hora)
+    ),
+    empleado AS (
+        SELECT ID_Empleado FROM Empleado WHERE ID_Empleado = %(id_empleado)s
+    ),
+    reservas AS (
+        UPDATE Reserva r SET Estado = 'Finalizada'
+        FROM entrada e
+        JOIN Prestamo p ON p.ID_Prestamo = e.id_prestamo
+        WHERE r.ID_Reserva = p.ID_Reserva AND r.Estado = 'Prestada'
+          AND EXISTS (SELECT 1 FROM empleado)
+        RETURNING p.ID_Prestamo, r.ID_Reserva, r.ID_Recurso
+    ),
+    nuevas AS (
+        INSERT INTO Devolucion (ID_Prestamo, Fecha_Devolucion, Hora_Devolucion)
+        SELECT e.id_prestamo, e.fecha, e.hora
+        FROM entrada e
+        JOIN reservas r ON r.ID_Prestamo = e.id_prestamo
+        RETURNING ID_Prestamo, ID_Devolucion
+    ),
+    recursos AS (
+        UPDATE Recurso rec SET Estado = 'Disponible'
+        WHERE rec.ID_Recurso IN (SELECT ID_Recurso FROM reservas)
+          AND rec.Estado = 'Prestado'
+          AND NOT EXISTS (
+              SELECT 1 FROM Reserva o
+              WHERE o.ID_Recurso = rec.ID_Recurso AND o.Estado = 'Prestada'
+                AND o.ID_Reserva NOT IN (SELECT ID_Reserva FROM reservas)
+          )
+        RETURNING rec.ID_Recurso
+    )
+    SELECT e.id_prestamo, n.ID_Devolucion, p.ID_Prestamo IS NOT NULL, res.Estado,
+           EXISTS (SELECT 1 FROM empleado), EXISTS (SELECT 1 FROM recursos)
+    FROM entrada e
+    LEFT JOIN nuevas n ON n.ID_Prestamo = e.id_prestamo
+    LEFT JOIN Prestamo p ON p.ID_Prestamo = e.id_prestamo
+    LEFT JOIN Reserva res ON res.ID_Reserva = p.ID_Reserva
+    """)
 
-            # Registrar la devolución
-            query_devolucion = """
-            INSERT INTO Devolucion (ID_Prestamo, Fecha_Devolucion, Hora_Devolucion)
-            VALUES (%s, %s, %s)
-            """
-            cursor.execute(query_devolucion, (id_prestamo, fecha_devolucion, hora_devolucion))
-            conexion.commit()
+    @staticmethod
+    @medirBD
+    def consultarDisponibilidad(tipo_recurso, fecha_inicio, fecha_fin):
+        """
+        Retorna la grilla de franjas libres y reservadas de cada recurso de un tipo
+        entre dos fechas: [{"id_recurso", "nombre", "estado", "dias": [{"fecha", "franjas"}]}].
 
-            return "Devolución registrada exitosamente."
+        Cada (tipo, día) se guarda en caché; los días que faltan se calculan con
+        una sola consulta agregada sobre recurso y reserva.
+        """
+        fechas = [fecha_inicio + timedelta(days=i) for i in range((fecha_fin - fecha_inicio).days + 1)]
+        cache = ConexionBD.cache_disponibilidad
+        por_dia = {}
+        faltantes = []
+        for fecha in fechas:
+            dia = cache.obtener((tipo_recurso, fecha))
+            if dia is None:
+                faltantes.append(fecha)
+            else:
+                por_dia[fecha] = dia
+
+        if faltantes:
+            version = cache.version
+            conexion = ConexionBD.conectarLectura(cache.invalidada_en)
+            if not conexion:
+                return "Error al conectar con la base de datos."
+            try:
+                cursor = conexion.cursor()
+                ConexionBD.QUERY_DISPONIBILIDAD.ejecutar(cursor, (faltantes, tipo_recurso))
+                filas = cursor.fetchall()
+            except Exception as e:
+                return f"Error al consultar la disponibilidad: {str(e)}"
+            finally:
+                ConexionBD.liberar(conexion)
+
+            duracion = ConexionBD.DURACION_FRANJA
+            calculados = {fecha: [] for fecha in faltantes}
+            for id_recurso, nombre, texto_horario, estado, fechas_res, horas_res in filas:
+                horario = obtenerHorario(id_recurso, texto_horario)
+                # Minutos de inicio de las reservas de cada día, ordenados
+                reservadas = {}
+                for f, h in zip(fechas_res or [], horas_res or []):
+                    reservadas.setdefault(f, []).append(h.hour * 60 + h.minute)
+                for inicios in reservadas.values():
+                    inicios.sort()
+                for fecha in faltantes:
+                    franjas = []
+                    if estado in ConexionBD.ESTADOS_RESERVABLES:
+                        inicios = reservadas.get(fecha, [])
+                        for inicio in horario.franjas(fecha, duracion):
+                            # Reservada si alguna reserva [h, h + duracion) se solapa con la franja
+                            i = bisect_right(inicios, inicio - duracion)
+                            ocupada = i < len(inicios) and inicios[i] < inicio + duracion
+                            franjas.append({
+                                "hora": f"{inicio // 60:02d}:{inicio % 60:02d}",
+                                "estado": "reservada" if ocupada else "libre",
+                            })
+                    calculados[fecha].append((id_recurso, nombre, estado, franjas))
+            for fecha, dia in calculados.items():
+                cache.guardar((tipo_recurso, fecha), dia, version)
+                por_dia[fecha] = dia
+
+        recursos = {}
+        for fecha in fechas:
+            for id_recurso, nombre, estado, franjas in por_dia[fecha]:
+                recurso = recursos.setdefault(id_recurso, {
+                    "id_recurso": id_recurso, "nombre": nombre, "estado": estado, "dias": []
+                })
+                recurso["dias"].append({"fecha": fecha.isoformat(), "franjas": franjas})
+        return list(recursos.values())
+
+    QUERY_DISPONIBILIDAD = registrar("disponibilidad", """
+    SELECT r.ID_Recurso, r.Nombre, r.Horario_Disponibilidad, r.Estado,
+           array_agg(res.Fecha_Reserva) FILTER (WHERE res.ID_Reserva IS NOT NULL),
+           array_agg(res.Hora_Reserva) FILTER (WHERE res.ID_Reserva IS NOT NULL)
+    FROM Recurso r
+    JOIN Tipo_Recurso t ON r.ID_Tipo_Recurso = t.ID_Tipo_Recurso
+    LEFT JOIN Reserva res ON res.ID_Recurso = r.ID_Recurso
+        AND res.Fecha_Reserva = ANY(%s::date[])
+        AND res.Estado <> 'Cancelada'
+    WHERE t.Nombre = %s
+    GROUP BY r.ID_Recurso
+    ORDER BY r.ID_Recurso
+    """)
+
+    # Consultas de exportación: (consulta, columna de fecha para filtrar, columnas)
+    EXPORTACIONES = {
+        "reservas": (
+            "SELECT ID_Reserva, ID_Usuario, ID_Recurso, Fecha_Reserva, Hora_Reserva, Estado FROM Reserva",
+            "Fecha_Reserva",
+            ["id_reserva", "id_usuario", "id_recurso", "fecha_reserva", "hora_reserva", "estado"],
+        ),
+        "prestamos": (
+            "SELECT ID_Prestamo, ID_Reserva, ID_Empleado, Fecha_Prestamo, Hora_Prestamo FROM Prestamo",
+            "Fecha_Prestamo",
+            ["id_prestamo", "id_reserva", "id_empleado", "fecha_prestamo", "hora_prestamo"],
+        ),
+        "devoluciones": (
+            "SELECT ID_Devolucion, ID_Prestamo, Fecha_Devolucion, Hora_Devolucion FROM Devolucion",
+            "Fecha_Devolucion",
+            ["id_devolucion", "id_prestamo", "fecha_devolucion", "hora_devolucion"],
+        ),
+    }
+
+    @staticmethod
+    def exportar(entidad, formato="ndjson", fecha_inicio=None, fecha_fin=None, lote=2000):
+        """
+        Exporta reservas, préstamos o devoluciones en NDJSON o CSV.
+
+        Retorna un generador de bloques de bytes que lee la tabla con un cursor
+        del lado del servidor, de `lote` filas a la vez, o un mensaje de error.
+        La conexión se toma al empezar a iterar y se devuelve al pool cuando el
+        generador termina o se cierra; si nunca se itera, no ocupa ninguna.
+        """
+        if entidad not in ConexionBD.EXPORTACIONES:
+            return "Entidad no válida para exportar."
+        if formato not in ("ndjson", "csv"):
+            return "Formato no válido para exportar."
+
+        query, columna_fecha, columnas = ConexionBD.EXPORTACIONES[entidad]
+        filtros = []
+        params = []
+        if fecha_inicio:
+            filtros.append(f"{columna_fecha} >= %s")
+            params.append(fecha_inicio)
+        if fecha_fin:
+            filtros.append(f"{columna_fecha} <= %s")
+            params.append(fecha_fin)
+        if filtros:
+            query += " WHERE " + " AND ".join(filtros)
+        query += f" ORDER BY {columnas[0]}"
+
+        return ConexionBD._generarExportacion(query, params, columnas, formato, lote)
 
+    @staticmethod
+    def _generarExportacion(query, params, columnas, formato, lote):
+        conexion = ConexionBD.conectarLectura()
+        if not conexion:
+            yield b"Error al conectar con la base de datos.\n"
+            return
+        try:
+            # Cursor con nombre: PostgreSQL entrega las filas por partes
+            cursor = conexion.cursor(name="exportacion")
+            cursor.itersize = lote
+            cursor.execute(query, params)
+
+            if formato == "csv":
+                buffer = io.StringIO()
+                escritor = csv.writer(buffer)
+                escritor.writerow(columnas)
+                yield buffer.getvalue().encode("utf-8")
+
+            while True:
+                filas = cursor.fetchmany(lote)
+                if not filas:
+                    break
+                if formato == "csv":
+                    buffer = io.StringIO()
+                    escritor = csv.writer(buffer)
+                    escritor.writerows(filas)
+                    yield buffer.getvalue().encode("utf-8")
+                else:
+                    # orjson escribe bytes UTF-8 y serializa date/time sin pasar por str
+                    yield b"".join(orjson.dumps(dict(zip(columnas, fila))) + b"\n" for fila in filas)
+            cursor.close()
         except Exception as e:
-            return f"Error al registrar la devolución: {str(e)}"
+            # Los encabezados ya se enviaron: se deja constancia al final del contenido
+            logger.error("Error al exportar: %s", e)
+            yield f"Error al exportar: {str(e)}\n".encode("utf-8")
         finally:
-            conexion.close()
+            ConexionBD.liberar(conexion)
 
     @staticmethod
+    @medirBD
     def consultarRecursosDisponibles():
         """
         Retorna una lista de los recursos disponibles en el sistema.
         """
-        conexion = ConexionBD.conectar()
+        clave = ("consultarRecursosDisponibles",)
+        recursos_formateados = ConexionBD.cache_recursos.obtener(clave)
+        if recursos_formateados is not None:
+            return recursos_formateados
+        version = ConexionBD.cache_recursos.version
+
+        conexion = ConexionBD.conectarLectura(ConexionBD.cache_recursos.invalidada_en)
         if not conexion:
             return "Error al conectar con la base de datos."
 
         try:
             cursor = conexion.cursor()
-            query = """
-            SELECT R.ID_Recurso, R.Nombre, T.Nombre AS Tipo_Recurso, R.Horario_Disponibilidad
-            FROM Recurso R
-            JOIN Tipo_Recurso T ON R.ID_Tipo_Recurso = T.ID_Tipo_Recurso
-            WHERE R.Estado = 'Disponible'
-            """
-            cursor.execute(query)
+            ConexionBD.QUERY_RECURSOS_DISPONIBLES.ejecutar(cursor)
             recursos = cursor.fetchall()
 
             if not recursos:
                 return {"recursos_disponibles": []}  # Retornar lista vacía si no hay recursos.
 
-            def transformar_horario(horario):
-                """
-                Convierte un rango de días en una lista con cada día y su horario.
-                """
-                dias_semana = ["Lunes", "Martes", "Miércoles", "Jueves", "Viernes", "Sábado", "Domingo"]
-                resultado = []
-
-                # Buscar el formato "Lunes a Viernes 08:00-18:00"
-                import re
-                match = re.match(r"(\w+) a (\w+) (\d{2}:\d{2}-\d{2}:\d{2})", horario)
-
-                if match:
-                    dia_inicio, dia_fin, horas = match.groups()
-                    if dia_inicio in dias_semana and dia_fin in dias_semana:
-                        i_inicio = dias_semana.index(dia_inicio)
-                        i_fin = dias_semana.index(dia_fin)
-                        resultado = [f"{dias_semana[i]} {horas}" for i in range(i_inicio, i_fin + 1)]
-                else:
-                    # Si el formato es solo un día específico
-                    partes = horario.split()
-                    if len(partes) == 2 and partes[0] in dias_semana:
-                        resultado = [horario]
-
-                return resultado
-
             recursos_formateados = []
             for r in recursos:
                 recurso = {
                     "id_recurso": r[0],
                     "nombre": r[1],
                     "tipo_recurso": r[2],
-                    "horario_disponibilidad": transformar_horario(r[3])
+                    "horario_disponibilidad": obtenerHorario(r[0], r[3]).dias()
                 }
                 recursos_formateados.append(recurso)
 
+            ConexionBD.cache_recursos.guardar(clave, recursos_formateados, version)
             return recursos_formateados
 
         except Exception as e:
             return f"Error al consultar recursos disponibles: {str(e)}"
         finally:
-            conexion.close()
+            ConexionBD.liberar(conexion)
+
+    QUERY_RECURSOS_DISPONIBLES = registrar("recursos_disponibles", """
+    SELECT R.ID_Recurso, R.Nombre, T.Nombre AS Tipo_Recurso, R.Horario_Disponibilidad
+    FROM Recurso R
+    JOIN Tipo_Recurso T ON R.ID_Tipo_Recurso = T.ID_Tipo_Recurso
+    WHERE R.Estado IN ('Disponible', 'Prestado')  -- ESTADOS_RESERVABLES
+    """)
+
+
+class ConexionBDAsync:
+    """
+    Contraparte asíncrona de ConexionBD para usar desde los endpoints de FastAPI.
+
+    Cada método de ConexionBD se expone como corrutina que se ejecuta en un hilo
+    trabajador, así el event loop sigue atendiendo otras peticiones mientras se
+    espera a PostgreSQL. Los hilos (`BD_HILOS`) no se atan al tamaño del pool:
+    las llamadas que esperan conexión lo hacen dentro del pool (hasta
+    `BD_POOL_ESPERA`) y las que se resuelven desde caché no hacen fila detrás de
+    ellas. El límite solo acota la memoria de los hilos.
+    Los valores de retorno son exactamente los de ConexionBD.
+    """
+
+    hilos_defecto = int(os.getenv("BD_HILOS", "64"))
+
+    def __init__(self, hilos=None):
+        self.hilos = hilos or ConexionBDAsync.hilos_defecto
+        self._limitador = None
+
+    def _obtenerLimitador(self):
+        if self._limitador is None:
+            self._limitador = anyio.CapacityLimiter(self.hilos)
+        return self._limitador
+
+    async def _enHilo(self, funcion, *args, **kwargs):
+        return await anyio.to_thread.run_sync(
+            functools.partial(funcion, *args, **kwargs),
+            limiter=self._obtenerLimitador()
+        )
+
+    def __getattr__(self, nombre):
+        metodo = getattr(ConexionBD, nombre)
+        if not callable(metodo):
+            return metodo
+
+        async def ejecutar(*args, **kwargs):
+            return await self._enHilo(metodo, *args, **kwargs)
+
+        ejecutar.__name__ = nombre
+        return ejecutar
+
+    # Login y registro: la consulta y la escritura van en hilos de la base de
+    # datos, pero bcrypt se espera desde el event loop en su propio ejecutor,
+    # así un login no retiene un hilo de BD durante el hash.
+
+    @medirBD
+    async def validarLogin(self, correo, contrasena):
+        return await self._validarCredenciales(
+            ConexionBD.QUERY_CREDENCIALES_USUARIO, ConexionBD.QUERY_HASH_USUARIO, correo, contrasena
+        )
+
+    @medirBD
+    async def validarLoginEmpleado(self, correo, contrasena):
+        id_empleado = await self._validarCredenciales(
+            ConexionBD.QUERY_CREDENCIALES_EMPLEADO, ConexionBD.QUERY_HASH_EMPLEADO, correo, contrasena
+        )
+        if not id_empleado:
+            return False
+        return TokenHandler.generar_token(id_empleado)
+
+    async def _validarCredenciales(self, consulta, consulta_hash, correo, contrasena):
+        """
+        Retorna el id si la contraseña es correcta, o False.
+        Los errores de la base de datos se propagan (ver _consultarCredenciales).
+        """
+        result = await self._enHilo(ConexionBD._consultarCredenciales, consulta, correo)
+        if not result:
+            return False
+        id_registro, contrasena_encriptada = result
 
+        if not await PasswordHandler.verificar_contrasena_async(contrasena, contrasena_encriptada):
+            return False
+        if PasswordHandler.necesita_rehash(contrasena_encriptada):
+            try:
+                contrasena_hash = await PasswordHandler.hash_password_async(contrasena)
+            except ServicioSaturado:
+                contrasena_hash = None  # Se reintentará en el próximo login
+            if contrasena_hash:
+                await self._enHilo(ConexionBD._guardarHash, consulta_hash, contrasena_hash, id_registro)
+        ConexionBD.idUsuarioValido = id_registro
+        return id_registro
+
+    @medirBD
+    async def registrarEmpleado(self, nombre, cargo, email, contrasena):
+        mensaje = await self._enHilo(ConexionBD._verificarCorreo, ConexionBD.QUERY_EMAIL_EMPLEADO, email)
+        if mensaje:
+            return mensaje
+        contrasena_hash = await PasswordHandler.hash_password_async(contrasena)
+        return await self._enHilo(ConexionBD._insertarEmpleado, nombre, cargo, email, contrasena_hash)
+
+    @medirBD
+    async def registrarUsuario(self, nombre, email, telefono, contrasena):
+        mensaje = await self._enHilo(ConexionBD._verificarCorreo, ConexionBD.QUERY_EMAIL_USUARIO, email)
+        if mensaje:
+            return mensaje
+        contrasena_hash = await PasswordHandler.hash_password_async(contrasena)
+        return await self._enHilo(ConexionBD._insertarUsuario, nombre, email, telefono, contrasena_hash)
+
+    @medirBD
+    async def importarUsuarios(self, filas):
+        validas, errores = ConexionBD._validarImportacion(filas)
+        nuevas = await self._enHilo(ConexionBD._filtrarRegistrados, validas, errores)
+        if isinstance(nuevas, str):  # Si es un mensaje de error
+            return nuevas
+        if not nuevas:
+            return ConexionBD._resultadoImportacion(0, errores)
+        # Los hashes usan su propio ejecutor: el hilo que espera no cuenta en el límite de BD
+        hashes = await anyio.to_thread.run_sync(PasswordHandler.hash_passwords_lote, [f[4] for f in nuevas])
+        return await self._enHilo(ConexionBD._cargarImportacion, nuevas, hashes, errores)
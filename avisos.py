@@ -0,0 +1,168 @@
+import asyncio
+import logging
+from collections import deque
+
+import orjson
+import psycopg2
+
+
+logger = logging.getLogger("integraservicios.avisos")
+
+
+class SuscripcionesAgotadas(Exception):
+    """
+    Se lanza cuando el worker ya tiene el máximo de suscriptores permitido.
+    """
+
+
+class Suscripcion:
+    """
+    Cola acotada de tramas SSE pendientes de un cliente.
+
+    Las tramas se codifican una sola vez en `Difusor.publicar` y todas las
+    suscripciones guardan referencias al mismo objeto, así cada conexión solo
+    ocupa su cola de como mucho `capacidad` referencias. Si el cliente no lee a
+    tiempo se descartan las más viejas y se le pide resincronizar.
+    """
+
+    __slots__ = ("recursos", "tramas", "desbordada", "_aviso")
+
+    def __init__(self, recursos, capacidad):
+        self.recursos = recursos  # frozenset de id_recurso o None para todos
+        self.tramas = deque(maxlen=capacidad)
+        self.desbordada = False
+        self._aviso = asyncio.Event()
+
+    def agregar(self, trama):
+        """
+        Encola `trama`. Retorna True si hubo que descartar una anterior.
+        """
+        descartada = len(self.tramas) == self.tramas.maxlen
+        if descartada:
+            self.desbordada = True
+        self.tramas.append(trama)
+        self._aviso.set()
+        return descartada
+
+    def resincronizar(self):
+        self.desbordada = True
+        self._aviso.set()
+
+    async def esperar(self, tiempo_maximo):
+        """
+        Espera hasta `tiempo_maximo` segundos y retorna las tramas pendientes
+        (lista vacía si no llegó nada).
+        """
+        if not self.tramas and not self.desbordada:
+            try:
+                await asyncio.wait_for(self._aviso.wait(), tiempo_maximo)
+            except asyncio.TimeoutError:
+                return []
+        self._aviso.clear()
+        tramas = list(self.tramas)
+        self.tramas.clear()
+        if self.desbordada:
+            self.desbordada = False
+            tramas.insert(0, Difusor.RESINCRONIZAR)
+        return tramas
+
+
+class Difusor:
+    """
+    Reparte los avisos de un canal entre las suscripciones de este proceso.
+    Debe usarse desde el hilo del event loop.
+    """
+
+    RESINCRONIZAR = b"event: resincronizar\ndata: {}\n\n"
+
+    def __init__(self, capacidad=16, maximo=1000):
+        self.capacidad = capacidad
+        self.maximo = maximo
+        self._suscripciones = set()
+        self._eventos = 0
+        self._desbordes = 0
+
+    def suscribir(self, recursos=None):
+        if len(self._suscripciones) >= self.maximo:
+            raise SuscripcionesAgotadas("No se admiten más suscripciones en este momento.")
+        suscripcion = Suscripcion(frozenset(recursos) if recursos else None, self.capacidad)
+        self._suscripciones.add(suscripcion)
+        return suscripcion
+
+    def cancelar(self, suscripcion):
+        self._suscripciones.discard(suscripcion)
+
+    def publicar(self, evento, nombre="disponibilidad"):
+        """
+        Envía `evento` (diccionario con id_recurso) a las suscripciones interesadas.
+        """
+        self._eventos += 1
+        trama = b"event: " + nombre.encode() + b"\ndata: " + orjson.dumps(evento) + b"\n\n"
+        id_recurso = evento.get("id_recurso")
+        for suscripcion in self._suscripciones:
+            if suscripcion.recursos is None or id_recurso in suscripcion.recursos:
+                if suscripcion.agregar(trama):
+                    self._desbordes += 1
+
+    def resincronizar(self):
+        """
+        Pide a todas las suscripciones volver a consultar, p. ej. tras perder avisos.
+        """
+        for suscripcion in self._suscripciones:
+            suscripcion.resincronizar()
+
+    def metricas(self):
+        return {
+            "suscripciones": len(self._suscripciones),
+            "eventos": self._eventos,
+            "desbordes": self._desbordes,
+        }
+
+
+async def escuchar(parametros, canal, al_recibir, al_reconectar=None, reintento=5.0):
+    """
+    Escucha `canal` con LISTEN en una conexión propia (fuera del pool) y llama a
+    `al_recibir(payload)` por cada NOTIFY, desde el event loop y sin hilos.
+    Si la conexión se pierde reintenta cada `reintento` segundos y, al volver,
+    llama a `al_reconectar()` porque los avisos intermedios se perdieron.
+    """
+    loop = asyncio.get_running_loop()
+    conectada_antes = False
+    while True:
+        conexion = None
+        try:
+            conexion = await asyncio.to_thread(
+                psycopg2.connect, keepalives=1, keepalives_idle=30, keepalives_interval=10, **parametros
+            )
+            conexion.autocommit = True
+            with conexion.cursor() as cursor:
+                cursor.execute(f"LISTEN {canal}")
+            if conectada_antes and al_reconectar:
+                al_reconectar()
+            conectada_antes = True
+            logger.info("Escuchando el canal %s", canal)
+
+            listo = asyncio.Event()
+            descriptor = conexion.fileno()
+            loop.add_reader(descriptor, listo.set)
+            try:
+                while True:
+                    await listo.wait()
+                    listo.clear()
+                    conexion.poll()
+                    while conexion.notifies:
+                        aviso = conexion.notifies.pop(0)
+                        try:
+                            al_recibir(aviso.payload)
+                        except Exception:
+                            logger.exception("Error al procesar un aviso de %s", canal)
+            finally:
+                loop.remove_reader(descriptor)
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            logger.error("Se perdió la escucha del canal %s: %s", canal, e)
+        finally:
+            if conexion is not None:
+                conexion.close()
+        await asyncio.sleep(reintento)
@@ -0,0 +1,217 @@
+"""
+Prueba de carga de los flujos principales de la API.
+
+Simula `--concurrencia` usuarios que durante `--duracion` segundos eligen al
+azar, según `--mezcla`, uno de los flujos: login, catálogo, reservar, préstamo
+y devolución. Reporta por endpoint las peticiones por segundo y la latencia
+p50/p95/p99, y guarda el resultado en JSON para compararlo entre commits con
+comparar.py.
+
+Uso:
+    python benchmarks/sembrar.py --dsn postgresql://postgres@localhost/integraservicios_bench
+    BD_HOST=localhost BD_USER=postgres BD_NOMBRE=integraservicios_bench uvicorn main:app --workers 1 --port 8000
+    python benchmarks/carga.py --url http://127.0.0.1:8000 --concurrencia 50 --duracion 60 --salida base.json
+"""
+import argparse
+import asyncio
+import json
+import os
+import random
+import subprocess
+import time
+from collections import defaultdict
+from datetime import date, timedelta
+
+import httpx
+
+
+MEZCLA_POR_DEFECTO = "login=2,catalogo=6,reservar=2,prestamo=1,devolucion=1"
+
+
+class Prueba:
+    def __init__(self, cliente, semilla, aleatorio):
+        self.cliente = cliente
+        self.semilla = semilla
+        self.aleatorio = aleatorio
+        self.token = None
+        self.latencias = defaultdict(list)
+        self.estados = defaultdict(lambda: defaultdict(int))
+
+    async def pedir(self, metodo, ruta, etiqueta=None, **kwargs):
+        etiqueta = etiqueta or f"{metodo} {ruta}"
+        inicio = time.perf_counter()
+        try:
+            respuesta = await self.cliente.request(metodo, ruta, **kwargs)
+            estado = respuesta.status_code
+        except httpx.HTTPError as e:
+            respuesta = None
+            estado = type(e).__name__
+        self.latencias[etiqueta].append(time.perf_counter() - inicio)
+        self.estados[etiqueta][str(estado)] += 1
+        return respuesta
+
+    # Flujos -----------------------------------------------------------------
+
+    async def login(self):
+        n = self.aleatorio.randint(1, self.semilla["usuarios"])
+        await self.pedir("POST", "/validate", json={
+            "correo": f"usuario{n}@ejemplo.com", "contrasena": self.semilla["contrasena"]
+        })
+
+    async def catalogo(self):
+        tipo = self.aleatorio.choice(self.semilla["tipos_recurso"])
+        await self.pedir("GET", "/consultarRecursos", params={"tipo_recurso": tipo, "estado": "Disponible"})
+        await self.pedir("GET", "/api/recursosDisponibles")
+        dia = date.today() + timedelta(days=self.aleatorio.randint(0, 14))
+        await self.pedir("GET", "/disponibilidad", params={"tipo_recurso": tipo, "fecha_inicio": dia.isoformat()})
+
+    async def reservar(self):
+        dia = date.today() + timedelta(days=self.aleatorio.randint(30, 365))
+        await self.pedir("POST", "/agregarReserva", json={
+            "id_usuario": self.aleatorio.randint(1, self.semilla["usuarios"]),
+            "id_recurso": self.aleatorio.randint(1, self.semilla["recursos"]),
+            "fecha_reserva": dia.isoformat(),
+            "hora_reserva": f"{self.aleatorio.randint(7, 18):02d}:00:00",
+        })
+
+    async def prestamo(self):
+        if not self.semilla["reservas_para_prestamo"]:
+            return
+        id_reserva = self.semilla["reservas_para_prestamo"].pop()
+        await self.pedir("POST", "/registrarPrestamo", headers={"Authorization": f"Bearer {self.token}"}, json={
+            "id_reserva": id_reserva,
+            "id_empleado": 1,
+            "fecha_prestamo": date.today().isoformat(),
+            "hora_prestamo": time.strftime("%H:%M:%S"),
+        })
+
+    async def devolucion(self):
+        if not self.semilla["prestamos_para_devolucion"]:
+            return
+        id_prestamo = self.semilla["prestamos_para_devolucion"].pop()
+        await self.pedir("POST", "/registrarDevolucion", json={
+            "id_prestamo": id_prestamo,
+            "fecha_devolucion": date.today().isoformat(),
+            "hora_devolucion": time.strftime("%H:%M:%S"),
+            "id_empleado": 1,
+        })
+
+
+def leerMezcla(texto):
+    mezcla = {}
+    for par in texto.split(","):
+        nombre, peso = par.split("=")
+        if not hasattr(Prueba, nombre.strip()):
+            raise SystemExit(f"Flujo desconocido: {nombre}")
+        mezcla[nombre.strip()] = float(peso)
+    return mezcla
+
+
+def percentil(valores_ordenados, p):
+    if not valores_ordenados:
+        return 0.0
+    indice = min(int(round(p / 100 * (len(valores_ordenados) - 1))), len(valores_ordenados) - 1)
+    return valores_ordenados[indice]
+
+
+def resumir(prueba, duracion):
+    endpoints = {}
+    total = 0
+    for etiqueta, latencias in sorted(prueba.latencias.items()):
+        latencias.sort()
+        total += len(latencias)
+        estados = dict(prueba.estados[etiqueta])
+        exitosas = sum(v for k, v in estados.items() if k.startswith("2"))
+        endpoints[etiqueta] = {
+            "peticiones": len(latencias),
+            "exitosas": exitosas,
+            "estados": estados,
+            "peticiones_por_segundo": round(len(latencias) / duracion, 2),
+            "p50_ms": round(percentil(latencias, 50) * 1000, 2),
+            "p95_ms": round(percentil(latencias, 95) * 1000, 2),
+            "p99_ms": round(percentil(latencias, 99) * 1000, 2),
+        }
+    return endpoints, total
+
+
+def commitActual():
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True,
+            cwd=os.path.dirname(os.path.abspath(__file__)), check=True
+        ).stdout.strip()
+    except Exception:
+        return None
+
+
+async def ejecutar(args, semilla):
+    mezcla = leerMezcla(args.mezcla)
+    flujos = list(mezcla)
+    pesos = [mezcla[f] for f in flujos]
+    limites = httpx.Limits(max_connections=args.concurrencia, max_keepalive_connections=args.concurrencia)
+
+    async with httpx.AsyncClient(base_url=args.url, limits=limites, timeout=60) as cliente:
+        prueba = Prueba(cliente, semilla, random.Random(args.semilla_aleatoria))
+        if "prestamo" in mezcla:
+            respuesta = await cliente.post("/validateEmpleado", json={
+                "correo": "empleado1@ejemplo.com", "contrasena": semilla["contrasena"]
+            })
+            respuesta.raise_for_status()
+            prueba.token = respuesta.json()["token"]
+
+        fin = time.perf_counter() + args.duracion
+
+        async def usuario_virtual():
+            while time.perf_counter() < fin:
+                flujo = prueba.aleatorio.choices(flujos, pesos)[0]
+                await getattr(prueba, flujo)()
+
+        inicio = time.perf_counter()
+        await asyncio.gather(*(usuario_virtual() for _ in range(args.concurrencia)))
+        duracion = time.perf_counter() - inicio
+
+    endpoints, total = resumir(prueba, duracion)
+    return {
+        "meta": {
+            "commit": commitActual(),
+            "fecha": time.strftime("%Y-%m-%dT%H:%M:%S%z"),
+            "url": args.url,
+            "concurrencia": args.concurrencia,
+            "duracion_s": round(duracion, 2),
+            "mezcla": mezcla,
+        },
+        "total": {"peticiones": total, "peticiones_por_segundo": round(total / duracion, 2)},
+        "endpoints": endpoints,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--url", default="http://127.0.0.1:8000")
+    parser.add_argument("--concurrencia", type=int, default=50)
+    parser.add_argument("--duracion", type=float, default=30, help="Segundos de prueba")
+    parser.add_argument("--mezcla", default=MEZCLA_POR_DEFECTO, help="Pesos de cada flujo")
+    parser.add_argument("--semilla", default=os.path.join(os.path.dirname(os.path.abspath(__file__)), "semilla.json"),
+                        help="Archivo generado por sembrar.py")
+    parser.add_argument("--semilla-aleatoria", type=int, default=42)
+    parser.add_argument("--salida", help="Archivo JSON donde guardar el resultado")
+    args = parser.parse_args()
+
+    with open(args.semilla, encoding="utf-8") as archivo:
+        semilla = json.load(archivo)
+
+    resultado = asyncio.run(ejecutar(args, semilla))
+
+    print(f"{'endpoint':45} {'req/s':>8} {'p50 ms':>8} {'p95 ms':>8} {'p99 ms':>8}  estados")
+    for etiqueta, datos in resultado["endpoints"].items():
+        print(f"{etiqueta:45} {datos['peticiones_por_segundo']:8} {datos['p50_ms']:8} "
+              f"{datos['p95_ms']:8} {datos['p99_ms']:8}  {datos['estados']}")
+    print(f"Total: {resultado['total']['peticiones']} peticiones, {resultado['total']['peticiones_por_segundo']} req/s")
+
+    if args.salida:
+        with open(args.salida, "w", encoding="utf-8") as archivo:
+            json.dump(resultado, archivo, ensure_ascii=False, indent=2)
+
+
+if __name__ == "__main__":
+    main()
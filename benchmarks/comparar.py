@@ -0,0 +1,58 @@
+"""
+Compara dos resultados de carga.py (por ejemplo, el de main y el de una rama).
+
+Marca como regresión los endpoints cuyo p95 sube o cuyo throughput baja más del
+umbral indicado, y termina con código 1 si hay alguna.
+
+Uso:
+    python benchmarks/comparar.py base.json nuevo.json --umbral 10
+"""
+import argparse
+import json
+import sys
+
+
+def variacion(antes, despues):
+    if not antes:
+        return 0.0
+    return (despues - antes) / antes * 100
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("base")
+    parser.add_argument("nuevo")
+    parser.add_argument("--umbral", type=float, default=10.0, help="Porcentaje de empeoramiento tolerado")
+    args = parser.parse_args()
+
+    with open(args.base, encoding="utf-8") as archivo:
+        base = json.load(archivo)
+    with open(args.nuevo, encoding="utf-8") as archivo:
+        nuevo = json.load(archivo)
+
+    print(f"base: {base['meta'].get('commit')}  nuevo: {nuevo['meta'].get('commit')}")
+    print(f"{'endpoint':45} {'req/s':>16} {'Δ%':>7} {'p95 ms':>18} {'Δ%':>7}")
+    regresiones = []
+    for etiqueta in sorted(set(base["endpoints"]) | set(nuevo["endpoints"])):
+        antes = base["endpoints"].get(etiqueta)
+        despues = nuevo["endpoints"].get(etiqueta)
+        if not antes or not despues:
+            print(f"{etiqueta:45} solo en {'nuevo' if despues else 'base'}")
+            continue
+        rps = variacion(antes["peticiones_por_segundo"], despues["peticiones_por_segundo"])
+        p95 = variacion(antes["p95_ms"], despues["p95_ms"])
+        marca = ""
+        if rps < -args.umbral or p95 > args.umbral:
+            regresiones.append(etiqueta)
+            marca = "  <-- regresión"
+        print(f"{etiqueta:45} {antes['peticiones_por_segundo']:7} → {despues['peticiones_por_segundo']:<7} {rps:+7.1f} "
+              f"{antes['p95_ms']:8} → {despues['p95_ms']:<8} {p95:+7.1f}{marca}")
+
+    total = variacion(base["total"]["peticiones_por_segundo"], nuevo["total"]["peticiones_por_segundo"])
+    print(f"Total req/s: {base['total']['peticiones_por_segundo']} → {nuevo['total']['peticiones_por_segundo']} ({total:+.1f}%)")
+    if regresiones:
+        sys.exit(f"Regresiones en: {', '.join(regresiones)}")
+
+
+if __name__ == "__main__":
+    main()
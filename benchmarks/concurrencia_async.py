@@ -0,0 +1,91 @@
+"""
+Mide cuánto trabajo admite ConexionBDAsync en vuelo según su número de hilos.
+
+Lanza a la vez `--peticiones` llamadas mezcladas: la mitad consulta la base de
+datos (consultarReservasVigentes) y la otra mitad se resuelve desde la caché
+del catálogo (consultarRecursos). Se repite para cada valor de `--hilos` con
+el mismo pool de `--conexiones` conexiones. Con hilos = conexiones las
+llamadas cacheadas hacen fila detrás de las que esperan conexión; con más
+hilos responden sin esperar al pool.
+
+Usar contra una base de datos sembrada con sembrar.py.
+
+Uso:
+    python benchmarks/concurrencia_async.py --dsn postgresql://postgres@localhost/integraservicios_bench --hilos 10,64
+"""
+import argparse
+import os
+import random
+import statistics
+import sys
+import time
+
+import anyio
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from BD import ConexionBD, ConexionBDAsync  # noqa: E402
+from metricas import CursorMedido  # noqa: E402
+from pool import PoolConexiones  # noqa: E402
+
+
+def percentil(valores, p):
+    valores = sorted(valores)
+    return valores[min(len(valores) - 1, int(len(valores) * p))] * 1000
+
+
+async def medir(hilos, peticiones, usuarios):
+    bd = ConexionBDAsync(hilos)
+    await bd.consultarRecursos()  # Deja el catálogo en caché
+    tiempos = {"bd": [], "cache": []}
+    maximo_en_vuelo = 0
+
+    async def llamar(tipo):
+        inicio = time.perf_counter()
+        if tipo == "bd":
+            await bd.consultarReservasVigentes(random.randint(1, usuarios))
+        else:
+            await bd.consultarRecursos()
+        tiempos[tipo].append(time.perf_counter() - inicio)
+
+    async def observar():
+        nonlocal maximo_en_vuelo
+        while True:
+            maximo_en_vuelo = max(maximo_en_vuelo, bd._obtenerLimitador().borrowed_tokens)
+            await anyio.sleep(0.001)
+
+    inicio = time.perf_counter()
+    async with anyio.create_task_group() as externo:
+        externo.start_soon(observar)
+        async with anyio.create_task_group() as grupo:
+            for i in range(peticiones):
+                grupo.start_soon(llamar, "bd" if i % 2 else "cache")
+        externo.cancel_scope.cancel()
+    total = time.perf_counter() - inicio
+
+    print(f"hilos={hilos}: {peticiones / total:.0f} llamadas/s, máximo en vuelo {maximo_en_vuelo}")
+    for tipo, valores in tiempos.items():
+        print(f"  {tipo:5} p50 {percentil(valores, 0.5):8.1f} ms  p99 {percentil(valores, 0.99):8.1f} ms"
+              f"  media {statistics.mean(valores) * 1000:8.1f} ms")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--dsn", required=True, help="Base de datos de pruebas ya sembrada")
+    parser.add_argument("--conexiones", type=int, default=10, help="Tamaño del pool")
+    parser.add_argument("--hilos", default="10,64", help="Valores de hilos a comparar, separados por comas")
+    parser.add_argument("--peticiones", type=int, default=500, help="Llamadas lanzadas a la vez por ronda")
+    parser.add_argument("--usuarios", type=int, default=50_000, help="Rango de id_usuario sembrados")
+    args = parser.parse_args()
+
+    ConexionBD.pool = PoolConexiones(
+        {"dsn": args.dsn, "cursor_factory": CursorMedido},
+        minimo=0, maximo=args.conexiones, espera_maxima=60
+    )
+    ConexionBD.replica_host = None
+    for hilos in (int(valor) for valor in args.hilos.split(",")):
+        anyio.run(medir, hilos, args.peticiones, args.usuarios)
+
+
+if __name__ == "__main__":
+    main()
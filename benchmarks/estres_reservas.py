@@ -0,0 +1,90 @@
+"""
+Prueba de estrés de reservas concurrentes.
+
+Lanza muchas llamadas simultáneas a ConexionBD.crearReserva para el mismo
+recurso, fecha y hora, y comprueba que solo una de ellas queda registrada.
+Usar contra una base de datos de pruebas con el esquema de integraservicios.sql
+(cada ronda borra las reservas de ese recurso, fecha y hora).
+
+Uso:
+    python benchmarks/estres_reservas.py --dsn postgresql://postgres@localhost/integraservicios_pruebas --usuario 1 --recurso 1 --fecha 2030-01-07 --hora 09:00 --hilos 50
+"""
+import argparse
+import os
+import sys
+import threading
+from collections import Counter
+from datetime import date, time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from BD import ConexionBD  # noqa: E402
+from metricas import CursorMedido  # noqa: E402
+from pool import PoolConexiones  # noqa: E402
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--dsn", required=True, help="Base de datos de pruebas (se borran reservas)")
+    parser.add_argument("--usuario", type=int, required=True)
+    parser.add_argument("--recurso", type=int, required=True)
+    parser.add_argument("--fecha", type=date.fromisoformat, required=True)
+    parser.add_argument("--hora", type=time.fromisoformat, required=True)
+    parser.add_argument("--hilos", type=int, default=50)
+    parser.add_argument("--rondas", type=int, default=5)
+    args = parser.parse_args()
+
+    # Nunca se usa la base de datos configurada en ConexionBD
+    ConexionBD.pool = PoolConexiones(
+        {"dsn": args.dsn, "cursor_factory": CursorMedido},
+        minimo=0, maximo=args.hilos + 1, espera_maxima=60
+    )
+    ConexionBD.replica_host = None
+    conexion = ConexionBD.conectar()
+    if not conexion:
+        sys.exit("No fue posible conectar con la base de datos.")
+
+    fallos = 0
+    try:
+        for ronda in range(args.rondas):
+            cursor = conexion.cursor()
+            cursor.execute(
+                "DELETE FROM Reserva WHERE ID_Recurso = %s AND Fecha_Reserva = %s AND Hora_Reserva = %s",
+                (args.recurso, args.fecha, args.hora)
+            )
+            conexion.commit()
+
+            barrera = threading.Barrier(args.hilos)
+            resultados = []
+
+            def reservar():
+                barrera.wait()
+                resultados.append(ConexionBD.crearReserva(args.usuario, args.recurso, args.fecha, args.hora))
+
+            hilos = [threading.Thread(target=reservar) for _ in range(args.hilos)]
+            for hilo in hilos:
+                hilo.start()
+            for hilo in hilos:
+                hilo.join()
+
+            cursor.execute(
+                "SELECT COUNT(*) FROM Reserva WHERE ID_Recurso = %s AND Fecha_Reserva = %s AND Hora_Reserva = %s AND Estado <> 'Cancelada'",
+                (args.recurso, args.fecha, args.hora)
+            )
+            registradas = cursor.fetchone()[0]
+            conexion.commit()
+
+            exitosas = sum("Reserva creada exitosamente" in r for r in resultados)
+            print(f"Ronda {ronda + 1}: {exitosas} exitosas, {registradas} en la base de datos, {dict(Counter(resultados))}")
+            if exitosas != 1 or registradas != 1:
+                fallos += 1
+    finally:
+        ConexionBD.liberar(conexion)
+
+    if fallos:
+        sys.exit(f"Se detectaron reservas dobles en {fallos} de {args.rondas} rondas.")
+    print("Sin reservas dobles.")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,164 @@
+"""
+Siembra una base de datos local de PostgreSQL con volúmenes realistas para
+las pruebas de carga.
+
+Recrea el esquema public (¡borra los datos!), aplica integraservicios.sql y las
+migraciones, e inserta usuarios, empleados, recursos, reservas, préstamos y
+devoluciones. Guarda en un archivo JSON los datos que necesita carga.py
+(credenciales y IDs de reservas y préstamos de hoy).
+
+Uso:
+    python benchmarks/sembrar.py --dsn postgresql://postgres@localhost/integraservicios_bench
+"""
+import argparse
+import json
+import os
+import sys
+from datetime import date
+
+import bcrypt
+import psycopg2
+
+RAIZ = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, RAIZ)
+
+from migrar import migrar  # noqa: E402
+
+
+CONTRASENA = "clave-benchmark"
+HORARIOS = [
+    "Lunes a Viernes 07:00-19:00",
+    "Lunes a Sábado 08:00-18:00",
+    "Lunes a Domingo 06:00-22:00",
+]
+FRANJAS_POR_DIA = 12  # Reservas por recurso y día, de 07:00 a 18:00
+
+
+def sembrar(conexion, usuarios=50_000, recursos=500, reservas=500_000, empleados=50, rounds=12):
+    """
+    Recrea el esquema y lo llena de datos. Retorna un diccionario con los datos
+    que usan las pruebas de carga.
+    """
+    cursor = conexion.cursor()
+    cursor.execute("DROP SCHEMA public CASCADE; CREATE SCHEMA public;")
+    with open(os.path.join(RAIZ, "integraservicios.sql"), encoding="utf-8") as archivo:
+        cursor.execute(archivo.read())
+    conexion.commit()
+    migrar(conexion, salida=lambda _: None)
+
+    hash_contrasena = bcrypt.hashpw(CONTRASENA.encode(), bcrypt.gensalt(rounds=rounds)).decode()
+    # Las reservas de cada recurso ocupan FRANJAS_POR_DIA franjas diarias; la mitad
+    # del historial queda antes de hoy y la otra mitad después.
+    dias = max(reservas // (recursos * FRANJAS_POR_DIA), 1)
+    parametros = {
+        "hash": hash_contrasena, "usuarios": usuarios, "empleados": empleados, "recursos": recursos,
+        "reservas": reservas, "franjas": FRANJAS_POR_DIA, "inicio": date.today(), "mitad": dias // 2,
+        "horarios": HORARIOS,
+    }
+    cursor.execute("""
+    INSERT INTO Usuario (Nombre, Email, Telefono, Contrasena)
+    SELECT 'Usuario ' || i, 'usuario' || i || '@ejemplo.com', '300' || lpad(i::text, 7, '0'), %(hash)s
+    FROM generate_series(1, %(usuarios)s) AS i;
+
+    INSERT INTO Empleado (Nombre, Cargo, Email, Contrasena)
+    SELECT 'Empleado ' || i, 'Recepcionista', 'empleado' || i || '@ejemplo.com', %(hash)s
+    FROM generate_series(1, %(empleados)s) AS i;
+
+    INSERT INTO Recurso (ID_Tipo_Recurso, Nombre, Horario_Disponibilidad, Estado)
+    SELECT 1 + i %% 4, 'Recurso ' || i,
+           (%(horarios)s::text[])[1 + i %% array_length(%(horarios)s::text[], 1)],
+           CASE WHEN i %% 25 = 0 THEN 'Mantenimiento' ELSE 'Disponible' END
+    FROM generate_series(1, %(recursos)s) AS i;
+
+    INSERT INTO Reserva (ID_Usuario, ID_Recurso, Fecha_Reserva, Hora_Reserva, Estado)
+    SELECT 1 + (i * 7919) %% %(usuarios)s,
+           1 + i %% %(recursos)s,
+           fecha,
+           make_time(7 + (i / %(recursos)s) %% %(franjas)s, 0, 0),
+           CASE
+               WHEN fecha > %(inicio)s THEN 'Futura'
+               WHEN fecha = %(inicio)s THEN 'Vigente'
+               WHEN i %% 10 = 0 THEN 'Cancelada'
+               WHEN i %% 10 = 1 THEN 'Pasado'
+               ELSE 'Finalizada'
+           END
+    FROM generate_series(0, %(reservas)s - 1) AS i,
+         LATERAL (SELECT %(inicio)s::date - %(mitad)s + (i / (%(recursos)s * %(franjas)s))::int AS fecha) AS f;
+
+    INSERT INTO Prestamo (ID_Reserva, ID_Empleado, Fecha_Prestamo, Hora_Prestamo)
+    SELECT ID_Reserva, 1 + ID_Reserva %% %(empleados)s, Fecha_Reserva, Hora_Reserva
+    FROM Reserva
+    WHERE Estado = 'Finalizada' OR (Estado = 'Vigente' AND ID_Reserva %% 2 = 0);
+
+    INSERT INTO Devolucion (ID_Prestamo, Fecha_Devolucion, Hora_Devolucion)
+    SELECT p.ID_Prestamo, p.Fecha_Prestamo, p.Hora_Prestamo + INTERVAL '50 minutes'
+    FROM Prestamo p JOIN Reserva r ON r.ID_Reserva = p.ID_Reserva
+    WHERE r.Estado = 'Finalizada';
+
+    UPDATE Reserva r SET Estado = 'Prestada'
+    WHERE r.Estado = 'Vigente' AND EXISTS (SELECT 1 FROM Prestamo p WHERE p.ID_Reserva = r.ID_Reserva);
+
+    UPDATE Recurso rec SET Estado = 'Prestado'
+    WHERE rec.Estado = 'Disponible'
+      AND EXISTS (SELECT 1 FROM Reserva r WHERE r.ID_Recurso = rec.ID_Recurso AND r.Estado = 'Prestada');
+    """, parametros)
+
+    # IDs para los flujos de préstamo y devolución de hoy
+    cursor.execute("""
+    SELECT r.ID_Reserva FROM Reserva r
+    WHERE r.Estado = 'Vigente' AND NOT EXISTS (SELECT 1 FROM Prestamo p WHERE p.ID_Reserva = r.ID_Reserva)
+    ORDER BY r.ID_Reserva LIMIT 20000
+    """)
+    reservas_para_prestamo = [fila[0] for fila in cursor.fetchall()]
+    cursor.execute("""
+    SELECT p.ID_Prestamo FROM Prestamo p
+    WHERE NOT EXISTS (SELECT 1 FROM Devolucion d WHERE d.ID_Prestamo = p.ID_Prestamo)
+    ORDER BY p.ID_Prestamo LIMIT 20000
+    """)
+    prestamos_para_devolucion = [fila[0] for fila in cursor.fetchall()]
+    cursor.execute("SELECT Nombre FROM Tipo_Recurso ORDER BY ID_Tipo_Recurso")
+    tipos = [fila[0] for fila in cursor.fetchall()]
+    conexion.commit()
+
+    conexion.autocommit = True
+    cursor.execute("VACUUM ANALYZE")
+    conexion.autocommit = False
+
+    return {
+        "usuarios": usuarios,
+        "empleados": empleados,
+        "recursos": recursos,
+        "reservas": reservas,
+        "contrasena": CONTRASENA,
+        "tipos_recurso": tipos,
+        "reservas_para_prestamo": reservas_para_prestamo,
+        "prestamos_para_devolucion": prestamos_para_devolucion,
+        "fecha": date.today().isoformat(),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--dsn", required=True, help="Base de datos de pruebas (se borra su esquema public)")
+    parser.add_argument("--usuarios", type=int, default=50_000)
+    parser.add_argument("--recursos", type=int, default=500)
+    parser.add_argument("--reservas", type=int, default=500_000)
+    parser.add_argument("--empleados", type=int, default=50)
+    parser.add_argument("--rounds", type=int, default=int(os.getenv("BCRYPT_ROUNDS", "12")),
+                        help="Costo de bcrypt de las contraseñas sembradas")
+    parser.add_argument("--salida", default=os.path.join(os.path.dirname(os.path.abspath(__file__)), "semilla.json"))
+    args = parser.parse_args()
+
+    conexion = psycopg2.connect(args.dsn)
+    try:
+        datos = sembrar(conexion, args.usuarios, args.recursos, args.reservas, args.empleados, args.rounds)
+    finally:
+        conexion.close()
+
+    with open(args.salida, "w", encoding="utf-8") as archivo:
+        json.dump(datos, archivo, ensure_ascii=False)
+    print(f"Base sembrada; datos para las pruebas de carga en {args.salida}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,97 @@
+"""
+Mide el CPU que cuesta serializar una respuesta grande de /consultarReservaUsuario.
+
+Compara el camino anterior (un diccionario armado campo a campo por fila,
+jsonable_encoder y JSONResponse con la biblioteca json) con el actual
+(dict(zip) sobre las tuplas del cursor y ORJSONResponse). No necesita base de
+datos: las filas se generan en memoria con los mismos tipos que entrega psycopg2.
+
+Uso:
+    python benchmarks/serializacion.py --filas 10000 --repeticiones 50
+"""
+import argparse
+import os
+import statistics
+import sys
+import time
+from datetime import date, time as hora, timedelta
+
+from fastapi.encoders import jsonable_encoder
+from fastapi.responses import JSONResponse, ORJSONResponse
+
+RAIZ = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, RAIZ)
+
+from BD import ConexionBD  # noqa: E402
+
+
+def generarFilas(cantidad):
+    """
+    Filas con la forma de PAGINA_RESERVAS: (id, fecha, hora, estado, usuario, recurso).
+    """
+    inicio = date(2025, 1, 1)
+    estados = ("Vigente", "Futura", "Pasado", "Cancelada", "Finalizada")
+    return [
+        (
+            i,
+            inicio + timedelta(days=i % 365),
+            hora(7 + i % 12, 0),
+            estados[i % len(estados)],
+            f"Usuario {i % 5000}",
+            f"Sala de estudio {i % 500}",
+        )
+        for i in range(cantidad)
+    ]
+
+
+def caminoAnterior(filas):
+    resultado = []
+    for reserva in filas:
+        resultado.append({
+            "id_reserva": reserva[0],
+            "fecha_reserva": reserva[1].strftime('%Y-%m-%d'),
+            "hora_reserva": reserva[2],
+            "estado": reserva[3],
+            "nombre_usuario": reserva[4],
+            "nombre_recurso": reserva[5]
+        })
+    contenido = {"data": resultado, "siguiente_cursor": "abc"}
+    return JSONResponse(jsonable_encoder(contenido)).body
+
+
+def caminoActual(filas):
+    resultado = [dict(zip(ConexionBD.COLUMNAS_RESERVAS, reserva)) for reserva in filas]
+    return ORJSONResponse({"data": resultado, "siguiente_cursor": "abc"}).body
+
+
+def medir(funcion, filas, repeticiones):
+    tiempos = []
+    for _ in range(repeticiones):
+        inicio = time.process_time()
+        cuerpo = funcion(filas)
+        tiempos.append(time.process_time() - inicio)
+    return tiempos, len(cuerpo)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--filas", type=int, default=10_000)
+    parser.add_argument("--repeticiones", type=int, default=50)
+    args = parser.parse_args()
+
+    filas = generarFilas(args.filas)
+    if caminoAnterior(filas[:50]) != caminoActual(filas[:50]):
+        sys.exit("Los dos caminos no producen el mismo JSON.")
+
+    base = None
+    print(f"{args.filas} filas, {args.repeticiones} repeticiones (CPU por respuesta)")
+    for nombre, funcion in (("anterior", caminoAnterior), ("actual", caminoActual)):
+        tiempos, tamano = medir(funcion, filas, args.repeticiones)
+        mediana = statistics.median(tiempos) * 1000
+        base = base or mediana
+        print(f"{nombre:10} mediana {mediana:8.2f} ms  p95 {sorted(tiempos)[int(len(tiempos) * 0.95) - 1] * 1000:8.2f} ms"
+              f"  {tamano / 1024:8.1f} KiB  x{base / mediana:.1f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,138 @@
+"""
+Comprueba con EXPLAIN que las consultas de ConexionBD usan índices.
+
+Recrea el esquema en una base de datos de pruebas (¡borra el esquema public!),
+siembra un volumen grande de datos con sembrar.py y ejecuta los métodos de
+ConexionBD registrando cada sentencia que envían. Luego obtiene el plan de
+cada sentencia y falla si alguna recorre secuencialmente una de las tablas
+grandes para filtrarla.
+
+Uso:
+    python benchmarks/verificar_indices.py --dsn postgresql://postgres@localhost/integraservicios_pruebas
+"""
+import argparse
+import json
+import os
+import sys
+from datetime import date, time
+
+import psycopg2
+import psycopg2.extensions
+
+RAIZ = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, RAIZ)
+
+from BD import ConexionBD  # noqa: E402
+from pool import PoolConexiones  # noqa: E402
+from sembrar import sembrar, CONTRASENA  # noqa: E402
+
+
+TABLAS_GRANDES = {"usuario", "empleado", "reserva", "prestamo", "devolucion", "recurso"}
+
+SENTENCIAS = []
+
+
+class CursorRegistro(psycopg2.extensions.cursor):
+    """
+    Cursor que guarda cada sentencia ejecutada junto con el método que la envió.
+    """
+    metodo = None
+
+    def execute(self, query, vars=None):
+        SENTENCIAS.append((CursorRegistro.metodo, query, vars))
+        return super().execute(query, vars)
+
+
+def ejecutarMetodos():
+    """
+    Llama a los métodos de ConexionBD con parámetros representativos.
+    """
+    llamadas = [
+        ("validarLogin", ("usuario500@ejemplo.com", CONTRASENA)),
+        ("validarLoginEmpleado", ("empleado5@ejemplo.com", CONTRASENA)),
+        ("consultarUsuarios", (500,)),
+        ("consultarRecursos", (None, None, "Recurso 1234")),
+        ("consultarRecursos", (None, None, None, None, "Sábado")),
+        ("consultarReservas", ("Usuario 4321",)),
+        ("consultarReservas", (None, None, None, date.today(), date.today())),
+        ("consultarReservasVigentes", (500,)),
+        ("consultarPrestamosVigentes", (500,)),
+        ("crearReserva", (500, 7, date(2031, 1, 6), time(10, 0))),
+        ("registrarPrestamo", (3, 1, date.today(), time(10, 0))),
+        ("registrarDevolucion", (1, date.today(), time(11, 0), 1)),
+    ]
+    for nombre, argumentos in llamadas:
+        CursorRegistro.metodo = nombre
+        getattr(ConexionBD, nombre)(*argumentos)
+    CursorRegistro.metodo = None
+
+
+def recorridosSecuenciales(plan):
+    """
+    Retorna las tablas grandes que el plan recorre secuencialmente para filtrar
+    filas. Un recorrido completo sin filtro (p. ej. como entrada de un hash
+    join) no indica que falte un índice.
+    """
+    encontrados = []
+    pendientes = [plan]
+    while pendientes:
+        nodo = pendientes.pop()
+        if (nodo.get("Node Type") == "Seq Scan" and "Filter" in nodo
+                and nodo.get("Relation Name", "").lower() in TABLAS_GRANDES):
+            encontrados.append(nodo["Relation Name"])
+        pendientes.extend(nodo.get("Plans", []))
+    return encontrados
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--dsn", required=True, help="Base de datos de pruebas (se borra su esquema public)")
+    parser.add_argument("--usuarios", type=int, default=200_000)
+    parser.add_argument("--recursos", type=int, default=20_000)
+    parser.add_argument("--reservas", type=int, default=1_000_000)
+    args = parser.parse_args()
+
+    conexion = psycopg2.connect(args.dsn)
+    try:
+        sembrar(conexion, args.usuarios, args.recursos, args.reservas, empleados=max(args.usuarios // 100, 10), rounds=4)
+
+        ConexionBD.pool = PoolConexiones({"dsn": args.dsn, "cursor_factory": CursorRegistro}, minimo=0, maximo=2)
+        ConexionBD.invalidarCacheRecursos()
+        ejecutarMetodos()
+
+        fallos = 0
+        cursor = conexion.cursor()
+        preparadas = set()
+        for metodo, query, parametros in SENTENCIAS:
+            inicio = query.lstrip().upper()
+            if inicio.startswith("PREPARE"):
+                # Las sentencias preparadas se recrean en esta sesión para explicar sus EXECUTE
+                nombre = query.split()[1]
+                if nombre not in preparadas:
+                    cursor.execute(query)
+                    conexion.commit()
+                    preparadas.add(nombre)
+                continue
+            if not inicio.startswith(("SELECT", "WITH", "INSERT", "UPDATE", "DELETE", "EXECUTE")):
+                continue
+            cursor.execute("EXPLAIN (FORMAT JSON) " + query, parametros)
+            plan = cursor.fetchone()[0]
+            if isinstance(plan, str):
+                plan = json.loads(plan)
+            secuenciales = recorridosSecuenciales(plan[0]["Plan"])
+            estado = "OK " if not secuenciales else "SEQ"
+            print(f"[{estado}] {metodo}: {' '.join(query.split())[:90]}")
+            if secuenciales:
+                print(f"      recorrido secuencial sobre: {', '.join(sorted(set(secuenciales)))}")
+                fallos += 1
+            conexion.rollback()
+    finally:
+        conexion.close()
+
+    if fallos:
+        sys.exit(f"{fallos} consultas no usan índices.")
+    print("Todas las consultas usan índices.")
+
+
+if __name__ == "__main__":
+    main()
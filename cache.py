@@ -0,0 +1,90 @@
+import threading
+import time
+from collections import OrderedDict
+
+
+_AUSENTE = object()
+
+
+class CacheTTL:
+    """
+    Caché en memoria con expiración por tiempo (TTL) y desalojo LRU.
+
+    Es segura entre hilos. `version` aumenta cada vez que se invalida, lo que
+    permite saber si un valor calculado fuera de la caché sigue vigente;
+    `invalidada_en` guarda el instante (time.monotonic) de la última invalidación.
+    """
+
+    def __init__(self, maximo=256, ttl=60.0):
+        self.maximo = maximo
+        self.ttl = ttl
+        self.version = 0
+        self.invalidada_en = float("-inf")
+        self.aciertos = 0
+        self.fallos = 0
+        self.desalojos = 0
+        self._datos = OrderedDict()
+        self._lock = threading.Lock()
+
+    def obtener(self, clave, defecto=None):
+        """
+        Retorna el valor guardado para `clave` o `defecto` si no existe o expiró.
+        """
+        ahora = time.monotonic()
+        with self._lock:
+            entrada = self._datos.get(clave, _AUSENTE)
+            if entrada is _AUSENTE or entrada[0] <= ahora:
+                if entrada is not _AUSENTE:
+                    del self._datos[clave]
+                self.fallos += 1
+                return defecto
+            self._datos.move_to_end(clave)
+            self.aciertos += 1
+            return entrada[1]
+
+    def guardar(self, clave, valor, version=None, ttl=None):
+        """
+        Guarda `valor` para `clave`. Si se indica `version` y la caché fue
+        invalidada desde entonces, el valor se descarta por estar obsoleto.
+        `ttl` reemplaza el tiempo de vida por defecto para esta entrada.
+        """
+        with self._lock:
+            if version is not None and version != self.version:
+                return
+            self._datos[clave] = (time.monotonic() + (self.ttl if ttl is None else ttl), valor)
+            self._datos.move_to_end(clave)
+            while len(self._datos) > self.maximo:
+                self._datos.popitem(last=False)
+                self.desalojos += 1
+
+    def invalidar(self, clave=_AUSENTE):
+        """
+        Elimina una clave o, sin argumentos, toda la caché.
+        """
+        with self._lock:
+            if clave is _AUSENTE:
+                self._datos.clear()
+            else:
+                self._datos.pop(clave, None)
+            self.version += 1
+            self.invalidada_en = time.monotonic()
+
+    def invalidarSi(self, condicion):
+        """
+        Elimina las claves para las que `condicion(clave)` es verdadera.
+        """
+        with self._lock:
+            for clave in [c for c in self._datos if condicion(c)]:
+                del self._datos[clave]
+            self.version += 1
+            self.invalidada_en = time.monotonic()
+
+    def metricas(self):
+        with self._lock:
+            return {
+                "entradas": len(self._datos),
+                "aciertos": self.aciertos,
+                "fallos": self.fallos,
+                "desalojos": self.desalojos,
+                "version": self.version,
+            }
@@ -0,0 +1,205 @@
+import re
+import threading
+
+import psycopg2.errors
+
+from metricas import REGISTRO, Contador
+
+
+preparaciones = REGISTRO.registrar(Contador(
+    "bd_sentencias_preparadas_total", "Sentencias preparadas en el servidor por consulta.", ("consulta",)
+))
+
+_MARCADOR = re.compile(r"%%|%s|%\((\w+)\)s")
+
+
+class Consulta:
+    """
+    Sentencia con nombre que se prepara en el servidor (PREPARE) la primera vez
+    que se usa en cada conexión; las siguientes solo envían EXECUTE con los
+    parámetros, sin volver a analizar ni planificar el SQL.
+
+    `sql` usa los marcadores de psycopg2: posicionales (%s) o con nombre
+    (%(nombre)s, que recibe un diccionario). `tipos` fija el tipo de los
+    parámetros cuando PostgreSQL no puede inferirlo.
+    """
+
+    def __init__(self, nombre, sql, tipos=()):
+        self.nombre = nombre
+        self.sql = sql
+        self.parametros = 0
+        self.nombres = []  # Nombre de cada parámetro, si la consulta los usa con nombre
+
+        def numerar(marcador):
+            if marcador.group() == "%%":
+                return "%"
+            clave = marcador.group(1)
+            if clave is not None:
+                if clave not in self.nombres:
+                    self.nombres.append(clave)
+                return f"${self.nombres.index(clave) + 1}"
+            self.parametros += 1
+            return f"${self.parametros}"
+
+        cuerpo = _MARCADOR.sub(numerar, sql)
+        if self.nombres and self.parametros:
+            raise ValueError(f"{nombre} mezcla parámetros posicionales y con nombre.")
+        self.parametros = self.parametros or len(self.nombres)
+        tipos = f" ({', '.join(tipos)})" if tipos else ""
+        self._prepare = f"PREPARE {nombre}{tipos} AS {cuerpo}"
+        if self.parametros:
+            self._execute = f"EXECUTE {nombre} ({', '.join(['%s'] * self.parametros)})"
+        else:
+            self._execute = f"EXECUTE {nombre}"
+
+    def ejecutar(self, cursor, parametros=()):
+        """
+        Ejecuta la sentencia en `cursor`, preparándola antes si la conexión aún no la tiene.
+        """
+        if self.nombres:
+            if isinstance(parametros, dict):
+                parametros_sql = parametros
+                parametros = tuple(parametros[clave] for clave in self.nombres)
+            else:
+                raise ValueError(f"{self.nombre} espera un diccionario de parámetros.")
+        else:
+            parametros_sql = parametros = tuple(parametros)
+        if len(parametros) != self.parametros:
+            raise ValueError(f"{self.nombre} espera {self.parametros} parámetros.")
+        preparadas = getattr(cursor.connection, "preparadas", None)
+        if preparadas is None:
+            # Conexión fuera del pool: se envía el SQL tal cual
+            cursor.execute(self.sql, parametros_sql)
+            return cursor
+        if self.nombre not in preparadas:
+            cursor.execute(self._prepare)
+            preparadas.add(self.nombre)
+            preparaciones.incrementar(self.nombre)
+        try:
+            cursor.execute(self._execute, parametros)
+        except psycopg2.errors.InvalidSqlStatementName:
+            # La sesión perdió la sentencia (p. ej. un DISCARD ALL): se prepara en la próxima llamada
+            preparadas.discard(self.nombre)
+            raise
+        return cursor
+
+
+_consultas = {}
+_lock = threading.Lock()
+
+
+def registrar(nombre, sql, tipos=()):
+    """
+    Agrega una consulta al registro. Los nombres son únicos en todo el proceso.
+    """
+    with _lock:
+        if nombre in _consultas:
+            raise ValueError(f"La consulta {nombre} ya está registrada.")
+        consulta = _consultas[nombre] = Consulta(nombre, sql, tipos)
+    return consulta
+
+
+def obtenerOCrear(nombre, construir):
+    """
+    Retorna la consulta `nombre`, registrándola con `construir()` -> (sql, tipos)
+    si aún no existe. Pensada para los planes generados por `ConstructorConsulta`.
+    """
+    consulta = _consultas.get(nombre)
+    if consulta is not None:
+        return consulta
+    sql, tipos = construir()
+    with _lock:
+        return _consultas.setdefault(nombre, Consulta(nombre, sql, tipos))
+
+
+def consultas():
+    """
+    Retorna los nombres de las consultas registradas.
+    """
+    return sorted(_consultas)
+
+
+class ConstructorConsulta:
+    """
+    Arma consultas con filtros y ordenamiento elegidos de listas blancas.
+
+    Cada combinación de filtros activos y orden produce siempre el mismo SQL y el
+    mismo nombre, así que el conjunto de planes es finito y cada uno se prepara
+    una sola vez por conexión. Los valores del usuario solo viajan como
+    parámetros; un orden fuera de la lista blanca lanza ValueError.
+
+    - `base`: SELECT ... FROM ... sin WHERE.
+    - `filtros`: {nombre: condición con %s}, en el orden en que se aplican.
+    - `ordenes`: {nombre aceptado: expresión SQL}.
+    - `orden_defecto`: expresión ORDER BY cuando no se pide orden, o None.
+    - `sufijo`: SQL fijo al final, por ejemplo "LIMIT %s".
+    - `agrupacion`: expresión GROUP BY, que va entre los filtros y el orden.
+    """
+
+    def __init__(self, nombre, base, filtros, ordenes=None, orden_defecto=None, sufijo="", agrupacion=None):
+        self.nombre = nombre
+        self.base = base
+        self.filtros = filtros
+        self.ordenes = ordenes or {}
+        self.orden_defecto = orden_defecto
+        self.sufijo = sufijo
+        self.agrupacion = agrupacion
+        self._indices = {filtro: i for i, filtro in enumerate(filtros)}
+        self._marcadores = {filtro: condicion.count("%s") for filtro, condicion in filtros.items()}
+
+    def resolverOrden(self, orden):
+        """
+        Convierte 'nombre', 'recurso.nombre DESC' o '-nombre' en (clave, dirección).
+        """
+        if not orden:
+            return None, None
+        texto = orden.strip().lower()
+        direccion = "ASC"
+        if texto.startswith("-"):
+            texto, direccion = texto[1:], "DESC"
+        partes = texto.split()
+        if len(partes) == 2 and partes[1] in ("asc", "desc"):
+            texto, direccion = partes[0], partes[1].upper()
+        elif len(partes) != 1:
+            raise ValueError(f"Orden no válido: {orden}")
+        clave = texto.rsplit(".", 1)[-1]
+        if clave not in self.ordenes:
+            raise ValueError(f"Orden no válido: {orden}. Opciones: {', '.join(sorted(self.ordenes))}")
+        return clave, direccion
+
+    def preparar(self, valores, orden=None, extra=()):
+        """
+        Retorna (Consulta, parámetros) para los filtros de `valores` ({filtro: valor})
+        cuyo valor no es None, el `orden` pedido y los parámetros `extra` del sufijo.
+        Un filtro con varios %s recibe una tupla con un valor por marcador.
+        """
+        clave, direccion = self.resolverOrden(orden)
+        activos = sorted((f for f, v in valores.items() if v is not None), key=self._indices.__getitem__)
+        mascara = sum(1 << self._indices[filtro] for filtro in activos)
+        nombre = f"{self.nombre}_{mascara:x}"
+        if clave:
+            nombre += f"_{clave}_{direccion.lower()}"
+
+        parametros = []
+        for filtro in activos:
+            if self._marcadores[filtro] == 1:
+                parametros.append(valores[filtro])
+            else:
+                parametros.extend(valores[filtro])
+        parametros.extend(extra)
+
+        def construir():
+            sql = self.base
+            if activos:
+                sql += " WHERE " + " AND ".join(self.filtros[filtro] for filtro in activos)
+            if self.agrupacion:
+                sql += f" GROUP BY {self.agrupacion}"
+            if clave:
+                sql += f" ORDER BY {self.ordenes[clave]} {direccion}"
+            elif self.orden_defecto:
+                sql += f" ORDER BY {self.orden_defecto}"
+            if self.sufijo:
+                sql += f" {self.sufijo}"
+            return sql, ()
+
+        return obtenerOCrear(nombre, construir), tuple(parametros)
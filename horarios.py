@@ -0,0 +1,127 @@
+import re
+import threading
+from datetime import timedelta
+
+
+DIAS_SEMANA = ["Lunes", "Martes", "Miércoles", "Jueves", "Viernes", "Sábado", "Domingo"]
+
+# Índice del día (0 = lunes, igual que date.weekday()) aceptando variantes sin tilde
+_INDICE_DIA = {}
+for _i, _dia in enumerate(DIAS_SEMANA):
+    _INDICE_DIA[_dia.lower()] = _i
+    _INDICE_DIA[_dia.lower().replace("é", "e").replace("á", "a")] = _i
+
+# Segmentos del tipo 'Lunes a Viernes 07:00-19:00' o 'Sábado 08:00-12:00'
+_PATRON_SEGMENTO = re.compile(r"(\w+)(?:\s+a\s+(\w+))?\s+(\d{2}):(\d{2})-(\d{2}):(\d{2})")
+
+
+class Horario:
+    """
+    Horario de disponibilidad de un recurso ya interpretado.
+
+    `rangos[d]` contiene los intervalos (inicio, fin) en minutos desde la
+    medianoche para el día `d` de la semana (0 = lunes). Ambos extremos son
+    inclusivos, como en la validación original.
+    """
+
+    __slots__ = ("texto", "rangos", "_dias")
+
+    def __init__(self, texto):
+        self.texto = texto
+        rangos = [[] for _ in DIAS_SEMANA]
+        dias = []
+
+        for segmento in re.split(r"[,;]", texto or ""):
+            match = _PATRON_SEGMENTO.fullmatch(segmento.strip())
+            if not match:
+                continue
+            dia_inicio, dia_fin, h1, m1, h2, m2 = match.groups()
+            i_inicio = _INDICE_DIA.get(dia_inicio.lower())
+            i_fin = _INDICE_DIA.get((dia_fin or dia_inicio).lower())
+            if i_inicio is None or i_fin is None:
+                continue
+
+            inicio = int(h1) * 60 + int(m1)
+            fin = int(h2) * 60 + int(m2)
+            horas = f"{h1}:{m1}-{h2}:{m2}"
+            # Permite rangos que cruzan el domingo, p. ej. 'Viernes a Lunes'
+            for paso in range((i_fin - i_inicio) % 7 + 1):
+                dia = (i_inicio + paso) % 7
+                rangos[dia].append((inicio, fin))
+                dias.append(f"{DIAS_SEMANA[dia]} {horas}")
+
+        self.rangos = tuple(tuple(r) for r in rangos)
+        self._dias = dias
+
+    def abierto(self, fecha, hora):
+        """
+        Indica si el recurso está disponible el día `fecha` a la hora `hora`.
+        """
+        minuto = hora.hour * 60 + hora.minute
+        for inicio, fin in self.rangos[fecha.weekday()]:
+            if inicio <= minuto <= fin:
+                return True
+        return False
+
+    def franjas(self, fecha, duracion=60):
+        """
+        Retorna las horas de inicio (en minutos) de las franjas de `duracion`
+        minutos que caben en el horario del día `fecha`.
+        """
+        inicios = []
+        for inicio, fin in self.rangos[fecha.weekday()]:
+            inicios.extend(range(inicio, fin - duracion + 1, duracion))
+        return sorted(set(inicios))
+
+    def dias(self):
+        """
+        Retorna una lista con cada día y su horario, p. ej. ['Lunes 08:00-18:00', ...].
+        """
+        return list(self._dias)
+
+
+_horarios = {}
+_lock = threading.Lock()
+
+
+def obtenerHorario(id_recurso, texto):
+    """
+    Retorna el Horario del recurso, interpretando el texto solo la primera vez
+    o cuando el texto guardado en la base de datos cambió.
+    """
+    horario = _horarios.get(id_recurso)
+    if horario is not None and horario.texto == texto:
+        return horario
+    horario = Horario(texto)
+    with _lock:
+        _horarios[id_recurso] = horario
+    return horario
+
+
+def horarioEnCache(id_recurso):
+    """
+    Retorna el último Horario interpretado para el recurso, o None.
+    """
+    return _horarios.get(id_recurso)
+
+
+def expandirRecurrencia(fecha_inicio, fecha_fin, dias_semana=None, cada_semanas=1, excluir=()):
+    """
+    Retorna las fechas entre `fecha_inicio` y `fecha_fin` (inclusive) que caen en
+    `dias_semana` (0 = lunes; por defecto el día de `fecha_inicio`), repitiendo
+    cada `cada_semanas` semanas y omitiendo las fechas de `excluir`.
+    """
+    if cada_semanas < 1:
+        raise ValueError("cada_semanas debe ser mayor o igual a 1.")
+    dias = set(dias_semana) if dias_semana else {fecha_inicio.weekday()}
+    excluidas = set(excluir)
+    lunes_inicial = fecha_inicio - timedelta(days=fecha_inicio.weekday())
+
+    fechas = []
+    fecha = fecha_inicio
+    while fecha <= fecha_fin:
+        semana = (fecha - lunes_inicial).days // 7
+        if fecha.weekday() in dias and semana % cada_semanas == 0 and fecha not in excluidas:
+            fechas.append(fecha)
+        fecha += timedelta(days=1)
+    return fechas
@@ -0,0 +1,197 @@
+import threading
+import time
+from collections import OrderedDict
+
+from metricas import REGISTRO, Contador
+
+
+intentos_login = REGISTRO.registrar(Contador(
+    "login_intentos_total", "Intentos de login por ámbito y resultado.", ("ambito", "resultado")
+))
+
+
+class AlmacenLimites:
+    """
+    Estado de las cubetas de tokens y de los bloqueos por clave.
+
+    `AlmacenMemoria` lo guarda en el proceso; para compartir los límites entre
+    workers o servidores basta con otra subclase que implemente estos métodos
+    de forma atómica sobre un almacén común (p. ej. un script de Redis) y
+    pasarla a `LimitadorLogin`. Ningún método debe consultar la base de datos.
+    `ahora` es la hora del sistema (`time.time()`), comparable entre procesos.
+    """
+
+    def tomar(self, clave, capacidad, por_segundo, ahora):
+        """
+        Toma un token de la cubeta `clave`. Retorna 0 si lo obtuvo o los
+        segundos que faltan para que haya uno.
+        """
+        raise NotImplementedError
+
+    def bloqueo(self, clave, ahora):
+        """
+        Retorna los segundos que le quedan de bloqueo a `clave` (0 si no está bloqueada).
+        """
+        raise NotImplementedError
+
+    def registrarFallo(self, clave, ahora, umbral, base, maximo, ventana):
+        """
+        Suma un fallo a `clave`. Al llegar a `umbral` fallos seguidos la bloquea
+        por `base` segundos, el doble en cada bloqueo siguiente hasta `maximo`.
+        Los fallos se olvidan tras `ventana` segundos sin intentos fallidos.
+        Retorna los segundos de bloqueo aplicados (0 si no se bloqueó).
+        """
+        raise NotImplementedError
+
+    def limpiar(self, clave):
+        """
+        Olvida los fallos y bloqueos de `clave`, tras un login correcto.
+        """
+        raise NotImplementedError
+
+    def metricas(self):
+        return {}
+
+
+class AlmacenMemoria(AlmacenLimites):
+    """
+    Almacén en memoria, seguro entre hilos. Guarda como mucho `maximo` claves
+    por tipo y desaloja las usadas hace más tiempo, para que una ráfaga con IPs
+    o correos inventados no haga crecer la memoria sin límite.
+    """
+
+    def __init__(self, maximo=100_000):
+        self.maximo = maximo
+        self._cubetas = OrderedDict()  # clave -> [tokens, instante]
+        self._fallos = OrderedDict()  # clave -> [fallos, bloqueos, bloqueada_hasta, ultimo_fallo]
+        self._lock = threading.Lock()
+
+    def _recortar(self, datos):
+        while len(datos) > self.maximo:
+            datos.popitem(last=False)
+
+    def tomar(self, clave, capacidad, por_segundo, ahora):
+        with self._lock:
+            cubeta = self._cubetas.get(clave)
+            if cubeta is None:
+                cubeta = self._cubetas[clave] = [float(capacidad), ahora]
+                self._recortar(self._cubetas)
+            else:
+                self._cubetas.move_to_end(clave)
+                # max(): si el reloj del sistema retrocede no se quitan tokens
+                cubeta[0] = min(float(capacidad), cubeta[0] + max(0.0, ahora - cubeta[1]) * por_segundo)
+                cubeta[1] = max(cubeta[1], ahora)
+            if cubeta[0] >= 1:
+                cubeta[0] -= 1
+                return 0.0
+            return (1 - cubeta[0]) / por_segundo
+
+    def bloqueo(self, clave, ahora):
+        with self._lock:
+            estado = self._fallos.get(clave)
+            return max(0.0, estado[2] - ahora) if estado else 0.0
+
+    def registrarFallo(self, clave, ahora, umbral, base, maximo, ventana):
+        with self._lock:
+            estado = self._fallos.get(clave)
+            if estado is None or ahora - estado[3] > ventana and estado[2] <= ahora:
+                estado = self._fallos[clave] = [0, 0, 0.0, ahora]
+                self._recortar(self._fallos)
+            else:
+                self._fallos.move_to_end(clave)
+            estado[0] += 1
+            estado[3] = ahora
+            if estado[0] < umbral:
+                return 0.0
+            estado[0] = 0
+            estado[1] += 1
+            duracion = min(base * 2 ** (estado[1] - 1), maximo)
+            estado[2] = ahora + duracion
+            return duracion
+
+    def limpiar(self, clave):
+        with self._lock:
+            self._fallos.pop(clave, None)
+
+    def metricas(self):
+        ahora = time.time()
+        with self._lock:
+            return {
+                "cubetas": len(self._cubetas),
+                "claves_con_fallos": len(self._fallos),
+                "bloqueadas": sum(1 for estado in self._fallos.values() if estado[2] > ahora),
+            }
+
+
+class LoginLimitado(Exception):
+    """
+    Se lanza cuando un intento de login se rechaza por límite o bloqueo.
+    `espera` son los segundos sugeridos para reintentar.
+    """
+
+    def __init__(self, mensaje, espera):
+        super().__init__(mensaje)
+        self.espera = espera
+
+
+class LimitadorLogin:
+    """
+    Limita los intentos de login antes de tocar la base de datos o bcrypt:
+
+    - Una cubeta de tokens por IP y otra por correo.
+    - Bloqueo progresivo del correo tras `umbral` contraseñas incorrectas seguidas.
+
+    `ambito` separa usuarios de empleados en las claves y en las métricas.
+    """
+
+    def __init__(self, almacen=None, ip_capacidad=20, ip_por_minuto=30, correo_capacidad=5,
+                 correo_por_minuto=5, umbral=5, bloqueo_base=30.0, bloqueo_maximo=900.0, ventana=900.0):
+        self.almacen = almacen or AlmacenMemoria()
+        self.ip_capacidad = ip_capacidad
+        self.ip_por_segundo = ip_por_minuto / 60
+        self.correo_capacidad = correo_capacidad
+        self.correo_por_segundo = correo_por_minuto / 60
+        self.umbral = umbral
+        self.bloqueo_base = bloqueo_base
+        self.bloqueo_maximo = bloqueo_maximo
+        self.ventana = ventana
+
+    @staticmethod
+    def _correo(ambito, correo):
+        return f"{ambito}:correo:{correo.strip().lower()}"
+
+    def verificar(self, ambito, ip, correo):
+        """
+        Lanza LoginLimitado si el intento no debe llegar a verificarse.
+        """
+        ahora = time.time()
+        clave_correo = self._correo(ambito, correo)
+        espera = self.almacen.bloqueo(clave_correo, ahora)
+        if espera:
+            intentos_login.incrementar(ambito, "bloqueado")
+            raise LoginLimitado("Demasiados intentos fallidos, la cuenta está bloqueada temporalmente.", espera)
+        espera = self.almacen.tomar(f"{ambito}:ip:{ip}", self.ip_capacidad, self.ip_por_segundo, ahora)
+        if espera:
+            intentos_login.incrementar(ambito, "limitado_ip")
+            raise LoginLimitado("Demasiados intentos de login desde esta dirección.", espera)
+        espera = self.almacen.tomar(clave_correo, self.correo_capacidad, self.correo_por_segundo, ahora)
+        if espera:
+            intentos_login.incrementar(ambito, "limitado_correo")
+            raise LoginLimitado("Demasiados intentos de login para este correo.", espera)
+
+    def exito(self, ambito, correo):
+        intentos_login.incrementar(ambito, "exito")
+        self.almacen.limpiar(self._correo(ambito, correo))
+
+    def fallo(self, ambito, correo):
+        """
+        Registra una contraseña incorrecta. Retorna los segundos de bloqueo aplicados.
+        """
+        intentos_login.incrementar(ambito, "fallo")
+        duracion = self.almacen.registrarFallo(
+            self._correo(ambito, correo), time.time(),
+            self.umbral, self.bloqueo_base, self.bloqueo_maximo, self.ventana
+        )
+        if duracion:
+            intentos_login.incrementar(ambito, "bloqueo")
+        return duracion
@@ -0,0 +1,138 @@
+import atexit
+import contextvars
+import json
+import logging
+import logging.handlers
+import os
+import queue
+import random
+import re
+import sys
+from datetime import datetime, timezone
+
+
+# Datos de la petición en curso, agregados a cada registro
+request_id = contextvars.ContextVar("request_id", default=None)
+ruta_actual = contextvars.ContextVar("ruta_actual", default=None)
+
+# Atributos estándar de LogRecord: todo lo demás se considera un campo extra
+_ATRIBUTOS_ESTANDAR = set(vars(logging.LogRecord("", 0, "", 0, "", None, None))) | {"message", "asctime"}
+
+_CAMPOS_SENSIBLES = re.compile(r"contrasena|password|token|authorization|secret", re.IGNORECASE)
+_PATRONES_SENSIBLES = [
+    (re.compile(r"(Bearer\s+)[A-Za-z0-9\-_\.=]+", re.IGNORECASE), r"\1[REDACTADO]"),
+    (re.compile(r"eyJ[A-Za-z0-9\-_]+\.[A-Za-z0-9\-_]+\.[A-Za-z0-9\-_]*"), "[REDACTADO]"),
+    (re.compile(r"\$2[aby]\$\d{2}\$[./A-Za-z0-9]{53}"), "[REDACTADO]"),
+    (re.compile(r"((?:contrasena|password)\W{1,3})[^\s,'\"}]+", re.IGNORECASE), r"\1[REDACTADO]"),
+]
+
+
+def redactar(valor):
+    """
+    Oculta tokens, hashes y contraseñas en textos y diccionarios.
+    """
+    if isinstance(valor, str):
+        for patron, reemplazo in _PATRONES_SENSIBLES:
+            valor = patron.sub(reemplazo, valor)
+        return valor
+    if isinstance(valor, dict):
+        return {
+            clave: "[REDACTADO]" if _CAMPOS_SENSIBLES.search(str(clave)) else redactar(dato)
+            for clave, dato in valor.items()
+        }
+    if isinstance(valor, (list, tuple)):
+        return [redactar(dato) for dato in valor]
+    return valor
+
+
+class FormatoJSON(logging.Formatter):
+    """
+    Da formato a cada registro como una línea JSON.
+    """
+
+    def format(self, record):
+        datos = {
+            "ts": datetime.fromtimestamp(record.created, timezone.utc).isoformat(timespec="milliseconds"),
+            "nivel": record.levelname,
+            "logger": record.name,
+            "mensaje": redactar(record.getMessage()),
+        }
+        if getattr(record, "request_id", None):
+            datos["request_id"] = record.request_id
+        if getattr(record, "ruta", None):
+            datos["ruta"] = record.ruta
+        for clave, valor in vars(record).items():
+            if clave not in _ATRIBUTOS_ESTANDAR and clave not in datos and clave not in ("request_id", "ruta"):
+                datos[clave] = "[REDACTADO]" if _CAMPOS_SENSIBLES.search(clave) else redactar(valor)
+        if record.exc_info:
+            datos["excepcion"] = redactar(self.formatException(record.exc_info))
+        return json.dumps(datos, ensure_ascii=False, default=str)
+
+
+class FiltroContexto(logging.Filter):
+    """
+    Agrega el request_id y la ruta de la petición en curso. Se aplica antes de
+    encolar, mientras el registro aún está en el contexto de la petición.
+    """
+
+    def filter(self, record):
+        record.request_id = request_id.get()
+        record.ruta = ruta_actual.get()
+        return True
+
+
+class FiltroMuestreo(logging.Filter):
+    """
+    Conserva solo una fracción de los registros de cada nivel.
+    Los niveles sin tasa configurada se conservan siempre.
+    """
+
+    def __init__(self, tasas):
+        super().__init__()
+        self.tasas = tasas
+
+    def filter(self, record):
+        tasa = self.tasas.get(record.levelno)
+        return tasa is None or tasa >= 1 or random.random() < tasa
+
+
+def leerTasas(texto):
+    """
+    Convierte 'INFO=0.1,DEBUG=0' en {logging.INFO: 0.1, logging.DEBUG: 0.0}.
+    """
+    tasas = {}
+    for par in (texto or "").split(","):
+        if "=" in par:
+            nivel, tasa = par.split("=", 1)
+            tasas[logging.getLevelName(nivel.strip().upper())] = float(tasa)
+    return tasas
+
+
+_receptor = None
+
+
+def configurarLogs(nivel=None, muestreo=None):
+    """
+    Configura el logger raíz para escribir JSON por una cola: quien registra
+    solo encola y un hilo aparte escribe en stdout.
+    Nivel y muestreo se leen de LOG_NIVEL y LOG_MUESTREO ('INFO=0.1,DEBUG=0').
+    """
+    global _receptor
+    if _receptor is not None:
+        return
+
+    salida = logging.StreamHandler(sys.stdout)
+    salida.setFormatter(FormatoJSON())
+
+    cola = queue.SimpleQueue()
+    encolador = logging.handlers.QueueHandler(cola)
+    encolador.addFilter(FiltroMuestreo(leerTasas(muestreo if muestreo is not None else os.getenv("LOG_MUESTREO"))))
+    encolador.addFilter(FiltroContexto())
+
+    raiz = logging.getLogger()
+    raiz.handlers = [encolador]
+    raiz.setLevel(nivel or os.getenv("LOG_NIVEL", "INFO"))
+
+    _receptor = logging.handlers.QueueListener(cola, salida, respect_handler_level=True)
+    _receptor.start()
+    atexit.register(_receptor.stop)
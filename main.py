@@ -1,12 +1,29 @@
+import asyncio
+import csv
+import hashlib
+import io
 import json
-from fastapi import FastAPI, HTTPException, Query, Header
+import os
+import logging
+import math
+import uuid
+import orjson
+from time import perf_counter
+from typing import Literal
+from fastapi import FastAPI, HTTPException, Query, Header, Depends, UploadFile, File, Request
 from fastapi.middleware import Middleware
-from fastapi.responses import JSONResponse
+from fastapi.responses import JSONResponse, StreamingResponse, PlainTextResponse, Response, ORJSONResponse
 from pydantic import BaseModel
 from fastapi.middleware.cors import CORSMiddleware
 from fastapi.encoders import jsonable_encoder
-from datetime import date, time
-from BD import ConexionBD,TokenHandler
+from contextlib import asynccontextmanager
+from datetime import date, time, datetime
+from BD import ConexionBD,ConexionBDAsync,TokenHandler,ServicioSaturado,BaseDeDatosNoDisponible,leer_del_primario
+from horarios import expandirRecurrencia
+from metricas import REGISTRO, Medidor, peticiones_http, iniciarMedicion, terminarMedicion
+from logs import configurarLogs, request_id, ruta_actual
+from avisos import Difusor, SuscripcionesAgotadas, escuchar
+from limites import LimitadorLogin, AlmacenMemoria, LoginLimitado
 
 
 class Login(BaseModel):
@@ -35,6 +52,23 @@ class Reserva(BaseModel):
     hora_reserva: time
     estado: str= "Vigente"
 
+class Recurrencia(BaseModel):
+    fecha_inicio: date
+    fecha_fin: date
+    dias_semana: list[int] = []  # 0 = lunes; vacío = el día de fecha_inicio
+    cada_semanas: int = 1
+    excluir: list[date] = []
+
+class ReservaLote(BaseModel):
+    id_usuario: int
+    id_recurso: int
+    hora_reserva: time
+    fechas: list[date] = []
+    recurrencia: Recurrencia = None
+
+MAX_RESERVAS_LOTE = 500
+MAX_DEVOLUCIONES_LOTE = 200
+
 class ReservaCancelar(BaseModel):
     id_reserva: int
 
@@ -47,7 +81,7 @@ class TipoRecurso(BaseModel):
     
 class Prestamo(BaseModel):
     id_reserva: int
-    id_empleado: int
+    id_empleado: int = None  # Opcional: se usa el empleado del token
     fecha_prestamo: date
     hora_prestamo: time
     
@@ -56,10 +90,125 @@ class Devolucion(BaseModel):
     fecha_devolucion: date
     hora_devolucion: time
     id_empleado: int
+
+class DevolucionLote(BaseModel):
+    id_prestamo: int
+    fecha_devolucion: date
+    hora_devolucion: time
+
+class CarritoDevoluciones(BaseModel):
+    devoluciones: list[DevolucionLote]
     
 
 
-app = FastAPI()
+configurarLogs()
+logger = logging.getLogger("integraservicios.acceso")
+
+# Barrido periódico del estado de las reservas (0 lo desactiva)
+BARRIDO_INTERVALO = float(os.getenv("BARRIDO_RESERVAS_INTERVALO", "60"))
+BARRIDO_LOTE = int(os.getenv("BARRIDO_RESERVAS_LOTE", "500"))
+
+
+async def barrer_reservas():
+    """
+    Cada BARRIDO_INTERVALO segundos pasa a Pasado o Vigente las
+    reservas que corresponda, en lotes de hasta BARRIDO_LOTE por transición.
+    Todos los workers lo intentan, pero solo el que obtiene el advisory lock
+    actúa; si un lote se llenó se repite al segundo para ponerse al día.
+    """
+    registro = logging.getLogger("integraservicios.barrido")
+    while True:
+        pendientes = False
+        try:
+            resultado = await bd.transicionarReservas(datetime.now(), BARRIDO_LOTE)
+            if isinstance(resultado, str):
+                registro.error(resultado)
+            elif resultado:
+                pendientes = resultado.pop("pendientes")
+                if any(resultado.values()):
+                    registro.info("Reservas actualizadas", extra=resultado)
+        except Exception:
+            registro.exception("Error en el barrido de reservas")
+        await asyncio.sleep(1 if pendientes else BARRIDO_INTERVALO)
+
+
+# Refresco incremental de las estadísticas de uso (0 lo desactiva)
+ESTADISTICAS_INTERVALO = float(os.getenv("ESTADISTICAS_INTERVALO", "30"))
+ESTADISTICAS_LOTE = int(os.getenv("ESTADISTICAS_LOTE", "1000"))
+
+
+async def refrescar_estadisticas():
+    """
+    Cada ESTADISTICAS_INTERVALO segundos recalcula los días de cada recurso que
+    cambiaron desde el último refresco, de a ESTADISTICAS_LOTE por vez; si quedan
+    más se repite al segundo.
+    """
+    registro = logging.getLogger("integraservicios.estadisticas")
+    while True:
+        pendientes = False
+        try:
+            resultado = await bd.refrescarEstadisticas(ESTADISTICAS_LOTE)
+            if isinstance(resultado, str):
+                registro.error(resultado)
+            else:
+                pendientes = resultado >= ESTADISTICAS_LOTE
+        except Exception:
+            registro.exception("Error al refrescar las estadísticas de uso")
+        await asyncio.sleep(1 if pendientes else ESTADISTICAS_INTERVALO)
+
+
+# Avisos de disponibilidad por NOTIFY (AVISOS_DISPONIBILIDAD=0 los desactiva)
+AVISOS_DISPONIBILIDAD = os.getenv("AVISOS_DISPONIBILIDAD", "1") != "0"
+AVISOS_LATIDO = float(os.getenv("AVISOS_LATIDO", "15"))  # Segundos entre comentarios para mantener viva la conexión
+difusor = Difusor(
+    capacidad=int(os.getenv("AVISOS_COLA", "16")),
+    maximo=int(os.getenv("AVISOS_SUSCRIPCIONES_MAX", "1000"))
+)
+
+
+def recibir_aviso(payload):
+    """
+    Invalida las cachés de este worker afectadas por el cambio y lo reenvía
+    a los suscriptores.
+    """
+    evento = orjson.loads(payload)
+    if evento["fecha"] is None:
+        ConexionBD.invalidarCacheRecursos()
+    else:
+        ConexionBD.invalidarDisponibilidad(date.fromisoformat(evento["fecha"]))
+    difusor.publicar(evento)
+
+
+def avisos_perdidos():
+    ConexionBD.invalidarCacheRecursos()
+    difusor.resincronizar()
+
+
+@asynccontextmanager
+async def ciclo_de_vida(app):
+    tareas = []
+    if AVISOS_DISPONIBILIDAD:
+        parametros = {
+            "user": ConexionBD.user,
+            "password": ConexionBD.password,
+            "host": ConexionBD.host,
+            "port": ConexionBD.port,
+            "dbname": ConexionBD.dbname,
+        }
+        tareas.append(asyncio.create_task(escuchar(parametros, "disponibilidad", recibir_aviso, avisos_perdidos)))
+    if BARRIDO_INTERVALO > 0:
+        tareas.append(asyncio.create_task(barrer_reservas()))
+    if ESTADISTICAS_INTERVALO > 0:
+        tareas.append(asyncio.create_task(refrescar_estadisticas()))
+    try:
+        yield
+    finally:
+        for tarea in tareas:
+            tarea.cancel()
+
+
+app = FastAPI(lifespan=ciclo_de_vida)
+bd = ConexionBDAsync()
 
 origins = [
     "https://integraservicios-gx5d.onrender.com",
@@ -73,25 +222,250 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
+@app.middleware("http")
+async def medir_peticiones(request: Request, call_next):
+    """
+    Registra la latencia de cada petición por ruta (la plantilla, no la URL) y código de estado,
+    y escribe una línea de acceso con el id de la petición y el tiempo en la base de datos.
+    """
+    id_peticion = request.headers.get("x-request-id") or uuid.uuid4().hex
+    token_id = request_id.set(id_peticion)
+    token_ruta = ruta_actual.set(request.url.path)
+    medicion, token_medicion = iniciarMedicion()
+    inicio = perf_counter()
+    estado = 500
+    try:
+        respuesta = await call_next(request)
+        estado = respuesta.status_code
+        respuesta.headers["X-Request-ID"] = id_peticion
+        return respuesta
+    finally:
+        duracion = perf_counter() - inicio
+        ruta = request.scope.get("route")
+        ruta = ruta.path if ruta is not None else "sin_ruta"
+        ruta_actual.set(ruta)
+        peticiones_http.observar(duracion, request.method, ruta, estado)
+        logger.log(
+            logging.WARNING if estado >= 500 else logging.INFO,
+            "%s %s %s", request.method, ruta, estado,
+            extra={
+                "metodo": request.method,
+                "estado": estado,
+                "duracion_ms": round(duracion * 1000, 2),
+                "bd_ms": round(medicion.segundos * 1000, 2),
+                "bd_sentencias": medicion.sentencias,
+            }
+        )
+        terminarMedicion(token_medicion)
+        ruta_actual.reset(token_ruta)
+        request_id.reset(token_id)
+
+METODOS_LECTURA = {"GET", "HEAD", "OPTIONS"}
+
+@app.middleware("http")
+async def leer_propias_escrituras(request: Request, call_next):
+    """
+    Con réplica de lectura, tras una escritura exitosa el cliente recibe la cookie
+    bd_primario y mientras dure sus lecturas van al primario, así ve sus propios
+    cambios aunque la réplica esté atrasada.
+    """
+    if ConexionBD.replica_host is None:
+        return await call_next(request)
+    token = leer_del_primario.set(bool(request.cookies.get("bd_primario")))
+    try:
+        respuesta = await call_next(request)
+    finally:
+        leer_del_primario.reset(token)
+    if request.method not in METODOS_LECTURA and respuesta.status_code < 400:
+        segura = request.url.scheme == "https"
+        respuesta.set_cookie(
+            "bd_primario", "1", max_age=int(ConexionBD.replica_retraso_maximo) + 1,
+            httponly=True, secure=segura, samesite="none" if segura else "lax"
+        )
+    return respuesta
+
+# Valores instantáneos que se leen al consultar /metrics
+def _metricas_cache(cache):
+    return lambda: {(clave,): valor for clave, valor in cache.metricas().items()}
+
+REGISTRO.registrar(Medidor(
+    "bd_pool_conexiones", "Estado del pool de conexiones.",
+    lambda: {(clave,): ConexionBD.metricasPool().get(clave, 0) for clave in ("total", "libres", "en_uso", "esperando")},
+    ("estado",)
+))
+REGISTRO.registrar(Medidor(
+    "bd_replica", "Estado del pool de la réplica de lectura y su último atraso medido en segundos.",
+    lambda: {(clave,): ConexionBD.metricasReplica().get(clave, 0) for clave in ("total", "libres", "en_uso", "esperando", "retraso_segundos")},
+    ("valor",)
+))
+REGISTRO.registrar(Medidor(
+    "cache_recursos", "Entradas, aciertos y fallos de la caché del catálogo.",
+    _metricas_cache(ConexionBD.cache_recursos), ("valor",)
+))
+REGISTRO.registrar(Medidor(
+    "cache_disponibilidad", "Entradas, aciertos y fallos de la caché de disponibilidad.",
+    _metricas_cache(ConexionBD.cache_disponibilidad), ("valor",)
+))
+REGISTRO.registrar(Medidor(
+    "avisos_disponibilidad", "Suscripciones abiertas, avisos recibidos y colas desbordadas en este worker.",
+    lambda: {(clave,): valor for clave, valor in difusor.metricas().items()}, ("valor",)
+))
+REGISTRO.registrar(Medidor(
+    "login_limites", "Claves seguidas por el limitador de login y cuentas bloqueadas.",
+    lambda: {(clave,): valor for clave, valor in limitador_login.almacen.metricas().items()}, ("valor",)
+))
+REGISTRO.registrar(Medidor(
+    "jwt_verificaciones", "Verificaciones y rechazos de tokens.",
+    lambda: {(clave,): TokenHandler.metricas()[clave] for clave in ("verificaciones", "rechazos", "revocados")},
+    ("valor",)
+))
+
+@app.get('/metrics', include_in_schema=False)
+async def metrics():
+    """
+    Expone las métricas en el formato de texto de Prometheus.
+    """
+    return PlainTextResponse(REGISTRO.exponer(), media_type="text/plain; version=0.0.4")
+
+def token_de_cabecera(authorization: str = Header(None)):
+    """
+    Extrae el token de la cabecera "Authorization: Bearer TOKEN".
+    """
+    if not authorization:
+        raise HTTPException(status_code=403, detail="Token no proporcionado.")
+    return authorization.split("Bearer ")[-1]
+
+
+def empleado_autenticado(token: str = Depends(token_de_cabecera)):
+    """
+    Dependencia para endpoints de empleados: retorna el ID del empleado del token.
+    No consulta la base de datos.
+    """
+    id_empleado = TokenHandler.verificar_token(token)
+    if not id_empleado:
+        raise HTTPException(status_code=403, detail="Token inválido o expirado.")
+    return id_empleado
+
+
+# Segundos que un cliente puede reutilizar el catálogo sin volver a preguntar
+CATALOGO_MAX_AGE = int(os.getenv("CATALOGO_MAX_AGE", "5"))
+
+
+def etag_coincide(if_none_match, etag):
+    """
+    Comparación débil de If-None-Match (RFC 9110): acepta "*" y listas de ETags.
+    """
+    if not if_none_match:
+        return False
+    etiquetas = {e.strip().removeprefix("W/") for e in if_none_match.split(",")}
+    return "*" in etiquetas or etag in etiquetas
+
+
+async def respuesta_catalogo(request: Request, clave, obtener):
+    """
+    Responde una consulta del catálogo con ETag y Cache-Control.
+
+    El JSON ya serializado y su ETag (hash del contenido) se guardan en la caché
+    del catálogo, así que se invalidan junto con los datos. Si el cliente envía
+    un If-None-Match que coincide se responde 304 sin consultar la base de datos.
+    `obtener` es una corrutina que retorna el cuerpo o lanza HTTPException.
+    """
+    cache = ConexionBD.cache_recursos
+    clave = ("respuesta",) + clave
+    entrada = cache.obtener(clave)
+    if entrada is None:
+        version = cache.version
+        cuerpo = orjson.dumps(await obtener())
+        entrada = ('"' + hashlib.sha256(cuerpo).hexdigest()[:32] + '"', cuerpo)
+        cache.guardar(clave, entrada, version)
+
+    etag, cuerpo = entrada
+    cabeceras = {"ETag": etag, "Cache-Control": f"public, max-age={CATALOGO_MAX_AGE}"}
+    if etag_coincide(request.headers.get("if-none-match"), etag):
+        return Response(status_code=304, headers=cabeceras)
+    return Response(cuerpo, media_type="application/json", headers=cabeceras)
+
+
+# Límites de intentos de login, aplicados antes de consultar la base de datos o bcrypt
+limitador_login = LimitadorLogin(
+    AlmacenMemoria(maximo=int(os.getenv("LOGIN_CLAVES_MAX", "100000"))),
+    ip_capacidad=int(os.getenv("LOGIN_IP_CAPACIDAD", "20")),
+    ip_por_minuto=float(os.getenv("LOGIN_IP_POR_MINUTO", "30")),
+    correo_capacidad=int(os.getenv("LOGIN_CORREO_CAPACIDAD", "5")),
+    correo_por_minuto=float(os.getenv("LOGIN_CORREO_POR_MINUTO", "5")),
+    umbral=int(os.getenv("LOGIN_FALLOS_BLOQUEO", "5")),
+    bloqueo_base=float(os.getenv("LOGIN_BLOQUEO_SEGUNDOS", "30")),
+    bloqueo_maximo=float(os.getenv("LOGIN_BLOQUEO_MAXIMO", "900")),
+)
+# Proxies de confianza delante de la API; LOGIN_CONFIAR_PROXY=1 equivale a uno
+LOGIN_PROXIES = int(os.getenv("LOGIN_PROXIES", os.getenv("LOGIN_CONFIAR_PROXY", "0")))
+
+
+def ip_cliente(request: Request):
+    """
+    IP del cliente. Detrás de LOGIN_PROXIES proxies se toma la entrada de
+    X-Forwarded-For que agregó el primero de ellos (la N-ésima desde la
+    derecha); las de más a la izquierda las escribe el cliente y no se usan.
+    """
+    if LOGIN_PROXIES:
+        entradas = [
+            entrada.strip()
+            for cabecera in request.headers.getlist("x-forwarded-for")
+            for entrada in cabecera.split(",")
+            if entrada.strip()
+        ]
+        if entradas:
+            return entradas[-min(LOGIN_PROXIES, len(entradas))]
+    return request.client.host if request.client else "desconocida"
+
+
+def limitar_login(ambito, request, correo):
+    """
+    Rechaza con 429 el intento que supera los límites, sin tocar la base de datos.
+    """
+    try:
+        limitador_login.verificar(ambito, ip_cliente(request), correo)
+    except LoginLimitado as e:
+        raise HTTPException(status_code=429, detail=str(e), headers={"Retry-After": str(math.ceil(e.espera))})
+
+
 @app.post('/validate')
-async def validate_user(l: Login):
+async def validate_user(l: Login, request: Request):
+    limitar_login("usuario", request, l.correo)
     try:
-        valid = ConexionBD.validarLogin(l.correo, l.contrasena)
+        valid = await bd.validarLogin(l.correo, l.contrasena)
         if valid:
+            limitador_login.exito("usuario", l.correo)
             return {"message": "Logeado correctamente","id_usuario": valid}
         else:
+            limitador_login.fallo("usuario", l.correo)
             raise HTTPException(status_code=404, detail="El correo o la contraseña son incorrectos")
+    except HTTPException:
+        raise
+    except ServicioSaturado as e:
+        raise HTTPException(status_code=503, detail=str(e), headers={"Retry-After": "1"})
+    except BaseDeDatosNoDisponible as e:
+        raise HTTPException(status_code=503, detail=str(e))
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
 @app.post('/validateEmpleado')
-async def validate_empleado(l: Login):
+async def validate_empleado(l: Login, request: Request):
+    limitar_login("empleado", request, l.correo)
     try:
-        token = ConexionBD.validarLoginEmpleado(l.correo, l.contrasena)
+        token = await bd.validarLoginEmpleado(l.correo, l.contrasena)
         if token:
+            limitador_login.exito("empleado", l.correo)
             return {"message": "Logeado correctamente", "token": token}
         else:
+            limitador_login.fallo("empleado", l.correo)
             raise HTTPException(status_code=404, detail="El correo o la contraseña son incorrectos")
+    except HTTPException:
+        raise
+    except ServicioSaturado as e:
+        raise HTTPException(status_code=503, detail=str(e), headers={"Retry-After": "1"})
+    except BaseDeDatosNoDisponible as e:
+        raise HTTPException(status_code=503, detail=str(e))
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
     
@@ -101,7 +475,7 @@ async def registrar_usuario(empleado: Empleado):
     Registra un nuevo usuario en la base de datos.
     """
     try:
-        resultado = ConexionBD.registrarEmpleado(
+        resultado = await bd.registrarEmpleado(
             empleado.nombre,
             empleado.cargo,
             empleado.email,
@@ -110,6 +484,10 @@ async def registrar_usuario(empleado: Empleado):
         if "Empleado registrado exitosamente" in resultado:
             return {"message": resultado}
         raise HTTPException(status_code=400, detail=resultado)
+    except HTTPException:
+        raise
+    except ServicioSaturado as e:
+        raise HTTPException(status_code=503, detail=str(e), headers={"Retry-After": "1"})
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 @app.post('/registrarUsuario')
@@ -118,7 +496,7 @@ async def registrar_usuario(usuario: Usuario):
     Registra un nuevo usuario en la base de datos.
     """
     try:
-        resultado = ConexionBD.registrarUsuario(
+        resultado = await bd.registrarUsuario(
             usuario.nombre,
             usuario.email,
             usuario.telefono,
@@ -127,19 +505,86 @@ async def registrar_usuario(usuario: Usuario):
         if "Usuario registrado exitosamente" in resultado:
             return {"message": resultado}
         raise HTTPException(status_code=400, detail=resultado)
+    except HTTPException:
+        raise
+    except ServicioSaturado as e:
+        raise HTTPException(status_code=503, detail=str(e), headers={"Retry-After": "1"})
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
-@app.get('/consultarUsuarios')
-async def consultar_usuarios(id_usuario: int = None):
+MAX_USUARIOS_IMPORTACION = 100_000
+
+def leer_filas_importacion(contenido: bytes, formato: str):
     """
-    Consulta todos los usuarios o un usuario específico por ID.
+    Convierte un archivo CSV (con encabezado) o NDJSON en una lista de diccionarios.
     """
     try:
-        resultado = ConexionBD.consultarUsuarios(id_usuario)
+        texto = contenido.decode("utf-8-sig")
+    except UnicodeDecodeError:
+        raise HTTPException(status_code=400, detail="El archivo debe estar codificado en UTF-8.")
+    if formato == "csv":
+        return list(csv.DictReader(io.StringIO(texto)))
+    filas = []
+    for numero, linea in enumerate(texto.splitlines(), start=1):
+        if not linea.strip():
+            continue
+        try:
+            fila = json.loads(linea)
+        except json.JSONDecodeError:
+            raise HTTPException(status_code=400, detail=f"La línea {numero} no es JSON válido.")
+        if not isinstance(fila, dict):
+            raise HTTPException(status_code=400, detail=f"La línea {numero} no es un objeto JSON.")
+        filas.append(fila)
+    return filas
+
+@app.post('/importarUsuarios')
+async def importar_usuarios(
+    archivo: UploadFile = File(...),
+    formato: str = Query(None, enum=['csv', 'ndjson'])
+):
+    """
+    Registra usuarios de forma masiva desde un archivo CSV o NDJSON con los campos
+    nombre, email, telefono y contrasena. Reporta los errores de cada fila.
+    """
+    formato = formato or ("csv" if (archivo.filename or "").lower().endswith(".csv") else "ndjson")
+    filas = leer_filas_importacion(await archivo.read(), formato)
+    if len(filas) > MAX_USUARIOS_IMPORTACION:
+        raise HTTPException(status_code=400, detail=f"No se pueden importar más de {MAX_USUARIOS_IMPORTACION} usuarios a la vez.")
+    try:
+        resultado = await bd.importarUsuarios(filas)
         if isinstance(resultado, str):  # Si es un mensaje de error
+            raise HTTPException(status_code=400, detail=resultado)
+        return resultado
+    except HTTPException:
+        raise
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+
+@app.get('/consultarUsuarios')
+async def consultar_usuarios(
+    id_usuario: int = None,
+    limit: int = Query(100, ge=1, le=1000),
+    cursor: str = None,
+    total: bool = False
+):
+    """
+    Consulta un usuario específico por ID o una página de usuarios.
+    Para la página siguiente se envía el `siguiente_cursor` de la respuesta.
+    """
+    try:
+        resultado = await bd.consultarUsuarios(id_usuario, limite=limit, cursor_pagina=cursor, con_total=total)
+        if resultado == "Usuario no encontrado.":
             raise HTTPException(status_code=404, detail=resultado)
-        return {"usuarios": resultado}
+        if isinstance(resultado, str):  # Si es un mensaje de error, p. ej. un cursor inválido
+            raise HTTPException(status_code=400, detail=resultado)
+        if id_usuario:
+            return ORJSONResponse({"usuarios": resultado})
+        respuesta = {"usuarios": resultado["datos"], "siguiente_cursor": resultado["siguiente_cursor"]}
+        if total:
+            respuesta["total"] = resultado["total"]
+        return ORJSONResponse(respuesta)
+    except HTTPException:
+        raise
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
@@ -149,7 +594,7 @@ async def actualizar_usuario(id_usuario: int, usuario: Usuario):
     Actualiza la información de un usuario en la base de datos.
     """
     try:
-        resultado = ConexionBD.actualizarUsuario(
+        resultado = await bd.actualizarUsuario(
             id_usuario,
             usuario.nombre,
             usuario.email,
@@ -168,7 +613,7 @@ async def eliminar_usuario(id_usuario: int):
     Elimina un usuario de la base de datos.
     """
     try:
-        resultado = ConexionBD.eliminarUsuario(id_usuario)
+        resultado = await bd.eliminarUsuario(id_usuario)
         if "Usuario eliminado exitosamente" in resultado:
             return {"message": resultado}
         raise HTTPException(status_code=400, detail=resultado)
@@ -186,7 +631,7 @@ async def add_reservation(reserva: Reserva):
         if reserva.fecha_reserva < hoy:
             raise HTTPException(status_code=400, detail="No puedes registrar una reserva en una fecha pasada.")
         
-        resultado = ConexionBD.crearReserva(
+        resultado = await bd.crearReserva(
             reserva.id_usuario,
             reserva.id_recurso,
             reserva.fecha_reserva,
@@ -194,7 +639,41 @@ async def add_reservation(reserva: Reserva):
         )
         if "Reserva creada exitosamente" in resultado:
             return {"message": resultado}
+        if resultado == "El recurso ya está reservado en este horario.":
+            raise HTTPException(status_code=409, detail=resultado)
         raise HTTPException(status_code=400, detail=resultado)
+    except HTTPException:
+        raise
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+
+@app.post('/agregarReservasLote')
+async def add_reservations_batch(lote: ReservaLote):
+    """
+    Crea varias reservas del mismo recurso y hora: una lista de fechas y/o una
+    regla de recurrencia semanal. Retorna el resultado de cada fecha.
+    """
+    try:
+        fechas = list(lote.fechas)
+        if lote.recurrencia:
+            r = lote.recurrencia
+            if r.fecha_inicio > r.fecha_fin:
+                raise HTTPException(status_code=400, detail="La fecha de inicio no puede ser posterior a la fecha final")
+            if r.cada_semanas < 1 or any(d < 0 or d > 6 for d in r.dias_semana):
+                raise HTTPException(status_code=400, detail="Regla de recurrencia inválida.")
+            fechas += expandirRecurrencia(r.fecha_inicio, r.fecha_fin, r.dias_semana, r.cada_semanas, r.excluir)
+        if not fechas:
+            raise HTTPException(status_code=400, detail="No hay fechas para reservar.")
+        if len(fechas) > MAX_RESERVAS_LOTE:
+            raise HTTPException(status_code=400, detail=f"No se pueden crear más de {MAX_RESERVAS_LOTE} reservas a la vez.")
+
+        resultado = await bd.crearReservasLote(lote.id_usuario, lote.id_recurso, fechas, lote.hora_reserva)
+        if isinstance(resultado, str):  # Si es un mensaje de error
+            raise HTTPException(status_code=400, detail=resultado)
+        creadas = sum(r["resultado"] == "creada" for r in resultado)
+        return {"message": f"{creadas} de {len(resultado)} reservas creadas", "reservas": resultado}
+    except HTTPException:
+        raise
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
@@ -204,10 +683,14 @@ async def cancel_reservation(s: ReservaCancelar):
     Endpoint para cancelar una reserva existente
     """
     try:
-        resultado = ConexionBD.actualizarReserva(s.idReserva, estado="Cancelada")
+        resultado = await bd.actualizarReserva(s.id_reserva, estado="Cancelada")
+        if resultado == ConexionBD.RESERVA_PRESTADA:
+            raise HTTPException(status_code=409, detail=resultado)
         if resultado:
             return {"message": resultado}
         raise HTTPException(status_code=404, detail="Reserva no encontrada para cancelar")
+    except HTTPException:
+        raise
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
@@ -218,10 +701,14 @@ async def finish_reservation(s: ReservaCancelar):
     Endpoint para finalizar una reserva
     """
     try:
-        resultado = ConexionBD.actualizarReserva(s.idReserva, estado="Finalizada")
+        resultado = await bd.actualizarReserva(s.id_reserva, estado="Finalizada")
+        if resultado == ConexionBD.RESERVA_PRESTADA:
+            raise HTTPException(status_code=409, detail=resultado)
         if resultado:
             return {"message": resultado}
         raise HTTPException(status_code=404, detail="Reserva no encontrada para terminar")
+    except HTTPException:
+        raise
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
@@ -229,6 +716,7 @@ async def finish_reservation(s: ReservaCancelar):
 
 @app.get('/consultarRecursos')
 async def consultar_recursos(
+    request: Request,
     tipo_recurso: str = None,
     estado: str = None,
     nombre_recurso: str = None,
@@ -237,16 +725,26 @@ async def consultar_recursos(
 ):
     """
     Consultar recursos de la unidad con filtros y ordenamientos, incluyendo horario de disponibilidad.
+    Admite peticiones condicionales con If-None-Match.
     """
-    try:
-        resultado = ConexionBD.consultarRecursos(
+    async def obtener():
+        resultado = await bd.consultarRecursos(
             tipo_recurso=tipo_recurso,
             estado=estado,
             nombre_recurso=nombre_recurso,
             horario_disponibilidad=horario_disponibilidad,
             orden=orden
         )
+        if isinstance(resultado, str):
+            raise HTTPException(status_code=400, detail=resultado)
         return {"data": resultado}
+
+    try:
+        return await respuesta_catalogo(
+            request, ("consultarRecursos", tipo_recurso, estado, nombre_recurso, horario_disponibilidad, orden), obtener
+        )
+    except HTTPException:
+        raise
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
     
@@ -257,9 +755,13 @@ async def consultar_reservas(
     tipo_filtro: str = Query(None, enum=['Vigentes', 'Pasadas', 'Futuras']),
     fecha_inicio: date = None,
     fecha_fin: date = None,
+    limit: int = Query(100, ge=1, le=1000),
+    cursor: str = None,
+    total: bool = False,
 ):
     """
-    Consultar recursos de la unidad con filtros y ordenamientos, incluyendo horario de disponibilidad.
+    Consultar las reservas con filtros, por páginas de `limit` reservas.
+    Para la página siguiente se envía el `siguiente_cursor` de la respuesta.
     """
     try:
         if fecha_inicio and fecha_fin and fecha_inicio > fecha_fin:
@@ -267,14 +769,48 @@ async def consultar_reservas(
                 status_code=400,
                 detail="La fecha de inicio no puede ser posterior a la fecha final"
             )
-        resultado = ConexionBD.consultarReservas(
+        resultado = await bd.consultarReservas(
             nombre_usuario=nombre_usuario,
             estado=estado,
             tipo_filtro=tipo_filtro,
             fecha_inicio=fecha_inicio,
-            fecha_fin=fecha_fin
+            fecha_fin=fecha_fin,
+            limite=limit,
+            cursor_pagina=cursor,
+            con_total=total
         )
-        return {"data": resultado}
+        if isinstance(resultado, str):  # Si es un mensaje de error
+            raise HTTPException(status_code=400, detail=resultado)
+        respuesta = {"data": resultado["datos"], "siguiente_cursor": resultado["siguiente_cursor"]}
+        if total:
+            respuesta["total"] = resultado["total"]
+        # Las filas se serializan directo con orjson, sin recorrerlas con jsonable_encoder
+        return ORJSONResponse(respuesta)
+    except HTTPException:
+        raise
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+
+MAX_DIAS_DISPONIBILIDAD = 31
+
+@app.get('/disponibilidad')
+async def consultar_disponibilidad(tipo_recurso: str, fecha_inicio: date, fecha_fin: date = None):
+    """
+    Retorna, para cada recurso del tipo indicado, las franjas libres y reservadas
+    de cada día del rango.
+    """
+    fecha_fin = fecha_fin or fecha_inicio
+    if fecha_inicio > fecha_fin:
+        raise HTTPException(status_code=400, detail="La fecha de inicio no puede ser posterior a la fecha final")
+    if (fecha_fin - fecha_inicio).days >= MAX_DIAS_DISPONIBILIDAD:
+        raise HTTPException(status_code=400, detail=f"El rango no puede superar {MAX_DIAS_DISPONIBILIDAD} días.")
+    try:
+        resultado = await bd.consultarDisponibilidad(tipo_recurso, fecha_inicio, fecha_fin)
+        if isinstance(resultado, str):  # Si es un mensaje de error
+            raise HTTPException(status_code=500, detail=resultado)
+        return ORJSONResponse({"tipo_recurso": tipo_recurso, "recursos": resultado})
+    except HTTPException:
+        raise
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
@@ -284,58 +820,61 @@ async def obtener_reservas_vigentes(id_usuario: int):
     Retorna todas las reservas vigentes de un usuario.
     """
     try:
-        resultado = ConexionBD.consultarReservasVigentes(id_usuario)
+        resultado = await bd.consultarReservasVigentes(id_usuario)
         if isinstance(resultado, str):  # Si es un mensaje de error o sin resultados
             raise HTTPException(status_code=404, detail=resultado)
-        return {"reservas_vigentes": resultado}
+        return ORJSONResponse({"reservas_vigentes": resultado})
+    except HTTPException:
+        raise
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
     
 @app.post('/registrarPrestamo')
-async def registrar_prestamo(prestamo: Prestamo, authorization: str = Header(None)):
+async def registrar_prestamo(prestamo: Prestamo, id_empleado: int = Depends(empleado_autenticado)):
     """
-    Registra un préstamo validando el token JWT y que el empleado esté registrado.
+    Registra un préstamo a nombre del empleado del token JWT, que debe estar registrado.
     """
     try:
-        print("Authorization Header recibido:", authorization)
-        if not authorization:
-            raise HTTPException(status_code=403, detail="Token no proporcionado.")
-
-        token = authorization.split("Bearer ")[-1]  # Extrae el token de "Bearer TOKEN"
-        id_usuario = TokenHandler.verificar_token(token)
-
-        if not id_usuario:
-            raise HTTPException(status_code=403, detail="Token inválido o expirado.")
-
-        # Validar si el usuario tiene una reserva vigente
-        reservas = ConexionBD.consultarReservasVigentes(id_usuario)
-        if isinstance(reservas, str) or not reservas:
-            raise HTTPException(status_code=400, detail="No hay reservas vigentes para este usuario.")
         hoy = date.today()
         if prestamo.fecha_prestamo < hoy:
             raise HTTPException(status_code=400, detail="No puedes registrar un préstamo en una fecha pasada.")
-        resultado = ConexionBD.registrarPrestamo(
+        if prestamo.id_empleado is not None and prestamo.id_empleado != id_empleado:
+            raise HTTPException(status_code=403, detail="El préstamo debe registrarlo el empleado autenticado.")
+        resultado = await bd.registrarPrestamo(
             prestamo.id_reserva,
-            prestamo.id_empleado,
+            id_empleado,
             prestamo.fecha_prestamo,
             prestamo.hora_prestamo
         )
         if "Préstamo registrado exitosamente" in resultado:
             return {"message": resultado}
         raise HTTPException(status_code=400, detail=resultado)
+    except HTTPException:
+        raise
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
+@app.post('/cerrarSesionEmpleado')
+async def cerrar_sesion_empleado(token: str = Depends(token_de_cabecera)):
+    """
+    Revoca el token del empleado hasta su expiración.
+    """
+    if not TokenHandler.revocar_token(token):
+        raise HTTPException(status_code=403, detail="Token inválido.")
+    return {"message": "Sesión cerrada correctamente"}
+
 @app.get('/prestamosVigentes/{id_usuario}')
 async def obtener_prestamos_vigentes(id_usuario: int):
     """
     Retorna todos los préstamos vigentes de un usuario.
     """
     try:
-        resultado = ConexionBD.consultarPrestamosVigentes(id_usuario)
+        resultado = await bd.consultarPrestamosVigentes(id_usuario)
         if isinstance(resultado, str):  # Si es un mensaje de error o sin resultados
             raise HTTPException(status_code=404, detail=resultado)
-        return {"prestamos_vigentes": resultado}
+        return ORJSONResponse({"prestamos_vigentes": resultado})
+    except HTTPException:
+        raise
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
@@ -345,7 +884,7 @@ async def registrar_devolucion(devolucion: Devolucion):
     Registra una devolución validando que el préstamo exista y que el empleado esté registrado.
     """
     try:
-        resultado = ConexionBD.registrarDevolucion(
+        resultado = await bd.registrarDevolucion(
             devolucion.id_prestamo,
             devolucion.fecha_devolucion,
             devolucion.hora_devolucion,
@@ -354,18 +893,139 @@ async def registrar_devolucion(devolucion: Devolucion):
         if "Devolución registrada exitosamente" in resultado:
             return {"message": resultado}
         raise HTTPException(status_code=400, detail=resultado)
+    except HTTPException:
+        raise
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
+@app.post('/registrarDevolucionesLote')
+async def registrar_devoluciones_lote(carrito: CarritoDevoluciones, id_empleado: int = Depends(empleado_autenticado)):
+    """
+    Registra de una vez la devolución de varios préstamos (un carrito en el
+    mostrador). Retorna el resultado de cada préstamo.
+    """
+    try:
+        if not carrito.devoluciones:
+            raise HTTPException(status_code=400, detail="No hay devoluciones para registrar.")
+        if len(carrito.devoluciones) > MAX_DEVOLUCIONES_LOTE:
+            raise HTTPException(status_code=400, detail=f"No se pueden registrar más de {MAX_DEVOLUCIONES_LOTE} devoluciones a la vez.")
+
+        resultado = await bd.registrarDevoluciones(
+            [(d.id_prestamo, d.fecha_devolucion, d.hora_devolucion) for d in carrito.devoluciones],
+            id_empleado
+        )
+        if isinstance(resultado, str):  # Si es un mensaje de error
+            raise HTTPException(status_code=400, detail=resultado)
+        devueltas = sum(d["resultado"] == "devuelto" for d in resultado)
+        return {"message": f"{devueltas} de {len(resultado)} devoluciones registradas", "devoluciones": resultado}
+    except HTTPException:
+        raise
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+
+@app.get('/suscripciones/disponibilidad')
+async def suscribirse_disponibilidad(id_recurso: list[int] = Query(None)):
+    """
+    Canal Server-Sent Events con los cambios de disponibilidad de los recursos
+    (todos, o solo los `id_recurso` indicados). Cada evento `disponibilidad`
+    trae {"origen", "id_recurso", "fecha"}; fecha null indica un cambio del
+    recurso en sí. Un evento `resincronizar` pide volver a consultar todo.
+    """
+    if not AVISOS_DISPONIBILIDAD:
+        raise HTTPException(status_code=404, detail="Los avisos de disponibilidad están desactivados.")
+    try:
+        suscripcion = difusor.suscribir(id_recurso)
+    except SuscripcionesAgotadas as e:
+        raise HTTPException(status_code=503, detail=str(e), headers={"Retry-After": "30"})
+
+    async def eventos():
+        try:
+            yield b"retry: 5000\n\n"
+            while True:
+                tramas = await suscripcion.esperar(AVISOS_LATIDO)
+                if not tramas:
+                    yield b": latido\n\n"
+                for trama in tramas:
+                    yield trama
+        finally:
+            difusor.cancelar(suscripcion)
+
+    return StreamingResponse(
+        eventos(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
+
 @app.get('/api/recursosDisponibles')
-async def obtener_recursos_disponibles():
+async def obtener_recursos_disponibles(request: Request):
     """
     Permite a servicios externos consultar los recursos disponibles.
+    Admite peticiones condicionales con If-None-Match.
     """
-    try:
-        resultado = ConexionBD.consultarRecursosDisponibles()
+    async def obtener():
+        resultado = await bd.consultarRecursosDisponibles()
         if isinstance(resultado, str):  # Si es un mensaje de error o sin resultados
             raise HTTPException(status_code=404, detail=resultado)
         return {"recursos_disponibles": resultado}
+
+    try:
+        return await respuesta_catalogo(request, ("recursosDisponibles",), obtener)
+    except HTTPException:
+        raise
     except Exception as e:
-        raise HTTPException(status_code=500, detail=str(e))
\ No newline at end of file
+        raise HTTPException(status_code=500, detail=str(e))
+
+@app.get('/reportes/uso')
+async def reporte_uso(
+    fecha_inicio: date,
+    fecha_fin: date,
+    agrupacion: str = Query('dia', enum=['dia', 'semana']),
+    id_recurso: int = None,
+    tipo_recurso: str = None,
+    id_empleado: int = Depends(empleado_autenticado)
+):
+    """
+    Uso por recurso y por día o semana: reservas, cancelaciones, no asistencias,
+    préstamos, duración promedio de los préstamos y tasa de no asistencia.
+    Requiere token de empleado.
+    """
+    if fecha_inicio > fecha_fin:
+        raise HTTPException(status_code=400, detail="fecha_inicio debe ser anterior o igual a fecha_fin.")
+    try:
+        resultado = await bd.reporteUso(fecha_inicio, fecha_fin, agrupacion, id_recurso, tipo_recurso)
+        if isinstance(resultado, str):
+            raise HTTPException(status_code=400, detail=resultado)
+        return ORJSONResponse({"reporte": resultado})
+    except HTTPException:
+        raise
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+
+@app.get('/exportar/{entidad}')
+async def exportar(
+    entidad: Literal['reservas', 'prestamos', 'devoluciones'],
+    formato: str = Query('ndjson', enum=['ndjson', 'csv']),
+    fecha_inicio: date = None,
+    fecha_fin: date = None,
+    id_empleado: int = Depends(empleado_autenticado),
+):
+    """
+    Exporta el historial de reservas, préstamos o devoluciones en NDJSON o CSV.
+    Requiere el token de un empleado.
+    La respuesta se envía por partes, sin cargar todo el historial en memoria.
+    """
+    try:
+        resultado = await bd.exportar(entidad, formato, fecha_inicio, fecha_fin)
+        if isinstance(resultado, str):  # Si es un mensaje de error
+            raise HTTPException(status_code=400, detail=resultado)
+        if formato == 'csv':
+            return StreamingResponse(
+                resultado,
+                media_type="text/csv; charset=utf-8",
+                headers={"Content-Disposition": f'attachment; filename="{entidad}.csv"'}
+            )
+        return StreamingResponse(resultado, media_type="application/x-ndjson")
+    except HTTPException:
+        raise
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
@@ -0,0 +1,258 @@
+import contextvars
+import functools
+import inspect
+import threading
+import time
+from bisect import bisect_left
+
+import psycopg2.extensions
+
+
+BUCKETS_LATENCIA = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+
+def _etiquetas(nombres, valores):
+    if not nombres:
+        return ""
+    pares = []
+    for nombre, valor in zip(nombres, valores):
+        valor = str(valor).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+        pares.append(f'{nombre}="{valor}"')
+    return "{" + ",".join(pares) + "}"
+
+
+class Contador:
+    """
+    Contador acumulativo con etiquetas, en formato de Prometheus.
+    """
+
+    def __init__(self, nombre, ayuda, etiquetas=()):
+        self.nombre = nombre
+        self.ayuda = ayuda
+        self.etiquetas = tuple(etiquetas)
+        self._valores = {}
+        self._lock = threading.Lock()
+
+    def incrementar(self, *valores, cantidad=1):
+        with self._lock:
+            self._valores[valores] = self._valores.get(valores, 0) + cantidad
+
+    def exponer(self):
+        lineas = [f"# HELP {self.nombre} {self.ayuda}", f"# TYPE {self.nombre} counter"]
+        with self._lock:
+            valores = list(self._valores.items())
+        for clave, valor in valores:
+            lineas.append(f"{self.nombre}{_etiquetas(self.etiquetas, clave)} {valor}")
+        return lineas
+
+
+class Histograma:
+    """
+    Histograma con etiquetas, en formato de Prometheus.
+    Cada observación cuesta una búsqueda binaria y un incremento bajo un lock.
+    """
+
+    def __init__(self, nombre, ayuda, etiquetas=(), buckets=BUCKETS_LATENCIA):
+        self.nombre = nombre
+        self.ayuda = ayuda
+        self.etiquetas = tuple(etiquetas)
+        self.buckets = tuple(sorted(buckets))
+        self._series = {}
+        self._lock = threading.Lock()
+
+    def observar(self, valor, *etiquetas):
+        indice = bisect_left(self.buckets, valor)
+        with self._lock:
+            serie = self._series.get(etiquetas)
+            if serie is None:
+                serie = self._series[etiquetas] = [[0] * (len(self.buckets) + 1), 0.0, 0]
+            serie[0][indice] += 1
+            serie[1] += valor
+            serie[2] += 1
+
+    def exponer(self):
+        lineas = [f"# HELP {self.nombre} {self.ayuda}", f"# TYPE {self.nombre} histogram"]
+        with self._lock:
+            series = [(clave, list(conteos), suma, total) for clave, (conteos, suma, total) in self._series.items()]
+        nombres = self.etiquetas + ("le",)
+        for clave, conteos, suma, total in series:
+            acumulado = 0
+            for limite, conteo in zip(self.buckets, conteos):
+                acumulado += conteo
+                lineas.append(f"{self.nombre}_bucket{_etiquetas(nombres, clave + (limite,))} {acumulado}")
+            lineas.append(f"{self.nombre}_bucket{_etiquetas(nombres, clave + ('+Inf',))} {total}")
+            lineas.append(f"{self.nombre}_sum{_etiquetas(self.etiquetas, clave)} {suma}")
+            lineas.append(f"{self.nombre}_count{_etiquetas(self.etiquetas, clave)} {total}")
+        return lineas
+
+
+class Medidor:
+    """
+    Valor instantáneo que se lee al exponer las métricas.
+    `leer` retorna un número o un diccionario {(valores de etiquetas): número}.
+    """
+
+    def __init__(self, nombre, ayuda, leer, etiquetas=()):
+        self.nombre = nombre
+        self.ayuda = ayuda
+        self.leer = leer
+        self.etiquetas = tuple(etiquetas)
+
+    def exponer(self):
+        lineas = [f"# HELP {self.nombre} {self.ayuda}", f"# TYPE {self.nombre} gauge"]
+        try:
+            valor = self.leer()
+        except Exception:
+            return []
+        if not isinstance(valor, dict):
+            valor = {(): valor}
+        for clave, numero in valor.items():
+            lineas.append(f"{self.nombre}{_etiquetas(self.etiquetas, clave)} {numero}")
+        return lineas
+
+
+class Registro:
+    def __init__(self):
+        self._metricas = []
+
+    def registrar(self, metrica):
+        self._metricas.append(metrica)
+        return metrica
+
+    def exponer(self):
+        """
+        Retorna todas las métricas en el formato de texto de Prometheus.
+        """
+        lineas = []
+        for metrica in self._metricas:
+            lineas.extend(metrica.exponer())
+        return "\n".join(lineas) + "\n"
+
+
+REGISTRO = Registro()
+
+peticiones_http = REGISTRO.registrar(Histograma(
+    "http_peticion_duracion_segundos", "Latencia de las peticiones HTTP por ruta y código de estado.",
+    ("metodo", "ruta", "estado")
+))
+consultas_bd = REGISTRO.registrar(Histograma(
+    "bd_metodo_duracion_segundos", "Duración de cada método de ConexionBD.", ("metodo",)
+))
+tiempo_sql = REGISTRO.registrar(Histograma(
+    "bd_sql_duracion_segundos", "Tiempo esperando a PostgreSQL por método de ConexionBD.", ("metodo",)
+))
+filas_bd = REGISTRO.registrar(Contador(
+    "bd_filas_total", "Filas leídas o modificadas por método de ConexionBD.", ("metodo",)
+))
+espera_conexion = REGISTRO.registrar(Histograma(
+    "bd_conexion_espera_segundos", "Tiempo para obtener una conexión del pool."
+))
+lecturas_bd = REGISTRO.registrar(Contador(
+    "bd_lecturas_total", "Conexiones de solo lectura por destino (replica o primario) y motivo.",
+    ("destino", "motivo")
+))
+transiciones_reservas = REGISTRO.registrar(Contador(
+    "reservas_transiciones_total", "Reservas cambiadas de estado por el barrido periódico.", ("estado",)
+))
+estadisticas_recalculadas = REGISTRO.registrar(Contador(
+    "estadisticas_dias_recalculados_total", "Días de un recurso recalculados en las estadísticas de uso."
+))
+tiempo_bcrypt = REGISTRO.registrar(Histograma(
+    "bcrypt_duracion_segundos", "Duración de las operaciones de bcrypt.", ("operacion",),
+    buckets=(0.01, 0.025, 0.05, 0.1, 0.2, 0.3, 0.5, 1.0, 2.0)
+))
+tiempo_jwt = REGISTRO.registrar(Histograma(
+    "jwt_verificacion_duracion_segundos", "Duración de la verificación de tokens JWT por resultado.", ("resultado",),
+    buckets=(0.00001, 0.000025, 0.00005, 0.0001, 0.00025, 0.0005, 0.001, 0.0025, 0.005, 0.01)
+))
+
+
+class MedicionBD:
+    """
+    Acumula el tiempo en PostgreSQL y las filas de las sentencias ejecutadas
+    mientras está activa (un método de ConexionBD o una petición HTTP).
+    """
+    __slots__ = ("segundos", "filas", "sentencias")
+
+    def __init__(self):
+        self.segundos = 0.0
+        self.filas = 0
+        self.sentencias = 0
+
+
+# Mediciones activas en el contexto actual (se propagan a los hilos de ConexionBDAsync)
+_mediciones = contextvars.ContextVar("mediciones_bd", default=())
+
+
+def iniciarMedicion():
+    """
+    Activa una medición nueva en el contexto actual y la retorna junto con el
+    token para desactivarla con `terminarMedicion`.
+    """
+    medicion = MedicionBD()
+    return medicion, _mediciones.set(_mediciones.get() + (medicion,))
+
+
+def terminarMedicion(token):
+    _mediciones.reset(token)
+
+
+class CursorMedido(psycopg2.extensions.cursor):
+    """
+    Cursor que suma el tiempo de cada sentencia y las filas afectadas a las
+    mediciones activas.
+    """
+
+    def execute(self, query, vars=None):
+        mediciones = _mediciones.get()
+        if not mediciones:
+            return super().execute(query, vars)
+        inicio = time.perf_counter()
+        try:
+            return super().execute(query, vars)
+        finally:
+            duracion = time.perf_counter() - inicio
+            filas = max(self.rowcount, 0)
+            for medicion in mediciones:
+                medicion.segundos += duracion
+                medicion.filas += filas
+                medicion.sentencias += 1
+
+
+def medirBD(funcion):
+    """
+    Decorador para métodos de ConexionBD: registra su duración, el tiempo de
+    SQL y las filas afectadas. Admite también corrutinas.
+    """
+    nombre = funcion.__name__
+
+    if inspect.iscoroutinefunction(funcion):
+        @functools.wraps(funcion)
+        async def envoltura_async(*args, **kwargs):
+            medicion, token = iniciarMedicion()
+            inicio = time.perf_counter()
+            try:
+                return await funcion(*args, **kwargs)
+            finally:
+                terminarMedicion(token)
+                consultas_bd.observar(time.perf_counter() - inicio, nombre)
+                if medicion.sentencias:
+                    tiempo_sql.observar(medicion.segundos, nombre)
+                    filas_bd.incrementar(nombre, cantidad=medicion.filas)
+
+        return envoltura_async
+
+    @functools.wraps(funcion)
+    def envoltura(*args, **kwargs):
+        medicion, token = iniciarMedicion()
+        inicio = time.perf_counter()
+        try:
+            return funcion(*args, **kwargs)
+        finally:
+            terminarMedicion(token)
+            consultas_bd.observar(time.perf_counter() - inicio, nombre)
+            if medicion.sentencias:
+                tiempo_sql.observar(medicion.segundos, nombre)
+                filas_bd.incrementar(nombre, cantidad=medicion.filas)
+
+    return envoltura
@@ -0,0 +1,36 @@
+-- Un recurso no puede tener dos reservas activas en la misma fecha y hora.
+-- Requerido por ConexionBD.crearReserva (ON CONFLICT sobre este índice).
+
+-- Antes de crear el índice se cancelan las reservas dobles que ya existan: de
+-- cada grupo se conserva la que tiene préstamo o, si no, la más antigua. Los
+-- ID cancelados se informan como NOTICE (migrar.py los muestra).
+DO $$
+DECLARE
+    canceladas TEXT;
+BEGIN
+    WITH duplicadas AS (
+        SELECT r.ID_Reserva, row_number() OVER (
+            PARTITION BY r.ID_Recurso, r.Fecha_Reserva, r.Hora_Reserva
+            ORDER BY EXISTS (SELECT 1 FROM Prestamo p WHERE p.ID_Reserva = r.ID_Reserva) DESC, r.ID_Reserva
+        ) AS orden
+        FROM Reserva r
+        WHERE r.Estado <> 'Cancelada'
+    ), actualizadas AS (
+        UPDATE Reserva r SET Estado = 'Cancelada'
+        FROM duplicadas d
+        WHERE d.ID_Reserva = r.ID_Reserva AND d.orden > 1
+        RETURNING r.ID_Reserva
+    )
+    SELECT string_agg(ID_Reserva::text, ', ' ORDER BY ID_Reserva) INTO canceladas FROM actualizadas;
+    IF canceladas IS NOT NULL THEN
+        RAISE NOTICE 'Reservas duplicadas canceladas: %', canceladas;
+    END IF;
+END $$;
+
+-- migrar.py aplica cada archivo en una transacción, donde no se admite
+-- CONCURRENTLY: este CREATE INDEX bloquea las escrituras en Reserva mientras se
+-- construye. En tablas grandes, crear antes el índice a mano con
+-- CREATE UNIQUE INDEX CONCURRENTLY (con el mismo nombre) y esta sentencia no hace nada.
+CREATE UNIQUE INDEX IF NOT EXISTS reserva_recurso_horario_unico
+    ON Reserva (ID_Recurso, Fecha_Reserva, Hora_Reserva)
+    WHERE Estado <> 'Cancelada';
@@ -0,0 +1,26 @@
+-- Columnas de credenciales de empleado usadas por validarLoginEmpleado y registrarEmpleado
+ALTER TABLE Empleado ADD COLUMN IF NOT EXISTS Email VARCHAR(100);
+ALTER TABLE Empleado ADD COLUMN IF NOT EXISTS Contrasena VARCHAR(255);
+
+-- Login de empleados (usuario.email ya tiene índice por su restricción UNIQUE)
+CREATE INDEX IF NOT EXISTS empleado_email ON Empleado (Email);
+
+-- consultarReservasVigentes: WHERE ID_Usuario = %s AND Estado = 'Vigente'
+CREATE INDEX IF NOT EXISTS reserva_usuario_estado ON Reserva (ID_Usuario, Estado);
+
+-- consultarReservas: ORDER BY fecha_reserva DESC, hora_reserva DESC y filtros por rango de fechas
+CREATE INDEX IF NOT EXISTS reserva_fecha_hora ON Reserva (Fecha_Reserva, Hora_Reserva, ID_Reserva);
+
+-- Joins de préstamos y devoluciones
+CREATE INDEX IF NOT EXISTS prestamo_reserva ON Prestamo (ID_Reserva);
+CREATE INDEX IF NOT EXISTS devolucion_prestamo ON Devolucion (ID_Prestamo);
+
+-- consultarRecursos y consultarRecursosDisponibles
+CREATE INDEX IF NOT EXISTS recurso_tipo_estado ON Recurso (ID_Tipo_Recurso, Estado);
+CREATE INDEX IF NOT EXISTS recurso_estado ON Recurso (Estado);
+
+-- Filtros ILIKE '%...%' de consultarRecursos y consultarReservas
+CREATE EXTENSION IF NOT EXISTS pg_trgm;
+CREATE INDEX IF NOT EXISTS recurso_nombre_trgm ON Recurso USING gin (Nombre gin_trgm_ops);
+CREATE INDEX IF NOT EXISTS recurso_horario_trgm ON Recurso USING gin (Horario_Disponibilidad gin_trgm_ops);
+CREATE INDEX IF NOT EXISTS usuario_nombre_trgm ON Usuario USING gin (Nombre gin_trgm_ops);
@@ -0,0 +1,4 @@
+-- ConexionBD.transicionarReservas: solo recorre las reservas que aún pueden cambiar de estado
+CREATE INDEX IF NOT EXISTS reserva_pendientes
+    ON Reserva (Fecha_Reserva, Hora_Reserva)
+    WHERE Estado IN ('Vigente', 'Futura');
@@ -0,0 +1,114 @@
+-- Estadísticas de uso por recurso y día, usadas por los reportes (ConexionBD.reporteUso).
+-- Se mantienen de forma incremental: los triggers marcan en Estadistica_Pendiente
+-- los (recurso, día) afectados por cada cambio y ConexionBD.refrescarEstadisticas
+-- recalcula solo esos días.
+CREATE TABLE IF NOT EXISTS Estadistica_Recurso_Dia (
+    ID_Recurso INT NOT NULL,
+    Fecha DATE NOT NULL,
+    Reservas INT NOT NULL DEFAULT 0,
+    Canceladas INT NOT NULL DEFAULT 0,
+    No_Asistidas INT NOT NULL DEFAULT 0,
+    Finalizadas INT NOT NULL DEFAULT 0,
+    Prestamos INT NOT NULL DEFAULT 0,
+    Devoluciones INT NOT NULL DEFAULT 0,
+    Minutos_Prestamo BIGINT NOT NULL DEFAULT 0,
+    PRIMARY KEY (ID_Recurso, Fecha)
+);
+CREATE INDEX IF NOT EXISTS estadistica_fecha ON Estadistica_Recurso_Dia (Fecha);
+
+CREATE TABLE IF NOT EXISTS Estadistica_Pendiente (
+    ID_Recurso INT NOT NULL,
+    Fecha DATE NOT NULL,
+    PRIMARY KEY (ID_Recurso, Fecha)
+);
+
+-- Recalcular un día de un recurso
+CREATE INDEX IF NOT EXISTS reserva_recurso_fecha ON Reserva (ID_Recurso, Fecha_Reserva);
+
+-- Triggers por sentencia con tablas de transición: un INSERT o UPDATE masivo
+-- (importaciones, reservas en lote, el barrido de estados) marca cada día una sola vez.
+CREATE OR REPLACE FUNCTION marcar_estadistica_reserva() RETURNS trigger AS $$
+BEGIN
+    IF TG_OP IN ('INSERT', 'UPDATE') THEN
+        INSERT INTO Estadistica_Pendiente (ID_Recurso, Fecha)
+        SELECT DISTINCT ID_Recurso, Fecha_Reserva FROM nuevas
+        ON CONFLICT DO NOTHING;
+    END IF;
+    IF TG_OP IN ('UPDATE', 'DELETE') THEN
+        INSERT INTO Estadistica_Pendiente (ID_Recurso, Fecha)
+        SELECT DISTINCT ID_Recurso, Fecha_Reserva FROM viejas
+        ON CONFLICT DO NOTHING;
+    END IF;
+    RETURN NULL;
+END;
+$$ LANGUAGE plpgsql;
+
+CREATE OR REPLACE FUNCTION marcar_estadistica_prestamo() RETURNS trigger AS $$
+BEGIN
+    IF TG_OP IN ('INSERT', 'UPDATE') THEN
+        INSERT INTO Estadistica_Pendiente (ID_Recurso, Fecha)
+        SELECT DISTINCT r.ID_Recurso, r.Fecha_Reserva FROM nuevas n JOIN Reserva r ON r.ID_Reserva = n.ID_Reserva
+        ON CONFLICT DO NOTHING;
+    END IF;
+    IF TG_OP IN ('UPDATE', 'DELETE') THEN
+        INSERT INTO Estadistica_Pendiente (ID_Recurso, Fecha)
+        SELECT DISTINCT r.ID_Recurso, r.Fecha_Reserva FROM viejas v JOIN Reserva r ON r.ID_Reserva = v.ID_Reserva
+        ON CONFLICT DO NOTHING;
+    END IF;
+    RETURN NULL;
+END;
+$$ LANGUAGE plpgsql;
+
+CREATE OR REPLACE FUNCTION marcar_estadistica_devolucion() RETURNS trigger AS $$
+BEGIN
+    IF TG_OP IN ('INSERT', 'UPDATE') THEN
+        INSERT INTO Estadistica_Pendiente (ID_Recurso, Fecha)
+        SELECT DISTINCT r.ID_Recurso, r.Fecha_Reserva
+        FROM nuevas n JOIN Prestamo p ON p.ID_Prestamo = n.ID_Prestamo JOIN Reserva r ON r.ID_Reserva = p.ID_Reserva
+        ON CONFLICT DO NOTHING;
+    END IF;
+    IF TG_OP IN ('UPDATE', 'DELETE') THEN
+        INSERT INTO Estadistica_Pendiente (ID_Recurso, Fecha)
+        SELECT DISTINCT r.ID_Recurso, r.Fecha_Reserva
+        FROM viejas v JOIN Prestamo p ON p.ID_Prestamo = v.ID_Prestamo JOIN Reserva r ON r.ID_Reserva = p.ID_Reserva
+        ON CONFLICT DO NOTHING;
+    END IF;
+    RETURN NULL;
+END;
+$$ LANGUAGE plpgsql;
+
+-- PostgreSQL no admite tablas de transición en triggers de varios eventos: uno por evento
+DROP TRIGGER IF EXISTS estadistica_reserva_insert ON Reserva;
+DROP TRIGGER IF EXISTS estadistica_reserva_update ON Reserva;
+DROP TRIGGER IF EXISTS estadistica_reserva_delete ON Reserva;
+CREATE TRIGGER estadistica_reserva_insert AFTER INSERT ON Reserva
+    REFERENCING NEW TABLE AS nuevas FOR EACH STATEMENT EXECUTE FUNCTION marcar_estadistica_reserva();
+CREATE TRIGGER estadistica_reserva_update AFTER UPDATE ON Reserva
+    REFERENCING NEW TABLE AS nuevas OLD TABLE AS viejas FOR EACH STATEMENT EXECUTE FUNCTION marcar_estadistica_reserva();
+CREATE TRIGGER estadistica_reserva_delete AFTER DELETE ON Reserva
+    REFERENCING OLD TABLE AS viejas FOR EACH STATEMENT EXECUTE FUNCTION marcar_estadistica_reserva();
+
+DROP TRIGGER IF EXISTS estadistica_prestamo_insert ON Prestamo;
+DROP TRIGGER IF EXISTS estadistica_prestamo_update ON Prestamo;
+DROP TRIGGER IF EXISTS estadistica_prestamo_delete ON Prestamo;
+CREATE TRIGGER estadistica_prestamo_insert AFTER INSERT ON Prestamo
+    REFERENCING NEW TABLE AS nuevas FOR EACH STATEMENT EXECUTE FUNCTION marcar_estadistica_prestamo();
+CREATE TRIGGER estadistica_prestamo_update AFTER UPDATE ON Prestamo
+    REFERENCING NEW TABLE AS nuevas OLD TABLE AS viejas FOR EACH STATEMENT EXECUTE FUNCTION marcar_estadistica_prestamo();
+CREATE TRIGGER estadistica_prestamo_delete AFTER DELETE ON Prestamo
+    REFERENCING OLD TABLE AS viejas FOR EACH STATEMENT EXECUTE FUNCTION marcar_estadistica_prestamo();
+
+DROP TRIGGER IF EXISTS estadistica_devolucion_insert ON Devolucion;
+DROP TRIGGER IF EXISTS estadistica_devolucion_update ON Devolucion;
+DROP TRIGGER IF EXISTS estadistica_devolucion_delete ON Devolucion;
+CREATE TRIGGER estadistica_devolucion_insert AFTER INSERT ON Devolucion
+    REFERENCING NEW TABLE AS nuevas FOR EACH STATEMENT EXECUTE FUNCTION marcar_estadistica_devolucion();
+CREATE TRIGGER estadistica_devolucion_update AFTER UPDATE ON Devolucion
+    REFERENCING NEW TABLE AS nuevas OLD TABLE AS viejas FOR EACH STATEMENT EXECUTE FUNCTION marcar_estadistica_devolucion();
+CREATE TRIGGER estadistica_devolucion_delete AFTER DELETE ON Devolucion
+    REFERENCING OLD TABLE AS viejas FOR EACH STATEMENT EXECUTE FUNCTION marcar_estadistica_devolucion();
+
+-- Carga inicial con el historial existente
+INSERT INTO Estadistica_Pendiente (ID_Recurso, Fecha)
+SELECT DISTINCT ID_Recurso, Fecha_Reserva FROM Reserva
+ON CONFLICT DO NOTHING;
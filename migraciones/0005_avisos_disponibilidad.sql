@@ -0,0 +1,72 @@
+-- Avisos de cambios de disponibilidad por NOTIFY en el canal 'disponibilidad'.
+-- Cada worker los escucha (avisos.py) y los reenvía a sus suscriptores SSE.
+-- NOTIFY se entrega al confirmar la transacción y PostgreSQL descarta los avisos
+-- repetidos dentro de una misma transacción: un aviso por (recurso, día) cambiado.
+CREATE OR REPLACE FUNCTION avisar_disponibilidad_reserva() RETURNS trigger AS $$
+BEGIN
+    IF TG_OP IN ('INSERT', 'UPDATE') THEN
+        PERFORM pg_notify('disponibilidad', json_build_object(
+            'origen', 'reserva', 'id_recurso', ID_Recurso, 'fecha', Fecha_Reserva)::text)
+        FROM (SELECT DISTINCT ID_Recurso, Fecha_Reserva FROM nuevas) cambios;
+    END IF;
+    IF TG_OP IN ('UPDATE', 'DELETE') THEN
+        PERFORM pg_notify('disponibilidad', json_build_object(
+            'origen', 'reserva', 'id_recurso', ID_Recurso, 'fecha', Fecha_Reserva)::text)
+        FROM (SELECT DISTINCT ID_Recurso, Fecha_Reserva FROM viejas) cambios;
+    END IF;
+    RETURN NULL;
+END;
+$$ LANGUAGE plpgsql;
+
+CREATE OR REPLACE FUNCTION avisar_disponibilidad_prestamo() RETURNS trigger AS $$
+BEGIN
+    PERFORM pg_notify('disponibilidad', json_build_object(
+        'origen', 'prestamo', 'id_recurso', r.ID_Recurso, 'fecha', r.Fecha_Reserva)::text)
+    FROM (SELECT DISTINCT r.ID_Recurso, r.Fecha_Reserva FROM nuevas n JOIN Reserva r ON r.ID_Reserva = n.ID_Reserva) r;
+    RETURN NULL;
+END;
+$$ LANGUAGE plpgsql;
+
+CREATE OR REPLACE FUNCTION avisar_disponibilidad_devolucion() RETURNS trigger AS $$
+BEGIN
+    PERFORM pg_notify('disponibilidad', json_build_object(
+        'origen', 'devolucion', 'id_recurso', r.ID_Recurso, 'fecha', r.Fecha_Reserva)::text)
+    FROM (
+        SELECT DISTINCT r.ID_Recurso, r.Fecha_Reserva
+        FROM nuevas n JOIN Prestamo p ON p.ID_Prestamo = n.ID_Prestamo JOIN Reserva r ON r.ID_Reserva = p.ID_Reserva
+    ) r;
+    RETURN NULL;
+END;
+$$ LANGUAGE plpgsql;
+
+-- Cambios del recurso en sí (estado, horario): afectan todos sus días
+CREATE OR REPLACE FUNCTION avisar_disponibilidad_recurso() RETURNS trigger AS $$
+BEGIN
+    PERFORM pg_notify('disponibilidad', json_build_object(
+        'origen', 'recurso', 'id_recurso', ID_Recurso, 'fecha', NULL)::text)
+    FROM (SELECT DISTINCT ID_Recurso FROM nuevas) cambios;
+    RETURN NULL;
+END;
+$$ LANGUAGE plpgsql;
+
+DROP TRIGGER IF EXISTS disponibilidad_reserva_insert ON Reserva;
+DROP TRIGGER IF EXISTS disponibilidad_reserva_update ON Reserva;
+DROP TRIGGER IF EXISTS disponibilidad_reserva_delete ON Reserva;
+CREATE TRIGGER disponibilidad_reserva_insert AFTER INSERT ON Reserva
+    REFERENCING NEW TABLE AS nuevas FOR EACH STATEMENT EXECUTE FUNCTION avisar_disponibilidad_reserva();
+CREATE TRIGGER disponibilidad_reserva_update AFTER UPDATE ON Reserva
+    REFERENCING NEW TABLE AS nuevas OLD TABLE AS viejas FOR EACH STATEMENT EXECUTE FUNCTION avisar_disponibilidad_reserva();
+CREATE TRIGGER disponibilidad_reserva_delete AFTER DELETE ON Reserva
+    REFERENCING OLD TABLE AS viejas FOR EACH STATEMENT EXECUTE FUNCTION avisar_disponibilidad_reserva();
+
+DROP TRIGGER IF EXISTS disponibilidad_prestamo_insert ON Prestamo;
+CREATE TRIGGER disponibilidad_prestamo_insert AFTER INSERT ON Prestamo
+    REFERENCING NEW TABLE AS nuevas FOR EACH STATEMENT EXECUTE FUNCTION avisar_disponibilidad_prestamo();
+
+DROP TRIGGER IF EXISTS disponibilidad_devolucion_insert ON Devolucion;
+CREATE TRIGGER disponibilidad_devolucion_insert AFTER INSERT ON Devolucion
+    REFERENCING NEW TABLE AS nuevas FOR EACH STATEMENT EXECUTE FUNCTION avisar_disponibilidad_devolucion();
+
+DROP TRIGGER IF EXISTS disponibilidad_recurso_update ON Recurso;
+CREATE TRIGGER disponibilidad_recurso_update AFTER UPDATE ON Recurso
+    REFERENCING NEW TABLE AS nuevas FOR EACH STATEMENT EXECUTE FUNCTION avisar_disponibilidad_recurso();
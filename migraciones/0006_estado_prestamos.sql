@@ -0,0 +1,19 @@
+-- Préstamos y devoluciones actualizan el estado de la reserva y del recurso
+-- (ConexionBD.registrarPrestamo / registrarDevoluciones):
+--   Reserva: Vigente -> Prestada al prestar, Prestada -> Finalizada al devolver.
+--   Recurso: Disponible -> Prestado mientras tenga un préstamo abierto.
+-- Se llevan a ese esquema los préstamos abiertos registrados antes.
+UPDATE Reserva r SET Estado = 'Prestada'
+WHERE r.Estado = 'Vigente'
+  AND EXISTS (
+      SELECT 1 FROM Prestamo p
+      WHERE p.ID_Reserva = r.ID_Reserva
+        AND NOT EXISTS (SELECT 1 FROM Devolucion d WHERE d.ID_Prestamo = p.ID_Prestamo)
+  );
+
+UPDATE Recurso rec SET Estado = 'Prestado'
+WHERE rec.Estado = 'Disponible'
+  AND EXISTS (SELECT 1 FROM Reserva r WHERE r.ID_Recurso = rec.ID_Recurso AND r.Estado = 'Prestada');
+
+-- Búsqueda de otros préstamos abiertos del recurso al devolver
+CREATE INDEX IF NOT EXISTS reserva_prestadas ON Reserva (ID_Recurso) WHERE Estado = 'Prestada';
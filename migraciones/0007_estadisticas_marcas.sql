@@ -0,0 +1,64 @@
+-- Con ON CONFLICT DO NOTHING, una transacción que encontraba ya marcado su
+-- (recurso, día) no tomaba ningún bloqueo sobre la marca: el refresco podía
+-- leer el día sin sus cambios (aún sin confirmar) y borrar la marca, y ese día
+-- quedaba desactualizado. Ahora la marca existente se actualiza: la transacción
+-- la mantiene bloqueada hasta confirmar, el refresco la salta (SKIP LOCKED) y la
+-- recalcula en una pasada siguiente. Si el refresco la tomó primero, el trigger
+-- espera a que la borre y vuelve a insertarla.
+-- Cambios cuenta las modificaciones; el refresco solo borra la versión que leyó.
+ALTER TABLE Estadistica_Pendiente ADD COLUMN IF NOT EXISTS Cambios BIGINT NOT NULL DEFAULT 1;
+
+-- Las marcas se insertan ordenadas para que dos transacciones no se bloqueen en orden inverso
+CREATE OR REPLACE FUNCTION marcar_estadistica_reserva() RETURNS trigger AS $$
+BEGIN
+    IF TG_OP IN ('INSERT', 'UPDATE') THEN
+        INSERT INTO Estadistica_Pendiente AS ep (ID_Recurso, Fecha)
+        SELECT DISTINCT ID_Recurso, Fecha_Reserva FROM nuevas ORDER BY 1, 2
+        ON CONFLICT (ID_Recurso, Fecha) DO UPDATE SET Cambios = ep.Cambios + 1;
+    END IF;
+    IF TG_OP IN ('UPDATE', 'DELETE') THEN
+        INSERT INTO Estadistica_Pendiente AS ep (ID_Recurso, Fecha)
+        SELECT DISTINCT ID_Recurso, Fecha_Reserva FROM viejas ORDER BY 1, 2
+        ON CONFLICT (ID_Recurso, Fecha) DO UPDATE SET Cambios = ep.Cambios + 1;
+    END IF;
+    RETURN NULL;
+END;
+$$ LANGUAGE plpgsql;
+
+CREATE OR REPLACE FUNCTION marcar_estadistica_prestamo() RETURNS trigger AS $$
+BEGIN
+    IF TG_OP IN ('INSERT', 'UPDATE') THEN
+        INSERT INTO Estadistica_Pendiente AS ep (ID_Recurso, Fecha)
+        SELECT DISTINCT r.ID_Recurso, r.Fecha_Reserva FROM nuevas n JOIN Reserva r ON r.ID_Reserva = n.ID_Reserva
+        ORDER BY 1, 2
+        ON CONFLICT (ID_Recurso, Fecha) DO UPDATE SET Cambios = ep.Cambios + 1;
+    END IF;
+    IF TG_OP IN ('UPDATE', 'DELETE') THEN
+        INSERT INTO Estadistica_Pendiente AS ep (ID_Recurso, Fecha)
+        SELECT DISTINCT r.ID_Recurso, r.Fecha_Reserva FROM viejas v JOIN Reserva r ON r.ID_Reserva = v.ID_Reserva
+        ORDER BY 1, 2
+        ON CONFLICT (ID_Recurso, Fecha) DO UPDATE SET Cambios = ep.Cambios + 1;
+    END IF;
+    RETURN NULL;
+END;
+$$ LANGUAGE plpgsql;
+
+CREATE OR REPLACE FUNCTION marcar_estadistica_devolucion() RETURNS trigger AS $$
+BEGIN
+    IF TG_OP IN ('INSERT', 'UPDATE') THEN
+        INSERT INTO Estadistica_Pendiente AS ep (ID_Recurso, Fecha)
+        SELECT DISTINCT r.ID_Recurso, r.Fecha_Reserva
+        FROM nuevas n JOIN Prestamo p ON p.ID_Prestamo = n.ID_Prestamo JOIN Reserva r ON r.ID_Reserva = p.ID_Reserva
+        ORDER BY 1, 2
+        ON CONFLICT (ID_Recurso, Fecha) DO UPDATE SET Cambios = ep.Cambios + 1;
+    END IF;
+    IF TG_OP IN ('UPDATE', 'DELETE') THEN
+        INSERT INTO Estadistica_Pendiente AS ep (ID_Recurso, Fecha)
+        SELECT DISTINCT r.ID_Recurso, r.Fecha_Reserva
+        FROM viejas v JOIN Prestamo p ON p.ID_Prestamo = v.ID_Prestamo JOIN Reserva r ON r.ID_Reserva = p.ID_Reserva
+        ORDER BY 1, 2
+        ON CONFLICT (ID_Recurso, Fecha) DO UPDATE SET Cambios = ep.Cambios + 1;
+    END IF;
+    RETURN NULL;
+END;
+$$ LANGUAGE plpgsql;
@@ -0,0 +1,9 @@
+-- Las devoluciones pasan la reserva a Finalizada (ConexionBD.registrarDevoluciones),
+-- así el barrido ya no revisa reservas Vigente con préstamo devuelto. Se cierran
+-- las que quedaron así antes de la migración 0006.
+UPDATE Reserva r SET Estado = 'Finalizada'
+WHERE r.Estado = 'Vigente'
+  AND EXISTS (
+      SELECT 1 FROM Prestamo p JOIN Devolucion d ON d.ID_Prestamo = p.ID_Prestamo
+      WHERE p.ID_Reserva = r.ID_Reserva
+  );
@@ -0,0 +1,130 @@
+"""
+Aplica las migraciones versionadas de la carpeta `migraciones/`.
+
+Cada archivo `NNNN_descripcion.sql` se aplica una sola vez, en orden, dentro de
+su propia transacción, y queda registrado en la tabla `schema_migraciones`.
+El esquema base es `integraservicios.sql`.
+
+Uso:
+    python migrar.py            # aplica las migraciones pendientes
+    python migrar.py --estado   # muestra qué migraciones están aplicadas
+"""
+import argparse
+import os
+import re
+import sys
+
+import psycopg2
+
+from BD import ConexionBD
+
+
+CARPETA = os.path.join(os.path.dirname(os.path.abspath(__file__)), "migraciones")
+PATRON_ARCHIVO = re.compile(r"^(\d{4})_(\w+)\.sql$")
+LLAVE_BLOQUEO = 7301  # pg_advisory_lock: evita que dos procesos migren a la vez
+
+
+def listarMigraciones(carpeta=CARPETA):
+    """
+    Retorna [(version, nombre, ruta)] ordenado por versión.
+    """
+    migraciones = []
+    for archivo in os.listdir(carpeta):
+        match = PATRON_ARCHIVO.match(archivo)
+        if match:
+            migraciones.append((int(match.group(1)), match.group(2), os.path.join(carpeta, archivo)))
+    migraciones.sort()
+    versiones = [m[0] for m in migraciones]
+    if len(versiones) != len(set(versiones)):
+        raise ValueError("Hay migraciones con la misma versión.")
+    return migraciones
+
+
+def conectar(dsn=None):
+    if dsn:
+        return psycopg2.connect(dsn)
+    return psycopg2.connect(
+        user=ConexionBD.user,
+        password=ConexionBD.password,
+        host=ConexionBD.host,
+        port=ConexionBD.port,
+        dbname=ConexionBD.dbname
+    )
+
+
+def versionesAplicadas(cursor):
+    cursor.execute("""
+    CREATE TABLE IF NOT EXISTS schema_migraciones (
+        version INT PRIMARY KEY,
+        nombre VARCHAR(200) NOT NULL,
+        aplicada_en TIMESTAMPTZ NOT NULL DEFAULT now()
+    )
+    """)
+    cursor.execute("SELECT version FROM schema_migraciones")
+    return {fila[0] for fila in cursor.fetchall()}
+
+
+def migrar(conexion, carpeta=CARPETA, salida=print):
+    """
+    Aplica las migraciones pendientes. Retorna la lista de versiones aplicadas.
+    """
+    aplicadas_ahora = []
+    cursor = conexion.cursor()
+    cursor.execute("SELECT pg_advisory_lock(%s)", (LLAVE_BLOQUEO,))
+    conexion.commit()
+    try:
+        aplicadas = versionesAplicadas(cursor)
+        conexion.commit()
+        for version, nombre, ruta in listarMigraciones(carpeta):
+            if version in aplicadas:
+                continue
+            with open(ruta, encoding="utf-8") as archivo:
+                sql = archivo.read()
+            try:
+                cursor.execute(sql)
+                cursor.execute(
+                    "INSERT INTO schema_migraciones (version, nombre) VALUES (%s, %s)",
+                    (version, nombre)
+                )
+                conexion.commit()
+            except Exception:
+                conexion.rollback()
+                salida(f"Error aplicando la migración {version:04d}_{nombre}")
+                raise
+            salida(f"Aplicada {version:04d}_{nombre}")
+            for aviso in conexion.notices:
+                salida(f"  {aviso.strip()}")
+            del conexion.notices[:]
+            aplicadas_ahora.append(version)
+    finally:
+        cursor.execute("SELECT pg_advisory_unlock(%s)", (LLAVE_BLOQUEO,))
+        conexion.commit()
+    return aplicadas_ahora
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--dsn", help="Cadena de conexión; por defecto la de ConexionBD")
+    parser.add_argument("--estado", action="store_true", help="Solo muestra el estado de las migraciones")
+    args = parser.parse_args()
+
+    conexion = conectar(args.dsn)
+    try:
+        if args.estado:
+            cursor = conexion.cursor()
+            aplicadas = versionesAplicadas(cursor)
+            conexion.commit()
+            for version, nombre, _ in listarMigraciones():
+                marca = "x" if version in aplicadas else " "
+                print(f"[{marca}] {version:04d}_{nombre}")
+            return
+        if not migrar(conexion):
+            print("No hay migraciones pendientes.")
+    except Exception as e:
+        sys.exit(f"Error: {e}")
+    finally:
+        conexion.close()
+
+
+if __name__ == "__main__":
+    main()
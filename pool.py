@@ -0,0 +1,222 @@
+import threading
+import time
+from collections import deque
+
+import psycopg2
+import psycopg2.extensions
+
+
+class ConexionPool(psycopg2.extensions.connection):
+    """
+    Conexión de psycopg2 que recuerda cuándo fue creada, cuándo se usó por última
+    vez, qué sentencias tiene preparadas en el servidor y a qué pool pertenece.
+    """
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.creada_en = time.monotonic()
+        self.usada_en = self.creada_en
+        self.preparadas = set()
+        self.origen = None
+
+
+class PoolAgotado(Exception):
+    """
+    Se lanza cuando no se obtiene una conexión del pool dentro del tiempo de espera.
+    """
+
+
+class PoolConexiones:
+    """
+    Pool de conexiones acotado y seguro entre hilos.
+
+    Mantiene entre `minimo` y `maximo` conexiones abiertas. Al prestar una conexión
+    se descartan las que superan `vida_maxima` segundos o que llevan más de
+    `verificar_tras` segundos inactivas y no responden a un `SELECT 1`.
+    """
+
+    def __init__(self, parametros, minimo=1, maximo=10, espera_maxima=10.0,
+                 vida_maxima=1800.0, verificar_tras=30.0, observar_espera=None):
+        if minimo < 0 or maximo < 1 or minimo > maximo:
+            raise ValueError("Tamaños de pool inválidos.")
+        self.parametros = parametros
+        self.minimo = minimo
+        self.maximo = maximo
+        self.espera_maxima = espera_maxima
+        self.vida_maxima = vida_maxima
+        self.verificar_tras = verificar_tras
+        self.observar_espera = observar_espera  # Recibe los segundos de espera de cada préstamo
+
+        self._libres = deque()
+        self._total = 0
+        self._en_uso = 0
+        self._esperando = 0
+        self._condicion = threading.Condition()
+
+        # Métricas acumuladas
+        self._prestamos = 0
+        self._tiempo_espera_total = 0.0
+        self._tiempo_espera_max = 0.0
+        self._recicladas = 0
+        self._fallidas = 0
+
+    def _crear(self):
+        conexion = psycopg2.connect(connection_factory=ConexionPool, **self.parametros)
+        conexion.origen = self
+        return conexion
+
+    def _cerrar(self, conexion):
+        try:
+            conexion.close()
+        except Exception:
+            pass
+
+    def _vencida(self, conexion, ahora):
+        return conexion.closed or ahora - conexion.creada_en > self.vida_maxima
+
+    def _sana(self, conexion, ahora):
+        """
+        Comprueba con un `SELECT 1` las conexiones que llevan tiempo inactivas.
+        """
+        if ahora - conexion.usada_en < self.verificar_tras:
+            return True
+        try:
+            with conexion.cursor() as cursor:
+                cursor.execute("SELECT 1")
+            conexion.rollback()
+            return True
+        except Exception:
+            return False
+
+    def llenar(self):
+        """
+        Abre conexiones hasta alcanzar el mínimo configurado.
+        """
+        while True:
+            with self._condicion:
+                if self._total >= self.minimo:
+                    return
+                self._total += 1
+            try:
+                conexion = self._crear()
+            except Exception:
+                with self._condicion:
+                    self._total -= 1
+                    self._condicion.notify()
+                raise
+            with self._condicion:
+                self._libres.append(conexion)
+                self._condicion.notify()
+
+    def obtener(self):
+        """
+        Presta una conexión sana del pool, creando una nueva si hay cupo.
+        Bloquea hasta `espera_maxima` segundos cuando el pool está lleno.
+        """
+        inicio = time.monotonic()
+        limite = inicio + self.espera_maxima
+
+        while True:
+            conexion = None
+            crear = False
+            with self._condicion:
+                while not self._libres and self._total >= self.maximo:
+                    restante = limite - time.monotonic()
+                    if restante <= 0:
+                        raise PoolAgotado("No hay conexiones disponibles en el pool.")
+                    self._esperando += 1
+                    try:
+                        self._condicion.wait(restante)
+                    finally:
+                        self._esperando -= 1
+                if self._libres:
+                    conexion = self._libres.pop()
+                else:
+                    self._total += 1
+                    crear = True
+                self._en_uso += 1
+
+            ahora = time.monotonic()
+            if crear:
+                try:
+                    conexion = self._crear()
+                except Exception:
+                    self._descartar(None)
+                    raise
+            elif self._vencida(conexion, ahora) or not self._sana(conexion, ahora):
+                self._descartar(conexion)
+                with self._condicion:
+                    self._recicladas += 1
+                continue
+
+            espera = time.monotonic() - inicio
+            with self._condicion:
+                self._prestamos += 1
+                self._tiempo_espera_total += espera
+                self._tiempo_espera_max = max(self._tiempo_espera_max, espera)
+            if self.observar_espera:
+                self.observar_espera(espera)
+            return conexion
+
+    def _descartar(self, conexion):
+        if conexion is not None:
+            self._cerrar(conexion)
+        with self._condicion:
+            self._total -= 1
+            self._en_uso -= 1
+            self._fallidas += conexion is None
+            self._condicion.notify()
+
+    def devolver(self, conexion):
+        """
+        Devuelve una conexión al pool descartando cualquier transacción pendiente.
+        """
+        if conexion is None:
+            return
+        sana = not conexion.closed
+        if sana:
+            try:
+                if conexion.autocommit:
+                    conexion.autocommit = False
+                if conexion.get_transaction_status() != psycopg2.extensions.TRANSACTION_STATUS_IDLE:
+                    conexion.rollback()
+            except Exception:
+                sana = False
+        if not sana or self._vencida(conexion, time.monotonic()):
+            self._descartar(conexion)
+            return
+        conexion.usada_en = time.monotonic()
+        with self._condicion:
+            self._en_uso -= 1
+            self._libres.append(conexion)
+            self._condicion.notify()
+
+    def cerrar(self):
+        """
+        Cierra todas las conexiones libres del pool.
+        """
+        with self._condicion:
+            libres = list(self._libres)
+            self._libres.clear()
+            self._total -= len(libres)
+        for conexion in libres:
+            self._cerrar(conexion)
+
+    def metricas(self):
+        """
+        Retorna el estado actual del pool y la latencia de préstamo acumulada.
+        """
+        with self._condicion:
+            return {
+                "total": self._total,
+                "libres": len(self._libres),
+                "en_uso": self._en_uso,
+                "esperando": self._esperando,
+                "minimo": self.minimo,
+                "maximo": self.maximo,
+                "prestamos": self._prestamos,
+                "espera_promedio_ms": (self._tiempo_espera_total / self._prestamos * 1000) if self._prestamos else 0.0,
+                "espera_maxima_ms": self._tiempo_espera_max * 1000,
+                "recicladas": self._recicladas,
+                "fallidas": self._fallidas,
+            }